@@ -1,8 +1,23 @@
 from __future__ import annotations
 
+import argparse
+import threading
+import traceback
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+import numpy as np
 import pygame as pg
 
+import metrics
+from book import load_default_book
+from endgame import load_default_endgame
 from game import Game
+from solver import NegamaxStrategy
+
+# Event posted by the AI thread when its move is ready, it wakes up the main loop when it is idle
+AI_DONE = pg.event.custom_type()
 
 
 class App:
@@ -12,11 +27,21 @@ class App:
     def __init__(self):
         """Initialize the app with:
         - colors: a bunch of different colors to be used in the game
+        - book: opening book used by the AI (None if no book was generated)
+        - endgame: cache of the exact results of the late positions used by the AI (None if it was not created)
         - game: Game object
+        - ai: strategy used by the AI to pick its moves, searches in a background thread
+              for at most ai_time seconds and stops early when ai_stop is set
+              (it also searches the late positions missing from the endgame cache, so they are not solved first)
+        - ai_future: the pending move of the AI (None if the AI is not thinking)
         - turn: int to determine who's turn it is
                 0 is nobody is playing (game is over)
                 1 is player 1
                 2 is player 2 (AI)
+        - max_fps: the maximum number of frames per second (0 for no limit)
+        - idle_timeout: when nothing can change until the next event (waiting for the player, for the AI or after
+                        the end of the game), the main loop sleeps until an event arrives or for at most
+                        idle_timeout milliseconds instead of drawing frames (None to always draw frames)
         - testing: bool to determine if app is being tested
         """
         self.bg_col = (246, 246, 246)
@@ -26,17 +51,29 @@ class App:
         self.black = (0, 0, 0)
         self.gray = (163, 163, 163)
 
-        self.game = Game()
+        self.book = load_default_book()
+        self.endgame = load_default_endgame()
+        self.game = Game(book=self.book, endgame=self.endgame)
+        self.ai_time = 1.0
+        self.ai_stop = threading.Event()
+        self.ai = NegamaxStrategy(time_budget=self.ai_time, stop=self.ai_stop)
+        self.ai_executor: ThreadPoolExecutor | None = None
+        self.ai_future: Future | None = None
 
         self.turn = 1
 
+        self.max_fps = 60
+        self.idle_timeout: int | None = 1000
         self.testing = False
+        self.text_cache: dict[tuple[str, tuple], pg.Surface] = {}
+        self.request_redraw()
 
     def start_pg(self):
         """
         Helper function to intialize and start pygame
 
         Display is created with given margins and dimensions
+        The grid is rendered once on a cached surface
         running is set to True to start the game
         """
         pg.init()
@@ -58,6 +95,10 @@ class App:
 
         self.winnerFont = pg.font.SysFont('Arial', 40)
 
+        self.grid_surface = pg.Surface(self.res)
+        self.render_grid()
+        self.request_redraw()
+
         self.clock = pg.time.Clock()
         self.running = True
 
@@ -67,8 +108,12 @@ class App:
         """
         Helper function to stop pygame
 
-        Quit pygame and close the window
+        Stop the AI, quit pygame and close the window
         """
+        self.cancel_ai()
+        if self.ai_executor is not None:
+            self.ai_executor.shutdown()
+            self.ai_executor = None
         pg.quit()
 
     def run_app(self):
@@ -80,31 +125,117 @@ class App:
 
     def main_app(self):
         """The main loop of the app, calls different functions depending on what needs to be done.
+        Only the parts of the screen that changed are drawn and updated, at most max_fps times per second.
+        When the app is idle it waits for the next event instead of drawing frames.
         """
         while self.running:
 
-            pg.event.pump()
+            self.update_frame()
 
-            self.screen.fill(self.bg_col)
+            if self.is_idle():
+                self.wait_event()
+            else:
+                self.clock.tick(self.max_fps)
+
+            if self.testing:
+                return
+
+    @metrics.timed('app.frame')
+    def update_frame(self):
+        """Function to draw one frame and handle the events and the AI, without waiting for the next frame
+        """
+        pg.event.pump()
 
+        if self.drawn_board is None:
             self.draw_grid()
 
-            self.draw_circles()
+        self.draw_circles()
 
-            self.display_winner()
+        self.display_winner()
 
-            self.display_draw()
+        self.display_draw()
 
-            if self.turn == 2:
-                self.game.make_move()
-                self.turn = 0 if self.game.winner == 2 else 1
+        if self.turn == 2:
+            self.update_ai()
 
-            self.handle_events()
+        self.handle_events()
 
-            pg.display.update()
+        if self.dirty_rects:
+            pg.display.update(self.dirty_rects)
+            self.dirty_rects = []
 
-            if self.testing:
-                return
+    def is_idle(self) -> bool:
+        """Function to check whether nothing can change on the screen until the next event:
+        the screen shows the game and the AI is not about to start or to play its move
+
+        Returns:
+            bool: whether the app is idle (always False if idle_timeout is None)
+        """
+        if self.idle_timeout is None or self.drawn_board is None:
+            return False
+        if self.turn == 2 and (self.ai_future is None or self.ai_future.done()):
+            return False
+        return bool(np.array_equal(self.drawn_board, self.game.board))
+
+    def wait_event(self):
+        """Function to sleep until an event arrives (input, the move of the AI, closing the window)
+        or idle_timeout milliseconds pass, the event is put back in the queue for handle_events
+        """
+        event = pg.event.wait(self.idle_timeout)
+        if event.type != pg.NOEVENT:
+            pg.event.post(event)
+
+    def request_redraw(self):
+        """Function to draw the whole screen again on the next frame
+        """
+        self.drawn_board: np.ndarray | None = None
+        self.drawn_status: tuple[str, tuple] | None = None
+        self.dirty_rects: list[pg.Rect] = []
+
+    def update_ai(self):
+        """Function to play the AI's turn without blocking the frame loop
+        Starts the search in a background thread, and places the token once the search is done
+        (a random column if the search raised an error)
+        """
+        if self.ai_future is None:
+            if self.ai_executor is None:
+                self.ai_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='connect4-ai')
+            self.ai_future = self.ai_executor.submit(self.game.choose_move, self.ai, 2, self.ai_stop, False)
+            self.ai_future.add_done_callback(self.post_ai_done)
+        elif self.ai_future.done():
+            future, self.ai_future = self.ai_future, None
+            try:
+                self.game.place_token(future.result(), 2)
+            except Exception:
+                # A failing AI does not stop the app, the move falls back to the book, the cache or a random column
+                traceback.print_exc()
+                metrics.count('app.ai_error')
+                self.game.make_move(None, 2, solve=False)
+            self.turn = 0 if self.game.winner == 2 else 1
+
+    @staticmethod
+    def post_ai_done(future: Future):
+        """Function called in the AI thread when its search is done, wakes up the main loop
+        """
+        if future.cancelled():
+            return
+        try:
+            pg.event.post(pg.event.Event(AI_DONE))
+        except pg.error:
+            # pygame was stopped while the AI was thinking
+            pass
+
+    def cancel_ai(self):
+        """Function to stop the search of the AI, if it is thinking, and drop its move
+        """
+        if self.ai_future is None:
+            return
+        self.ai_stop.set()
+        self.ai_future.cancel()
+        # The search checks the stop event every few hundred positions
+        wait([self.ai_future])
+        self.ai_stop.clear()
+        self.ai_future = None
 
     def handle_events(self):
         """Handle all pygame events such as pressing keys or clicking the mouse and performs the correct action
@@ -127,32 +258,51 @@ class App:
                     elif token_loc != (-1, -1):
                         self.turn = 2
 
-    def draw_grid(self):
-        """Function to draw the gird of horizonal and vertical lines
+    def render_grid(self):
+        """Function to render the background and the gird of horizonal and vertical lines on the grid surface
         """
+        self.grid_surface.fill(self.bg_col)
         for vertical_idx in range(self.game.board.shape[1]+1):
             x_pos = self.xmargin+vertical_idx*self.sqWidth
             y_start = self.ymargin
             y_end = self.ymax-self.ymargin
-            pg.draw.line(self.screen, self.gray, (x_pos, y_start), (x_pos, y_end), width=5)
+            pg.draw.line(self.grid_surface, self.gray, (x_pos, y_start), (x_pos, y_end), width=5)
         for horizontal_idx in range(self.game.board.shape[0]+1):
             x_start = self.xmargin
             x_end = self.xmax-self.xmargin
             y_pos = self.ymargin+horizontal_idx*self.sqWidth
-            pg.draw.line(self.screen, self.gray, (x_start, y_pos), (x_end, y_pos), width=5)
+            pg.draw.line(self.grid_surface, self.gray, (x_start, y_pos), (x_end, y_pos), width=5)
+
+    def draw_grid(self):
+        """Function to draw the cached grid over the whole screen, the circles are drawn again afterwards
+        """
+        self.screen.blit(self.grid_surface, (0, 0))
+        self.dirty_rects.append(pg.Rect(0, 0, self.xmax, self.ymax))
+        self.drawn_board = np.zeros(self.game.board.shape)
+        self.drawn_status = None
 
     def draw_circles(self):
         """Function to draw the player and AI circles or the correct colors and in the correct places
+        Only the cells that changed since the last frame are drawn
         """
-        for i, row in enumerate(self.game.board):
-            for j, num in enumerate(row):
-                center = (
-                    self.xmargin+self.sqWidth*(j + 0.5),
-                    self.ymargin+self.sqWidth*(i + 0.5),
-                )
-                if num != 0:
-                    color = self.red if num == 1 else self.blue
-                    pg.draw.circle(self.screen, color, center, self.sqWidth/2 - 5)
+        board = self.game.board
+        if self.drawn_board is None or self.drawn_board.shape != board.shape:
+            self.drawn_board = np.zeros(board.shape)
+        for i, j in zip(*np.nonzero(board != self.drawn_board)):
+            cell = pg.Rect(
+                self.xmargin+self.sqWidth*j, self.ymargin+self.sqWidth*i, self.sqWidth, self.sqWidth,
+            )
+            center = (
+                self.xmargin+self.sqWidth*(j + 0.5),
+                self.ymargin+self.sqWidth*(i + 0.5),
+            )
+            self.screen.blit(self.grid_surface, cell, cell)
+            num = board[i, j]
+            if num != 0:
+                color = self.red if num == 1 else self.blue
+                pg.draw.circle(self.screen, color, center, self.sqWidth/2 - 5)
+            self.dirty_rects.append(cell)
+        self.drawn_board = board
 
     def mouse2idx(self, pos: tuple) -> tuple:
         """Function to convert the mouse position to the correct index of the board
@@ -168,31 +318,51 @@ class App:
         """Function to display the winner of the game if a player is the winner
         """
         if self.game.winner != 0:
-            winner_text = self.winnerFont.render(
-                f'Player {self.game.winner} wins!', True,
+            self.display_status(
+                f'Player {self.game.winner} wins!',
                 self.red if self.game.winner == 1 else self.blue,
             )
-            winner_rect = winner_text.get_rect()
-            winner_rect.center = self.center
-            self.screen.blit(winner_text, winner_rect)
 
     def display_draw(self):
         """Function to display the draw message if the game is a draw
         """
         if self.game.winner == 0 and self.game.check_draw():
             self.turn = 0
-            draw_text = self.winnerFont.render('Draw!', True, self.black)
-            draw_rect = draw_text.get_rect()
-            draw_rect.center = self.center
-            self.screen.blit(draw_text, draw_rect)
+            self.display_status('Draw!', self.black)
+
+    def display_status(self, text: str, color: tuple):
+        """Function to draw a message in the center of the screen, if it is not already on the screen
+        The rendered text is cached
+
+        Args:
+            text (str): The message
+            color (tuple): The color of the message
+        """
+        if self.drawn_status == (text, color):
+            return
+        if (text, color) not in self.text_cache:
+            self.text_cache[(text, color)] = self.winnerFont.render(text, True, color)
+        status_text = self.text_cache[(text, color)]
+        status_rect = status_text.get_rect()
+        status_rect.center = self.center
+        self.screen.blit(status_text, status_rect)
+        self.dirty_rects.append(status_rect)
+        self.drawn_status = (text, color)
 
     def reset_game(self):
-        """Function to reset Game object and set the turn back to player 1
+        """Function to stop the AI, reset Game object and set the turn back to player 1
         """
-        self.game = Game()
+        self.cancel_ai()
+        self.game = Game(book=self.book, endgame=self.endgame)
         self.turn = 1
+        self.request_redraw()
 
 
 if __name__ == '__main__':
-    connect4app = App()
-    connect4app.run_app()
+    parser = argparse.ArgumentParser(description='Play connect4 against the computer')
+    parser.add_argument('--profile', default=None, help='run the app under cProfile and write the statistics to this file')
+    args = parser.parse_args()
+
+    with metrics.profile(args.profile):
+        connect4app = App()
+        connect4app.run_app()
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+from typing import Iterable
+from typing import Iterator
+from typing import TextIO
+
+from cli import analyze
+from cli import parse_moves
+from solver import Solver
+
+FORMATS = ('csv', 'jsonl')
+
+# Solvers of the worker process, created on first use and kept to reuse their transposition tables
+_worker_solvers: dict[tuple[int, int, int], Solver] = {}
+
+
+def read_batches(lines: Iterable[str], batch_size: int) -> Iterator[list[tuple[int, str]]]:
+    """Function to group the move strings of a file in batches, reading the file as it goes
+    Empty lines and lines starting with # are skipped
+
+    Args:
+        lines (Iterable[str]): The lines of the file
+        batch_size (int): The maximum number of positions per batch
+
+    Yields:
+        list[tuple[int, str]]: the line numbers (from 1) and move strings of a batch
+    """
+    batch = []
+    for line_n, line in enumerate(lines, 1):
+        moves = line.strip()
+        if not moves or moves.startswith('#'):
+            continue
+        batch.append((line_n, moves))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def analyze_batch(
+    batch: list[tuple[int, str]], depth: int | None, shape: tuple[int, int, int] = (6, 7, 4),
+) -> list[dict[str, Any]]:
+    """Function run in the worker pool to score every legal column of a batch of positions
+
+    Args:
+        batch (list[tuple[int, str]]): The line numbers and move strings
+        depth (int | None): The number of moves searched after every column, None to solve the positions exactly
+        shape (tuple[int, int, int], optional): The number of rows and columns of the board and the length
+                                                of the lines. Defaults to (6, 7, 4).
+
+    Returns:
+        list[dict[str, Any]]: for every position, the line number, the move string and either the analysis of
+                              cli.analyze (player to move, best column and columns) or an error message
+    """
+    if shape not in _worker_solvers:
+        rows, cols, connect = shape
+        _worker_solvers[shape] = Solver(rows, cols, connect=connect)
+    solver = _worker_solvers[shape]
+
+    results = []
+    for line_n, moves in batch:
+        result: dict[str, Any] = {'line': line_n, 'moves': moves}
+        try:
+            game, token_id = parse_moves(moves, *shape)
+            result.update(analyze(game, token_id, depth=depth, solver=solver))
+        except ValueError as e:
+            result['error'] = str(e)
+        results.append(result)
+    return results
+
+
+def analyze_stream(
+    lines: Iterable[str], depth: int | None = 8, shape: tuple[int, int, int] = (6, 7, 4), workers: int = 1,
+    batch_size: int = 64, max_in_flight: int | None = None,
+) -> Iterator[dict[str, Any]]:
+    """Function to analyze the positions of a stream of move strings across a process pool
+    At most max_in_flight batches are read ahead of the output, so the memory does not depend on
+    the size of the input, and the results come out in the order of the input
+
+    Args:
+        lines (Iterable[str]): The move strings, one per line
+        depth (int | None, optional): The number of moves searched after every column,
+                                      None to solve the positions exactly. Defaults to 8.
+        shape (tuple[int, int, int], optional): The number of rows and columns of the board and the length
+                                                of the lines. Defaults to (6, 7, 4).
+        workers (int, optional): The number of processes, 1 analyzes in this process. Defaults to 1.
+        batch_size (int, optional): The number of positions sent to a process at once. Defaults to 64.
+        max_in_flight (int | None, optional): The maximum number of batches being analyzed or waiting
+                                              to be output. Defaults to 2 per process.
+
+    Yields:
+        dict[str, Any]: the result of every position (see analyze_batch)
+    """
+    batches = read_batches(lines, batch_size)
+    if workers == 1:
+        for batch in batches:
+            yield from analyze_batch(batch, depth, shape)
+        return
+
+    max_in_flight = max_in_flight or 2 * workers
+    with ProcessPoolExecutor(workers) as pool:
+        in_flight: deque[Future] = deque()
+        for batch in batches:
+            if len(in_flight) >= max_in_flight:
+                yield from in_flight.popleft().result()
+            in_flight.append(pool.submit(analyze_batch, batch, depth, shape))
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+class CsvWriter:
+    """Writer of results as CSV: line, moves, player, best, the score of every column (empty if it is full)
+    and the error (empty if the moves are valid)
+    """
+
+    def __init__(self, output: TextIO, cols: int = 7):
+        self.cols = cols
+        self.writer = csv.writer(output, lineterminator='\n')
+        self.writer.writerow(['line', 'moves', 'player', 'best'] + [f'score_{col_n}' for col_n in range(cols)] + ['error'])
+
+    def write(self, result: dict[str, Any]):
+        columns = result.get('columns', {})
+        scores = [columns[col_n]['score'] if col_n in columns else '' for col_n in range(self.cols)]
+        self.writer.writerow(
+            [result['line'], result['moves'], result.get('player', ''), result.get('best', '')]
+            + scores + [result.get('error', '')]
+        )
+
+
+class JsonLinesWriter:
+    """Writer of results as JSON, one object per line
+    """
+
+    def __init__(self, output: TextIO, cols: int = 7):
+        self.output = output
+
+    def write(self, result: dict[str, Any]):
+        self.output.write(json.dumps(result, separators=(',', ':')) + '\n')
+
+
+WRITERS: dict[str, type[CsvWriter] | type[JsonLinesWriter]] = {'csv': CsvWriter, 'jsonl': JsonLinesWriter}
+
+
+def main(argv: list[str] | None = None):
+    """Command line entry point, e.g. python3 batch.py positions.txt --format jsonl --workers 8 > analysis.jsonl
+    """
+    parser = argparse.ArgumentParser(description='Score every legal column of positions read as move strings')
+    parser.add_argument('input', nargs='?', default='-', help='file with one move string per line (default: stdin)')
+    parser.add_argument('--output', default='-', help='output file (default: stdout)')
+    parser.add_argument('--format', choices=FORMATS, default='csv', help='output format')
+    parser.add_argument('--depth', type=int, default=8,
+                        help='number of moves searched after every column, 0 to solve exactly')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes')
+    parser.add_argument('--batch-size', type=int, default=64, help='number of positions sent to a process at once')
+    parser.add_argument('--rows', type=int, default=6, help='number of rows of the board')
+    parser.add_argument('--cols', type=int, default=7, help='number of columns of the board')
+    parser.add_argument('--connect', type=int, default=4, help='number of tokens in a line needed to win')
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == '-' else open(args.input)
+    output: TextIO = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    try:
+        writer = WRITERS[args.format](output, args.cols)
+        n_positions = n_errors = 0
+        start = time.perf_counter()
+        for result in analyze_stream(
+            source, depth=args.depth or None, shape=(args.rows, args.cols, args.connect),
+            workers=args.workers, batch_size=args.batch_size,
+        ):
+            writer.write(result)
+            n_positions += 1
+            n_errors += 'error' in result
+        elapsed = time.perf_counter() - start
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    print(f'{n_positions} positions ({n_errors} errors) in {elapsed:.2f} s '
+          f'({n_positions / max(elapsed, 1e-9):.1f} positions/s)', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
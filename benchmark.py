@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+from typing import Any
+from typing import Callable
+
+import numpy as np
+
+from endgame import EndgameCache
+from game import Game
+from mcts import MCTSStrategy
+from nn import encode_positions
+from nn import Network
+from playouts import random_playouts
+from selfplay import play_game
+from solver import NegamaxStrategy
+from solver import position
+from solver import Solver
+from strategies import RandomStrategy
+from tools import check_conseq_nums
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_PATH = os.path.join(ROOT, 'benchmark_results.json')
+BASELINE_PATH = os.path.join(ROOT, 'benchmark_baseline.json')
+
+Measure = Callable[[Callable[[], Any]], float]
+
+# Columns of a game in the middle game, without a winner
+MIDGAME = [3, 3, 2, 4, 2, 2, 4, 3, 5, 1, 1, 0]
+# Columns of a game with 16 empty cells left, without a winner
+ENDGAME = MIDGAME + [2, 5, 5, 6, 5, 0, 4, 1, 1, 3, 6, 4, 0, 2]
+
+
+def time_call(func: Callable[[], Any], min_time: float = 0.2, repeat: int = 5) -> float:
+    """Function to measure the time of a function call
+    The number of calls per run is doubled until a run takes at least min_time / repeat seconds,
+    then the best of repeat runs is kept (the other runs were slowed down by something else)
+
+    Args:
+        func (Callable[[], Any]): The function to time
+        min_time (float, optional): The minimum total time of the measure in seconds. Defaults to 0.2.
+        repeat (int, optional): The number of runs. Defaults to 5.
+
+    Returns:
+        float: the time of one call in seconds
+    """
+    run_time = min_time / repeat
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= run_time:
+            break
+        number *= 2
+
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best / number
+
+
+def midgame(moves: list[int] = MIDGAME) -> Game:
+    """Helper function to create the game after the moves of MIDGAME
+
+    Args:
+        moves (list[int], optional): The columns played. Defaults to MIDGAME.
+
+    Returns:
+        Game: the game
+    """
+    game = Game()
+    for move_n, col_n in enumerate(moves):
+        game.place_token(col_n, move_n % 2 + 1)
+    return game
+
+
+def bench_check_conseq_nums(measure: Measure) -> float:
+    arr = np.array([1, 2, 1, 1, 2, 1, 1])
+    return measure(lambda: check_conseq_nums(arr, 4))
+
+
+def bench_place_token(measure: Measure) -> float:
+    # Fill a board column by column with a pattern without a winner, the time is per token
+    moves = [(col_n, (row_n + col_n // 2) % 2 + 1) for col_n in range(7) for row_n in range(5, -1, -1)]
+
+    def fill():
+        game = Game()
+        for col_n, token_id in moves:
+            game.place_token(col_n, token_id)
+    return measure(fill) / len(moves)
+
+
+def bench_check_win(measure: Measure) -> float:
+    game = midgame()
+    row_n = game.rows - game.heights[MIDGAME[-1]]
+    return measure(lambda: game.check_win(row_n, MIDGAME[-1]))
+
+
+def bench_trial_move(measure: Measure) -> float:
+    # Place a token and take it back, as in a search
+    game = midgame()
+
+    def trial():
+        with game.trial_move(3, 1):
+            pass
+    return measure(trial)
+
+
+def bench_random_game(measure: Measure) -> float:
+    strategies = (RandomStrategy(seed=0), RandomStrategy(seed=1))
+    return measure(lambda: play_game(strategies))
+
+
+def bench_ai_negamax(measure: Measure) -> float:
+    # A new strategy for every move, so the transposition table starts empty
+    game = midgame()
+    return measure(lambda: NegamaxStrategy(depth=6)(game, 1))
+
+
+def bench_random_playouts(measure: Measure) -> float:
+    # Games played in lockstep from the middle game, the time is per game
+    current, mask = position(midgame(), 1)
+    currents = np.full(1024, current, dtype=np.uint64)
+    masks = np.full(1024, mask, dtype=np.uint64)
+    rng = np.random.default_rng(0)
+    return measure(lambda: random_playouts(currents, masks, 6, 7, rng)) / 1024
+
+
+def bench_ai_mcts(measure: Measure) -> float:
+    game = midgame()
+    return measure(lambda: MCTSStrategy(iterations=100, seed=0)(game, 1))
+
+
+def bench_endgame_solve(measure: Measure) -> float:
+    # A new solver for every move, so the transposition table starts empty
+    game = midgame(ENDGAME)
+    return measure(lambda: Solver().best_move(*position(game, 1)))
+
+
+def bench_endgame_lookup(measure: Measure) -> float:
+    game = midgame(ENDGAME)
+    with tempfile.TemporaryDirectory() as directory:
+        with EndgameCache(os.path.join(directory, 'endgame.bin'), entries=1024) as cache:
+            cache.lookup(game, 1)
+            return measure(lambda: cache.lookup(game, 1))
+
+
+def bench_nn_batch(measure: Measure, n_positions: int) -> float:
+    # Random weights cost the same as trained ones, the time is per position
+    network = Network(seed=0)
+    game = midgame()
+    inputs = encode_positions([position(game, 1)[0]] * n_positions, [position(game, 1)[1]] * n_positions)
+    return measure(lambda: network.predict(inputs)) / n_positions
+
+
+def bench_cold_start(measure: Measure, args: list[str]) -> float:
+    # Start a new interpreter, as short-lived batch workers do
+    return measure(lambda: subprocess.run([sys.executable, *args], cwd=ROOT, check=True, capture_output=True))
+
+
+def bench_app_frame(measure: Measure, redraw: bool) -> float:
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    from app import App
+
+    app = App()
+    app.testing = True
+    app.max_fps = 0
+    app.start_pg()
+    app.game = midgame()
+
+    # update_frame is the work of one frame, main_app would also sleep until the next event when idle
+    def frame():
+        if redraw:
+            app.request_redraw()
+        app.update_frame()
+    try:
+        return measure(frame)
+    finally:
+        app.stop_pg()
+
+
+BENCHMARKS: dict[str, Callable[[Measure], float]] = {
+    'check_conseq_nums': bench_check_conseq_nums,
+    'place_token': bench_place_token,
+    'check_win': bench_check_win,
+    'trial_move': bench_trial_move,
+    'random_game': bench_random_game,
+    'ai_negamax_depth6': bench_ai_negamax,
+    'random_playouts_1024': bench_random_playouts,
+    'ai_mcts_100': bench_ai_mcts,
+    'endgame_solve': bench_endgame_solve,
+    'endgame_lookup': bench_endgame_lookup,
+    'nn_single': partial(bench_nn_batch, n_positions=1),
+    'nn_batch_4096': partial(bench_nn_batch, n_positions=4096),
+    'cli_cold_start': partial(bench_cold_start, args=['cli.py', 'bestmove', '334', '--strategy', 'random']),
+    'app_import': partial(bench_cold_start, args=['-c', 'import app']),
+    'app_frame_idle': partial(bench_app_frame, redraw=False),
+    'app_frame_redraw': partial(bench_app_frame, redraw=True),
+}
+
+
+def run_benchmarks(names: list[str] | None = None, min_time: float = 0.2, repeat: int = 5) -> dict[str, Any]:
+    """Function to run benchmarks
+
+    Args:
+        names (list[str] | None, optional): The names of the benchmarks in BENCHMARKS. Defaults to all of them.
+        min_time (float, optional): The minimum time spent on every benchmark in seconds. Defaults to 0.2.
+        repeat (int, optional): The number of runs of every benchmark. Defaults to 5.
+
+    Returns:
+        dict[str, Any]: the machine the benchmarks ran on ("meta") and the seconds per call of every benchmark ("results")
+    """
+    names = list(BENCHMARKS) if names is None else names
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError(f'Unknown benchmarks {", ".join(sorted(unknown))}, choose from {", ".join(BENCHMARKS)}')
+
+    measure = partial(time_call, min_time=min_time, repeat=repeat)
+    results = {}
+    for name in names:
+        seconds = BENCHMARKS[name](measure)
+        results[name] = {'seconds': seconds, 'per_sec': 1 / seconds if seconds else float('inf')}
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(report: dict[str, Any], baseline: dict[str, Any], threshold: float = 0.1) -> list[tuple[str, float, float]]:
+    """Function to find the benchmarks that got slower than the baseline
+
+    Args:
+        report (dict[str, Any]): The results of run_benchmarks
+        baseline (dict[str, Any]): The results of run_benchmarks to compare to
+        threshold (float, optional): The relative slowdown allowed, 0.1 allows 10% slower. Defaults to 0.1.
+
+    Returns:
+        list[tuple[str, float, float]]: the name, baseline seconds and new seconds of every regression
+    """
+    regressions = []
+    for name, result in report['results'].items():
+        if name not in baseline['results']:
+            continue
+        old = baseline['results'][name]['seconds']
+        if result['seconds'] > old * (1 + threshold):
+            regressions.append((name, old, result['seconds']))
+    return regressions
+
+
+def format_report(report: dict[str, Any], baseline: dict[str, Any] | None = None) -> str:
+    """Function to format the results for the terminal
+
+    Args:
+        report (dict[str, Any]): The results of run_benchmarks
+        baseline (dict[str, Any] | None, optional): Results to compare to. Defaults to None.
+
+    Returns:
+        str: one line per benchmark
+    """
+    lines = []
+    for name, result in report['results'].items():
+        line = f'{name:20s} {1e6 * result["seconds"]:12.2f} us {result["per_sec"]:14.1f} /s'
+        if baseline is not None and name in baseline['results']:
+            old = baseline['results'][name]['seconds']
+            line += f' {100 * (result["seconds"] / old - 1):+8.1f}%'
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Command line entry point, e.g. python3 benchmark.py --baseline benchmark_baseline.json --threshold 0.2
+    """
+    parser = argparse.ArgumentParser(description='Time the engine, AI and rendering hot paths')
+    parser.add_argument('names', nargs='*', help=f'benchmarks to run (default: all), from {", ".join(BENCHMARKS)}')
+    parser.add_argument('--output', default=OUTPUT_PATH, help='path of the JSON results')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='path of the JSON results to compare to')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results to the baseline instead')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown reported as a regression')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum time spent on every benchmark in seconds')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.names or None, min_time=args.min_time)
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    with open(args.baseline if args.save_baseline else args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(format_report(report, baseline))
+
+    if baseline is None:
+        return 0
+    regressions = compare(report, baseline, args.threshold)
+    for name, old, new in regressions:
+        print(f'{name} regressed: {1e6 * old:.2f} us -> {1e6 * new:.2f} us')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import argparse
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from game import Game
+from solver import position
+from solver import Solver
+
+# File layout: header, then the sorted position keys (uint64) and the best column of every key (uint8)
+MAGIC = b'C4BK'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBBQ')
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opening_book.bin')
+
+
+def book_positions(ply: int, rows: int = 6, cols: int = 7) -> dict[int, tuple[int, int]]:
+    """Function to list all the positions reachable in at most ply moves, without a winner
+
+    Args:
+        ply (int): The maximum number of tokens on the board
+        rows (int, optional): The number of rows of the board. Defaults to 6.
+        cols (int, optional): The number of columns of the board. Defaults to 7.
+
+    Returns:
+        dict[int, tuple[int, int]]: the solver position (current, mask) of every position key
+    """
+    solver = Solver(rows, cols)
+    positions = {0: (0, 0)}
+    frontier = [(0, 0)]
+    for _ in range(ply):
+        next_frontier = []
+        for current, mask in frontier:
+            possible = (mask + solver.bottom) & solver.board_mask
+            winning = solver.winning_cells(current, mask)
+            for column_mask in solver.column_masks:
+                move = possible & column_mask
+                if not move or move & winning:
+                    continue
+                child = (current ^ mask, mask | move)
+                key = child[0] + child[1]
+                if key not in positions:
+                    positions[key] = child
+                    next_frontier.append(child)
+        frontier = next_frontier
+    return positions
+
+
+def solve_positions(positions: list[tuple[int, int]], rows: int, cols: int, depth: int) -> list[int]:
+    """Function to find the best column of a list of positions
+
+    Args:
+        positions (list[tuple[int, int]]): The solver positions (current, mask)
+        rows (int): The number of rows of the board
+        cols (int): The number of columns of the board
+        depth (int): The search depth
+
+    Returns:
+        list[int]: the best column of every position
+    """
+    solver = Solver(rows, cols)
+    return [solver.best_move(current, mask, depth=depth)[0] for current, mask in positions]
+
+
+def generate_book(
+    path: str, ply: int = 4, depth: int = 8, rows: int = 6, cols: int = 7,
+    workers: int | None = None, chunk_size: int = 64,
+) -> int:
+    """Function to search every position up to ply moves and write the best moves to a book file
+
+    Args:
+        path (str): The path of the book file
+        ply (int, optional): The maximum number of tokens of the positions in the book. Defaults to 4.
+        depth (int, optional): The search depth used for every position. Defaults to 8.
+        rows (int, optional): The number of rows of the board. Defaults to 6.
+        cols (int, optional): The number of columns of the board. Defaults to 7.
+        workers (int | None, optional): The number of processes. Defaults to the number of CPUs.
+        chunk_size (int, optional): The number of positions sent to a process at once. Defaults to 64.
+
+    Returns:
+        int: the number of positions in the book
+    """
+    if cols * (rows + 1) > 64:
+        raise ValueError('The position keys of the book only fit boards with cols * (rows + 1) <= 64')
+
+    positions = book_positions(ply, rows, cols)
+    keys = np.array(sorted(positions), dtype='<u8')
+    ordered = [positions[int(key)] for key in keys]
+    chunks = [ordered[start:start + chunk_size] for start in range(0, len(ordered), chunk_size)]
+
+    workers = workers or os.cpu_count() or 1
+    n_chunks = len(chunks)
+    if workers == 1:
+        results = [solve_positions(chunk, rows, cols, depth) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(solve_positions, chunks, [rows] * n_chunks, [cols] * n_chunks, [depth] * n_chunks))
+    moves = np.array([col_n for chunk_moves in results for col_n in chunk_moves], dtype=np.uint8)
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, rows, cols, ply, len(keys)))
+        f.write(keys.tobytes())
+        f.write(moves.tobytes())
+    return len(keys)
+
+
+class OpeningBook:
+    """Opening book read from a book file through np.memmap, for games of connect 4
+    Only the header is read when the book is opened, lookups do a binary search on the mapped keys,
+    so only a few pages of the file are read and processes using the same file share them.
+    """
+
+    def __init__(self, path: str):
+        """Open a book file
+
+        Args:
+            path (str): The path of the book file
+        """
+        self._open(path)
+
+    def _open(self, path: str):
+        """Helper function to read the header of a book file and map its keys and moves
+
+        Args:
+            path (str): The path of the book file
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, self.rows, self.cols, self.ply, self.size = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} opening book')
+
+        self.keys: np.ndarray
+        self.moves: np.ndarray
+        if self.size:
+            self.keys = np.memmap(path, dtype='<u8', mode='r', offset=HEADER.size, shape=(self.size,))
+            self.moves = np.memmap(path, dtype=np.uint8, mode='r', offset=HEADER.size + 8 * self.size, shape=(self.size,))
+        else:
+            self.keys = np.zeros(0, dtype='<u8')
+            self.moves = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getstate__(self) -> dict:
+        # Send the path to other processes, not the content of the book
+        return {'path': self.path}
+
+    def __setstate__(self, state: dict):
+        self._open(state['path'])
+
+    def lookup(self, game: Game, token_id: int) -> int | None:
+        """Function to find the book move of a position
+
+        Args:
+            game (Game): The game to look up
+            token_id (int): The token ID of the player to move
+
+        Returns:
+            int | None: the column to play, None if the position is not in the book
+        """
+        if (game.rows, game.cols, game.connect) != (self.rows, self.cols, 4) or game.move_count > self.ply:
+            return None
+        current, mask = position(game, token_id)
+        key = current + mask
+        idx = int(np.searchsorted(self.keys, np.uint64(key)))
+        if idx == self.size or self.keys[idx] != key:
+            return None
+        return int(self.moves[idx])
+
+
+def load_default_book() -> OpeningBook | None:
+    """Function to open the book at DEFAULT_PATH if it was generated
+
+    Returns:
+        OpeningBook | None: the book, None if there is no book file
+    """
+    return OpeningBook(DEFAULT_PATH) if os.path.exists(DEFAULT_PATH) else None
+
+
+def main(argv: list[str] | None = None):
+    """Command line entry point, e.g. python3 book.py --ply 6 --depth 10
+    """
+    parser = argparse.ArgumentParser(description='Generate an opening book')
+    parser.add_argument('--output', default=DEFAULT_PATH, help='path of the book file')
+    parser.add_argument('--ply', type=int, default=4, help='maximum number of tokens of the positions in the book')
+    parser.add_argument('--depth', type=int, default=8, help='search depth used for every position')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all CPUs)')
+    args = parser.parse_args(argv)
+
+    size = generate_book(args.output, ply=args.ply, depth=args.depth, workers=args.workers)
+    print(f'Wrote {size} positions to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
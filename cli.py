@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+
+from book import load_default_book
+from endgame import distance
+from endgame import load_default_endgame
+from game import Game
+from solver import position
+from solver import Solver
+from strategies import make_strategy
+from strategies import parse_spec
+
+# The engine modules only need NumPy and never import pygame, so short-lived processes (batch workers,
+# scripts) start fast. selfplay and batch, which also load the process pool, are only imported by their command.
+
+
+def parse_moves(moves: str, rows: int = 6, cols: int = 7, connect: int = 4) -> tuple[Game, int]:
+    """Function to play a move string on a new game, player 1 starts and players alternate
+
+    Args:
+        moves (str): The columns played, from 0, as digits (e.g. 3342) or separated by commas (e.g. 3,3,10)
+        rows (int, optional): The number of rows of the board. Defaults to 6.
+        cols (int, optional): The number of columns of the board. Defaults to 7.
+        connect (int, optional): The number of tokens in a line needed to win. Defaults to 4.
+
+    Returns:
+        tuple[Game, int]: the game after the moves and the token ID of the player to move
+    """
+    moves = moves.strip()
+    columns = moves.split(',') if ',' in moves else list(moves)
+    game = Game(rows, cols, connect)
+    for move_n, column in enumerate(columns):
+        if not column.strip().isdigit() or not 0 <= int(column) < cols:
+            raise ValueError(f'Move {move_n + 1} ({column!r}) is not a column between 0 and {cols - 1}')
+        if game.over:
+            raise ValueError(f'Move {move_n + 1} is played after the end of the game')
+        row_n, _ = game.place_token(int(column), move_n % 2 + 1)
+        if row_n == -1:
+            raise ValueError(f'Move {move_n + 1} is played in column {column}, which is full')
+    return game, len(columns) % 2 + 1
+
+
+def describe(score: int, moves: int, n_cells: int, exact: bool) -> str:
+    """Helper function to describe a solver score
+
+    Args:
+        score (int): The score for the player to move
+        moves (int): The number of tokens on the board
+        n_cells (int): The number of cells of the board
+        exact (bool): Whether the search reached the end of the game, otherwise a score of 0 is undecided
+
+    Returns:
+        str: e.g. 'win in 3', 'loss in 4', 'draw' or 'unknown'
+    """
+    if score > 0:
+        return f'win in {distance(score, moves, n_cells)}'
+    if score < 0:
+        return f'loss in {distance(score, moves, n_cells)}'
+    return 'draw' if exact else 'unknown'
+
+
+def analyze(game: Game, token_id: int, depth: int | None = None, solver: Solver | None = None) -> dict:
+    """Function to score every legal column of a game with the solver
+
+    Args:
+        game (Game): The game
+        token_id (int): The token ID of the player to move
+        depth (int | None, optional): The maximum number of moves to search after every column,
+                                      None to solve the position exactly. Defaults to None.
+        solver (Solver | None, optional): Solver to reuse (and its transposition table), for the board of the game.
+                                          Defaults to a new solver.
+
+    Returns:
+        dict: the player to move, the number of moves played (n_moves), the best column and the score and description
+              of every legal column (scores are for the player to move, see Solver)
+    """
+    if game.over:
+        raise ValueError('The game is over')
+    if solver is None:
+        solver = Solver(game.rows, game.cols, connect=game.connect)
+    n_cells = game.rows * game.cols
+    columns = {}
+    scores: dict[int, int] = {}
+    for col_n in game.legal_moves():
+        with game.trial_move(col_n, token_id):
+            moves = game.move_count
+            if game.over:
+                score = (n_cells + 2 - moves) // 2 if game.winner else 0
+                exact = True
+            else:
+                # Without an evaluator the scores of the solver are integers
+                score = -int(solver.best_move(*position(game, 3 - token_id), depth=depth)[1])
+                exact = depth is None or depth >= n_cells - moves
+        scores[col_n] = score
+        columns[col_n] = {'score': score, 'result': describe(score, moves - 1, n_cells, exact)}
+    best = max(scores, key=scores.__getitem__)
+    return {'player': token_id, 'n_moves': game.move_count, 'best': best, 'columns': columns}
+
+
+def format_board(game: Game) -> str:
+    """Helper function to draw the board with text, top row first (. empty, X player 1, O player 2)
+
+    Args:
+        game (Game): The game
+
+    Returns:
+        str: the board and the column numbers
+    """
+    symbols = '.XO'
+    lines = [' '.join(symbols[token_id] for token_id in row) for row in game.board.tolist()]
+    lines.append(' '.join(str(col_n % 10) for col_n in range(game.cols)))
+    return '\n'.join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Command line entry point, e.g. python3 cli.py bestmove 3342 or python3 cli.py analyze 334 --depth 8
+    """
+    parser = argparse.ArgumentParser(description='Connect 4 engine without a display')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    bestmove = commands.add_parser('bestmove', help='print the column the AI plays after a move string')
+    bestmove.add_argument('moves', nargs='?', default='', help='columns played from 0, e.g. 3342 (default: none)')
+    bestmove.add_argument('--strategy', default='negamax:depth=8', help='strategy of the AI, e.g. mcts:iterations=200')
+    bestmove.add_argument('--seed', type=int, default=None, help='seed of the strategy')
+
+    analyze_parser = commands.add_parser('analyze', help='score every column after a move string')
+    analyze_parser.add_argument('moves', nargs='?', default='', help='columns played from 0, e.g. 3342 (default: none)')
+    analyze_parser.add_argument('--depth', type=int, default=10,
+                                help='number of moves searched after every column, 0 to solve exactly')
+    analyze_parser.add_argument('--json', action='store_true', help='print the analysis as JSON')
+
+    commands.add_parser('selfplay', help='play games between two strategies (options of selfplay.py)', add_help=False)
+    commands.add_parser('batch', help='analyze a file of move strings (options of batch.py)', add_help=False)
+
+    argv = sys.argv[1:] if argv is None else argv
+    args, extra = parser.parse_known_args(argv)
+    if args.command == 'selfplay':
+        import selfplay
+
+        selfplay.main(extra)
+        return 0
+    if args.command == 'batch':
+        import batch
+
+        batch.main(extra)
+        return 0
+    if extra:
+        parser.error(f'unrecognized arguments: {" ".join(extra)}')
+
+    try:
+        game, token_id = parse_moves(args.moves)
+    except ValueError as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 2
+
+    if game.over:
+        print('error: the game is over', file=sys.stderr)
+        return 2
+
+    if args.command == 'bestmove':
+        game.book = load_default_book()
+        game.endgame = load_default_endgame()
+        print(game.choose_move(make_strategy(*parse_spec(args.strategy), seed=args.seed), token_id))
+    else:
+        analysis = analyze(game, token_id, depth=args.depth or None)
+        if args.json:
+            print(json.dumps(analysis))
+        else:
+            print(format_board(game))
+            print(f'player {token_id} to move, best column: {analysis["best"]}')
+            for col_n, column in analysis['columns'].items():
+                print(f'{col_n:3d} {column["score"]:4d} {column["result"]}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+import argparse
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+from typing import NamedTuple
+
+import numpy as np
+
+import metrics
+from game import Game
+from solver import position
+from solver import Solver
+
+try:
+    import fcntl
+except ImportError:  # Windows: writes are not locked, only one process should write to a cache
+    fcntl = None  # type: ignore[assignment]
+
+# File layout: header, then n_buckets buckets of BUCKET_SIZE slots. A slot is two uint64 words,
+# the check word (key ^ data) then the data word (score + 128, best column and number of empty cells,
+# one byte each). An empty slot is all zeros. The file is created at its full size and never grows.
+MAGIC = b'C4EG'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBBB7xQ')  # magic, version, rows, cols, connect, max_empty, n_buckets
+BUCKET_SIZE = 4
+DEFAULT_ENTRIES = 1 << 20  # 16 MiB file
+DEFAULT_MAX_EMPTY = 16
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'endgame_cache.bin')
+
+
+class EndgameEntry(NamedTuple):
+    """Exact result of a position, from the point of view of the player to move
+    - col_n: the best column
+    - score: the score of Solver (a win with the player's n-th last token left scores n, a loss -n, 0 a draw)
+    - distance: the number of moves until the end of the game with perfect play
+    """
+    col_n: int
+    score: int
+    distance: int
+
+
+def distance(score: int, moves: int, n_cells: int) -> int:
+    """Helper function to get the number of moves until the end of a game with perfect play from a solver score
+
+    Args:
+        score (int): The exact score of the position for the player to move
+        moves (int): The number of tokens on the board
+        n_cells (int): The number of cells of the board
+
+    Returns:
+        int: the number of moves, including the winning move
+    """
+    if score > 0:
+        return 2 * ((n_cells + 1 - moves) // 2 - score) + 1
+    if score < 0:
+        return 2 * ((n_cells - moves) // 2 + score) + 2
+    return n_cells - moves
+
+
+class EndgameCache:
+    """Persistent cache of the exact results of the positions with at most max_empty empty cells
+
+    The file is mapped in memory and shared by all the processes that open it. Positions are keyed by
+    the solver key (current + mask) of the position or of its left-right mirror, whichever is smaller,
+    which is exact for boards of at most 64 bits (cols * (rows + 1)).
+
+    Size: the table has a fixed number of buckets of BUCKET_SIZE slots, chosen when the file is created.
+    Replacement policy: a position goes in the bucket given by the hash of its key. It replaces the slot
+    holding the same position, otherwise an empty slot, otherwise the slot with the fewest empty cells
+    (the cheapest result to solve again) unless it has more empty cells than the new position,
+    so the most expensive results stay in the cache.
+
+    Concurrency: reads take no lock. Every slot stores key ^ data next to data, a read only accepts a slot
+    if both words give back the key, so a slot read while another process writes it counts as a miss
+    instead of a wrong result. Writes are serialized between processes by an exclusive flock on the file.
+    """
+
+    def __init__(
+        self, path: str = DEFAULT_PATH, rows: int = 6, cols: int = 7, connect: int = 4,
+        max_empty: int = DEFAULT_MAX_EMPTY, entries: int = DEFAULT_ENTRIES, readonly: bool = False,
+    ):
+        """Open a cache file, it is created with the given size if it does not exist
+        The board shape, max_empty and the size of an existing file are read from the file
+
+        Args:
+            path (str, optional): The path of the cache file. Defaults to DEFAULT_PATH.
+            rows (int, optional): The number of rows of the board. Defaults to 6.
+            cols (int, optional): The number of columns of the board. Defaults to 7.
+            connect (int, optional): The number of tokens in a line needed to win. Defaults to 4.
+            max_empty (int, optional): The maximum number of empty cells of the cached positions.
+                                       Defaults to DEFAULT_MAX_EMPTY.
+            entries (int, optional): The number of slots of a new file. Defaults to DEFAULT_ENTRIES.
+            readonly (bool, optional): Whether to only read the file, positions missing from it are still solved
+                                       but not added. Defaults to False.
+        """
+        if cols * (rows + 1) > 64:
+            raise ValueError('The endgame cache only fits boards of at most 64 bits (cols * (rows + 1))')
+        self.path = path
+        self.readonly = readonly
+        self.hits = 0
+        self.misses = 0
+
+        fd = os.open(path, os.O_RDONLY if readonly else os.O_RDWR | os.O_CREAT, 0o644)
+        self.file = os.fdopen(fd, 'rb' if readonly else 'r+b')
+        try:
+            with self._locked():
+                if os.fstat(fd).st_size == 0 and not readonly:
+                    n_buckets = max(1, -(-entries // BUCKET_SIZE))
+                    self.file.write(HEADER.pack(MAGIC, VERSION, rows, cols, connect, max_empty, n_buckets))
+                    self.file.truncate(HEADER.size + n_buckets * BUCKET_SIZE * 16)
+                    self.file.flush()
+                self.file.seek(0)
+                data = self.file.read(HEADER.size)
+            if len(data) < HEADER.size or HEADER.unpack(data)[:2] != (MAGIC, VERSION):
+                raise ValueError(f'{path} is not a version {VERSION} endgame cache file')
+            _, _, self.rows, self.cols, self.connect, self.max_empty, n_buckets = HEADER.unpack(data)
+            self.map = mmap.mmap(fd, 0, access=mmap.ACCESS_READ if readonly else mmap.ACCESS_WRITE)
+        except BaseException:
+            self.file.close()
+            raise
+        self.table = np.frombuffer(self.map, dtype='<u8', offset=HEADER.size).reshape(n_buckets, BUCKET_SIZE, 2)
+        self.n_buckets = n_buckets
+        self.n_cells = self.rows * self.cols
+        self.solver = Solver(self.rows, self.cols, connect=self.connect)
+
+    def __enter__(self) -> EndgameCache:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        del self.table
+        self.map.close()
+        self.file.close()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Helper function to hold an exclusive lock on the file while writing (no lock for read-only caches)
+        """
+        if fcntl is None or self.readonly:
+            yield
+            return
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+    def canonical(self, current: int, mask: int) -> tuple[int, bool]:
+        """Function to get the key of a position that is the same for its left-right mirror
+
+        Args:
+            current (int): The bitboard of the player to move
+            mask (int): The bitboard of all the tokens
+
+        Returns:
+            tuple[int, bool]: the key and whether it is the key of the mirror
+        """
+        key = current + mask
+        col_bits = self.rows + 1
+        column = (1 << col_bits) - 1
+        mirror = 0
+        for col_n in range(self.cols):
+            mirror |= (key >> (col_n * col_bits) & column) << ((self.cols - 1 - col_n) * col_bits)
+        return (mirror, True) if mirror < key else (key, False)
+
+    def _bucket(self, key: int) -> int:
+        # Fibonacci hashing spreads the structured keys over the buckets
+        return (((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 16) % self.n_buckets
+
+    def get(self, current: int, mask: int) -> EndgameEntry | None:
+        """Function to look up the exact result of a position, without solving it
+
+        Args:
+            current (int): The bitboard of the player to move
+            mask (int): The bitboard of all the tokens
+
+        Returns:
+            EndgameEntry | None: the result, None if the position is not in the cache
+        """
+        key, mirrored = self.canonical(current, mask)
+        for check, data in self.table[self._bucket(key)].tolist():
+            if data and check ^ data == key:
+                col_n = data >> 8 & 0xFF
+                score = (data & 0xFF) - 128
+                moves = mask.bit_count()
+                return EndgameEntry(self.cols - 1 - col_n if mirrored else col_n, score, distance(score, moves, self.n_cells))
+        return None
+
+    def put(self, current: int, mask: int, score: int, col_n: int):
+        """Function to add the exact result of a position, following the replacement policy of the class
+
+        Args:
+            current (int): The bitboard of the player to move
+            mask (int): The bitboard of all the tokens
+            score (int): The exact score of the position
+            col_n (int): The best column
+        """
+        if self.readonly:
+            return
+        key, mirrored = self.canonical(current, mask)
+        if mirrored:
+            col_n = self.cols - 1 - col_n
+        empty = self.n_cells - mask.bit_count()
+        data = (score + 128) | col_n << 8 | empty << 16
+        bucket = self.table[self._bucket(key)]
+        with self._locked():
+            slots = bucket.tolist()
+            slot_n = next((n for n, (check, old) in enumerate(slots) if old and check ^ old == key), None)
+            if slot_n is None:
+                slot_n = next((n for n, (_, old) in enumerate(slots) if not old), None)
+            if slot_n is None:
+                slot_n = min(range(BUCKET_SIZE), key=lambda n: slots[n][1] >> 16 & 0xFF)
+                if slots[slot_n][1] >> 16 & 0xFF > empty:
+                    return
+            # Readers ignore the slot while the two words do not match
+            bucket[slot_n, 1] = data
+            bucket[slot_n, 0] = key ^ data
+
+    def lookup(
+        self, game: Game, token_id: int, stop: threading.Event | None = None,
+        nodes: int | None = None, time_budget: float | None = None, solve: bool = True,
+    ) -> EndgameEntry | None:
+        """Function to get the exact result of a game, solving it and adding it to the cache if it is missing
+
+        Args:
+            game (Game): The game
+            token_id (int): The token ID of the player to move
+            stop (threading.Event | None, optional): Event that stops the solve from another thread. Defaults to None.
+            nodes (int | None, optional): The maximum number of positions of the solve. Defaults to None.
+            time_budget (float | None, optional): The maximum time of the solve in seconds. Defaults to None.
+            solve (bool, optional): Whether a missing position is solved, otherwise only the cache is read.
+                                    Defaults to True.
+
+        Returns:
+            EndgameEntry | None: the result, None if the position has more than max_empty empty cells,
+                                 has another board shape, the game is over, is missing and solve is False
+                                 or the solve was stopped before the end (nothing is cached then)
+        """
+        if (game.rows, game.cols, game.connect) != (self.rows, self.cols, self.connect) or game.over:
+            return None
+        if self.n_cells - game.move_count > self.max_empty:
+            return None
+        current, mask = position(game, token_id)
+        entry = self.get(current, mask)
+        if entry is not None:
+            self.hits += 1
+            metrics.count('endgame.hit')
+            return entry
+        self.misses += 1
+        metrics.count('endgame.miss')
+        if not solve:
+            return None
+        self.solver.stop = stop
+        col_n, value = self.solver.best_move(current, mask, nodes=nodes, time_budget=time_budget)
+        if self.solver.aborted:
+            metrics.count('endgame.aborted')
+            return None
+        # The solver has no evaluator, so the scores are integers
+        score = int(value)
+        self.put(current, mask, score, col_n)
+        return EndgameEntry(col_n, score, distance(score, game.move_count, self.n_cells))
+
+    def __len__(self) -> int:
+        """Function to count the positions in the cache
+        """
+        return int(np.count_nonzero(self.table[:, :, 1]))
+
+
+def load_default_endgame() -> EndgameCache | None:
+    """Function to open the cache at DEFAULT_PATH if it was created (python3 endgame.py)
+
+    Returns:
+        EndgameCache | None: the cache, None if there is no cache file
+    """
+    return EndgameCache(DEFAULT_PATH) if os.path.exists(DEFAULT_PATH) else None
+
+
+def main(argv: list[str] | None = None):
+    """Command line entry point, e.g. python3 endgame.py --entries 4194304
+    """
+    parser = argparse.ArgumentParser(description='Create an endgame cache file or show how full it is')
+    parser.add_argument('--path', default=DEFAULT_PATH, help='path of the cache file')
+    parser.add_argument('--rows', type=int, default=6, help='number of rows of the board of a new file')
+    parser.add_argument('--cols', type=int, default=7, help='number of columns of the board of a new file')
+    parser.add_argument('--connect', type=int, default=4, help='length of the winning lines of a new file')
+    parser.add_argument('--max-empty', type=int, default=DEFAULT_MAX_EMPTY,
+                        help='maximum number of empty cells of the cached positions of a new file')
+    parser.add_argument('--entries', type=int, default=DEFAULT_ENTRIES, help='number of slots of a new file')
+    args = parser.parse_args(argv)
+
+    with EndgameCache(args.path, args.rows, args.cols, args.connect, args.max_empty, args.entries) as cache:
+        n_slots = cache.n_buckets * BUCKET_SIZE
+        print(f'{cache.path}: {cache.rows}x{cache.cols} board, connect {cache.connect}, '
+              f'positions with at most {cache.max_empty} empty cells')
+        print(f'{len(cache)} of {n_slots} slots used ({100 * len(cache) / n_slots:.1f}%)')
+
+
+if __name__ == '__main__':
+    main()
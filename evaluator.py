@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from tools import cell_window_ids
+from tools import line_indices
+
+if TYPE_CHECKING:
+    from game import Game
+
+
+def default_weights(connect: int) -> tuple[int, ...]:
+    """Helper function to get the default value of a line with n tokens of one player and none of the other
+    Every extra token is worth 5 times more and a complete line is worth more than any unfinished line
+
+    Args:
+        connect (int): The number of tokens in a line needed to win
+
+    Returns:
+        tuple[int, ...]: the value of a line with 0, 1, ..., connect tokens
+    """
+    return (0,) + tuple(5 ** (n - 1) for n in range(1, connect)) + (5 ** (connect + 2),)
+
+
+class Evaluator:
+    """Heuristic evaluation of a position from the lines of connect cells (windows) of the board
+
+    A window holding tokens of only one player is worth weights[n] to that player, n being its number of tokens,
+    a window holding tokens of both players is worth nothing. The number of tokens of both players in every
+    window and the score (the sum of the values of the windows for player 1) are updated with every token,
+    which only looks at the windows through the cell, so the cost does not depend on the board size.
+    remove undoes place, so searches can add and take back tokens.
+    """
+
+    def __init__(self, rows: int = 6, cols: int = 7, connect: int = 4, weights: tuple[int, ...] | None = None):
+        """Initialize the evaluator with an empty board
+
+        Args:
+            rows (int, optional): The number of rows of the board. Defaults to 6.
+            cols (int, optional): The number of columns of the board. Defaults to 7.
+            connect (int, optional): The number of tokens in a line needed to win. Defaults to 4.
+            weights (tuple[int, ...] | None, optional): The value of a window with 0, 1, ..., connect tokens
+                                                        of one player. Defaults to default_weights(connect).
+        """
+        self.weights = default_weights(connect) if weights is None else tuple(weights)
+        if len(self.weights) != connect + 1:
+            raise ValueError(f'weights should have {connect + 1} values, one per number of tokens in a window')
+        self.rows = rows
+        self.cols = cols
+        self.connect = connect
+        self.windows = cell_window_ids(rows, cols, connect)
+        self.n_windows = len(line_indices(rows, cols, connect))
+        self.clear()
+
+    def clear(self):
+        """Empty the board
+        """
+        self.counts = [[0] * self.n_windows, [0] * self.n_windows]
+        self.score = 0
+
+    def load(self, bitboards: list[int] | tuple[int, int]):
+        """Set the board from the bitboards of both players
+
+        Args:
+            bitboards (list[int] | tuple[int, int]): The bitboards of player 1 and 2 (layout of Game)
+        """
+        self.clear()
+        for player, bitboard in enumerate(bitboards):
+            while bitboard:
+                bit = (bitboard & -bitboard).bit_length() - 1
+                self.place(bit, player)
+                bitboard &= bitboard - 1
+
+    def place(self, bit: int, player: int):
+        """Add a token and update the counts of the windows through its cell and the score
+
+        Args:
+            bit (int): The bit index of the cell (layout of Game)
+            player (int): 0 for player 1, 1 for player 2
+        """
+        weights = self.weights
+        mine = self.counts[player]
+        theirs = self.counts[1 - player]
+        delta = 0
+        for window in self.windows[bit]:
+            n_mine = mine[window]
+            n_theirs = theirs[window]
+            if not n_theirs:
+                delta += weights[n_mine + 1] - weights[n_mine]
+            elif not n_mine:
+                # The window can't be completed by the other player anymore
+                delta += weights[n_theirs]
+            mine[window] = n_mine + 1
+        self.score += -delta if player else delta
+
+    def remove(self, bit: int, player: int):
+        """Take back a token added by place
+
+        Args:
+            bit (int): The bit index of the cell (layout of Game)
+            player (int): 0 for player 1, 1 for player 2
+        """
+        weights = self.weights
+        mine = self.counts[player]
+        theirs = self.counts[1 - player]
+        delta = 0
+        for window in self.windows[bit]:
+            n_mine = mine[window] - 1
+            n_theirs = theirs[window]
+            if not n_theirs:
+                delta += weights[n_mine + 1] - weights[n_mine]
+            elif not n_mine:
+                delta += weights[n_theirs]
+            mine[window] = n_mine
+        self.score -= -delta if player else delta
+
+    def value(self, token_id: int) -> int:
+        """Function to get the score for a player
+
+        Args:
+            token_id (int): The token ID of the player
+
+        Returns:
+            int: the score, positive if the player is ahead
+        """
+        return self.score if token_id == 1 else -self.score
+
+
+class GreedyStrategy:
+    """Strategy for Game.make_move that wins if it can and otherwise plays the move with the best evaluation
+    Uses the evaluator kept up to date by the game (Game.evaluator)
+    """
+
+    def __call__(self, game: Game, token_id: int) -> int:
+        """Pick a column for the given player
+
+        Args:
+            game (Game): The game to play in
+            token_id (int): The token ID of the player to move
+
+        Returns:
+            int: the column to play
+        """
+        evaluator = game.evaluator
+        values = {}
+        for col_n in game.legal_moves():
+            bit = col_n * game.col_bits + game.heights[col_n]
+            evaluator.place(bit, token_id - 1)
+            values[col_n] = evaluator.value(token_id)
+            evaluator.remove(bit, token_id - 1)
+        return max(values, key=values.__getitem__)
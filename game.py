@@ -1,20 +1,194 @@
 from __future__ import annotations
 
+import threading
+from contextlib import contextmanager
+from typing import Callable
+from typing import Iterator
+from typing import TYPE_CHECKING
+
 import numpy as np
 
-import tools as tl
+import metrics
+from evaluator import Evaluator
+from tools import cell_windows
+from tools import zobrist_tables
+
+if TYPE_CHECKING:
+    from book import OpeningBook
+    from endgame import EndgameCache
 
 
 class Game:
     """Game class for the game 'backend'
+
+    The board is stored as one bitboard (a python int) per player plus the height of every column.
+    Each column uses rows + 1 bits, bit 0 being the bottom cell of the first column, the extra bit
+    on top of every column is always empty and stops lines from wrapping around to the next column.
+
+    The number of moves, the columns that are not full (legal, bit i is set if column i is not full),
+    whether the game is over and the history of the moves ((column, token ID) in the order they were played)
+    are kept up to date by place_token. undo_move takes the last move of the history back and restores
+    all of this state, so searches can try moves on the game without copying it (see trial_move).
+
+    A player wins with connect tokens in a line. The lines through every cell are precomputed once per
+    board shape (tools.cell_windows), so check_win only looks at the lines through the new token.
+
+    key is the 64-bit Zobrist key of the position (the XOR of a random number per token and cell) and
+    mirror_key the key of the left-right mirror of the position, both are updated with every token.
+    canonical_key is the same for a position and its mirror.
+
+    evaluator is a heuristic evaluation of the position for strategies, it is created the first time it is used
+    and then updated with every token.
     """
 
-    def __init__(self):
-        """Initialize the game with a board full of zeros and no winner
+    def __init__(
+        self, rows: int = 6, cols: int = 7, connect: int = 4, book: OpeningBook | None = None,
+        endgame: EndgameCache | None = None,
+    ):
+        """Initialize the game with an empty board and no winner
+
+        Args:
+            rows (int, optional): The number of rows of the board. Defaults to 6.
+            cols (int, optional): The number of columns of the board. Defaults to 7.
+            connect (int, optional): The number of tokens in a line needed to win. Defaults to 4.
+            book (OpeningBook | None, optional): Opening book used by make_move before the strategy. Defaults to None.
+            endgame (EndgameCache | None, optional): Cache of the exact results of the late positions used by make_move
+                                                     before the strategy. Defaults to None.
         """
 
-        self.board = np.zeros((6, 7))
+        if rows < 1 or cols < 1 or connect < 2:
+            raise ValueError('The board needs at least 1 row and 1 column and a line at least 2 tokens long')
+        self.connect = connect
+        self._set_shape(rows, cols)
+        self.book = book
+        self.endgame = endgame
+
+    def _set_shape(self, rows: int, cols: int):
+        """Helper function to set the board dimensions and empty the board
+
+        Args:
+            rows (int): The number of rows of the board
+            cols (int): The number of columns of the board
+        """
+        self.rows = rows
+        self.cols = cols
+        self.col_bits = rows + 1
+        self.bitboards = [0, 0]
+        self.heights = [0] * cols
+        self.move_count = 0
+        self.legal = (1 << cols) - 1
         self.winner = 0
+        self.over = False
+        self.history: list[tuple[int, int]] = []
+        self._winners: list[int] = []
+        self._board: np.ndarray | None = None
+        self.windows = cell_windows(rows, cols, self.connect)
+        self.zobrist, self.mirror_zobrist = zobrist_tables(rows, cols)
+        self.key = 0
+        self.mirror_key = 0
+        self._evaluator: Evaluator | None = None
+
+    @property
+    def board(self) -> np.ndarray:
+        """The board as a read-only numpy array (0 is empty, 1 and 2 are the players, row 0 is the top row)
+        The array is only built when it is requested after the board has changed.
+        """
+        if self._board is None:
+            n_bits = self.cols * self.col_bits
+            n_bytes = (n_bits + 7) // 8
+            board = np.zeros((self.cols, self.col_bits), dtype=np.int8)
+            for token_id, bitboard in enumerate(self.bitboards, 1):
+                bits = np.unpackbits(
+                    np.frombuffer(bitboard.to_bytes(n_bytes, 'little'), dtype=np.uint8),
+                    bitorder='little',
+                )[:n_bits].reshape(self.cols, self.col_bits)
+                board[bits == 1] = token_id
+            board = board[:, self.rows-1::-1].T
+            board.flags.writeable = False
+            self._board = board
+        return self._board
+
+    @board.setter
+    def board(self, board: np.ndarray):
+        """Load the bitboards and column heights from a numpy array shaped like the board property
+        The order of the moves is not known, so the history is left empty. The winner is the player
+        of a line of connect tokens on the board (the first one found if both players have one)
+
+        Args:
+            board (np.ndarray): The board to load
+        """
+        board = np.asarray(board)
+        self._set_shape(*board.shape)
+        for row_n, col_n in zip(*np.nonzero(board)):
+            self._set_cell(row_n, col_n, int(board[row_n, col_n]))
+        for col_n in range(self.cols):
+            locations = np.where(board[:, col_n] == 0)[0]
+            self.heights[col_n] = self.rows - 1 - locations[-1] if len(locations) else self.rows
+            if not len(locations):
+                self.legal &= ~(1 << col_n)
+        self.move_count = int(np.count_nonzero(board))
+        for row_n, col_n in zip(*np.nonzero(board)):
+            if self.check_win(row_n, col_n):
+                self.winner = int(board[row_n, col_n])
+                break
+        self.over = self.winner != 0 or not self.legal
+
+    def _cell_bit(self, row_n: int, col_n: int) -> int:
+        """Helper function to get the bitboard index of a cell
+
+        Args:
+            row_n (int): The row number (0 is the top row)
+            col_n (int): The column number
+
+        Returns:
+            int: the bit index of the cell
+        """
+        return int(col_n) * self.col_bits + self.rows - 1 - int(row_n)
+
+    def _set_cell(self, row_n: int, col_n: int, token_id: int):
+        """Helper function to set a cell of the board to the given token
+
+        Args:
+            row_n (int): The row number (0 is the top row)
+            col_n (int): The column number
+            token_id (int): The token ID to place
+        """
+        bit = self._cell_bit(row_n, col_n)
+        self.bitboards[token_id-1] |= 1 << bit
+        self.key ^= self.zobrist[token_id-1][bit]
+        self.mirror_key ^= self.mirror_zobrist[token_id-1][bit]
+        if self._evaluator is not None:
+            self._evaluator.place(bit, token_id-1)
+        self._board = None
+
+    def _clear_cell(self, bit: int, token_id: int):
+        """Helper function to remove a token set by _set_cell
+
+        Args:
+            bit (int): The bit index of the cell
+            token_id (int): The token ID to remove
+        """
+        self.bitboards[token_id-1] ^= 1 << bit
+        self.key ^= self.zobrist[token_id-1][bit]
+        self.mirror_key ^= self.mirror_zobrist[token_id-1][bit]
+        if self._evaluator is not None:
+            self._evaluator.remove(bit, token_id-1)
+        self._board = None
+
+    @property
+    def evaluator(self) -> Evaluator:
+        """The heuristic evaluation of the position, kept up to date by place_token once it was requested
+        """
+        if self._evaluator is None:
+            self._evaluator = Evaluator(self.rows, self.cols, self.connect)
+            self._evaluator.load(self.bitboards)
+        return self._evaluator
+
+    @property
+    def canonical_key(self) -> int:
+        """The key of the position that is the same for the position and its left-right mirror
+        """
+        return min(self.key, self.mirror_key)
 
     def get_first_free_idx(self, col_n: int) -> int:
         """Function to get the first free index of a given column
@@ -26,36 +200,87 @@ class Game:
             int: the first free index of the column (0 is the top row)
         """
 
-        locations = np.where(self.board[:, col_n] == 0)[0]
-        if len(locations) == 0:
+        height = self.heights[col_n]
+        if height == self.rows:
             return -1
-        return locations[-1]
+        return self.rows - 1 - height
 
     def place_token(self, col_n: int, token_id: int) -> tuple[int, int]:
         """Place a token in the indicated column, calls get_first_free_idx
         to get the first free index of the given column
         Calls check_win to check if the given token has won
+        Raises ValueError if the column is not on the board or the token ID is not 1 or 2
 
         Args:
             col_n (int): The column number
             token_id (int): The token ID to place
 
         Returns:
-            tuple[int, int]: The location where the token was placed
+            tuple[int, int]: The location where the token was placed, (-1, -1) if the column is full
         """
+        if not 0 <= col_n < self.cols:
+            raise ValueError(f'Column {col_n} is not between 0 and {self.cols - 1}')
+        if token_id != 1 and token_id != 2:
+            raise ValueError(f'Token ID {token_id} is not 1 or 2')
         idx = self.get_first_free_idx(col_n)
         if idx != -1:
-            self.board[idx, col_n] = token_id
+            self._set_cell(idx, col_n, token_id)
+            self.heights[col_n] = self.rows - idx
+            self.move_count += 1
+            self.history.append((col_n, token_id))
+            self._winners.append(self.winner)
+            if idx == 0:
+                self.legal &= ~(1 << col_n)
             if self.check_win(idx, col_n):
                 self.winner = token_id
+            self.over = self.winner != 0 or not self.legal
             return idx, col_n
 
         return -1, -1
 
+    def undo_move(self) -> tuple[int, int]:
+        """Take back the last move of the history, the game is then exactly as it was before the move
+
+        Returns:
+            tuple[int, int]: The location of the removed token
+        """
+        if not self.history:
+            raise ValueError('There is no move to undo')
+        col_n, token_id = self.history.pop()
+        self.winner = self._winners.pop()
+        height = self.heights[col_n] - 1
+        self._clear_cell(int(col_n) * self.col_bits + height, token_id)
+        self.heights[col_n] = height
+        self.move_count -= 1
+        self.legal |= 1 << col_n
+        self.over = self.winner != 0
+        return self.rows - 1 - height, col_n
+
+    @contextmanager
+    def trial_move(self, col_n: int, token_id: int) -> Iterator[tuple[int, int]]:
+        """Context manager that places a token and takes it back at the end of the block, e.g.
+        with game.trial_move(3, 1):
+            score = evaluate(game)
+
+        Args:
+            col_n (int): The column number
+            token_id (int): The token ID to place
+
+        Yields:
+            tuple[int, int]: The location where the token was placed ((-1, -1) if the column is full)
+        """
+        location = self.place_token(col_n, token_id)
+        try:
+            yield location
+        finally:
+            if location[0] != -1:
+                self.undo_move()
+
+    @metrics.timed('game.check_win')
     def check_win(self, row_n: int, col_n: int) -> bool:
         """Check if the token has won
-        Uses the tools.check_conseq_nums function to check if there are 4 consequtive numbers in the row,
-        column or either diagonal
+        Looks for connect consequtive tokens of the same player through the given cell in the row,
+        column or either diagonal using the precomputed masks of the lines through the cell
 
         Args:
             row_n (int): The row number of the token to check
@@ -65,31 +290,17 @@ class Game:
             bool: Whether or not the given token has won
         """
 
-        if self.board[row_n, col_n] == 0:
+        bit = self._cell_bit(row_n, col_n)
+        for bitboard in self.bitboards:
+            if bitboard >> bit & 1:
+                break
+        else:
             return False
 
-        conseq_n = 3
-        row_n_min = max(row_n-conseq_n, 0)
-        row_n_max = min(row_n+conseq_n+1, self.board.shape[0])
-        col_n_min = max(col_n-conseq_n, 0)
-        col_n_max = min(col_n+conseq_n+1, self.board.shape[1])
-        row = self.board[row_n_min:row_n_max, col_n]
-        col = self.board[row_n, col_n_min:col_n_max]
-        arr = self.board[row_n_min:row_n_max, col_n_min:col_n_max]
-        d1_row_n = row_n-row_n_min
-        d1_col_n = col_n-col_n_min
-        offset1 = d1_col_n - d1_row_n
-        diag1 = arr.diagonal(offset1)
-        d2_row_n = arr.shape[0] - 1 - d1_row_n
-        d2_col_n = d1_col_n
-        offset2 = d2_col_n - d2_row_n
-        diag2 = np.flipud(arr).diagonal(offset2)
-        row_win = tl.check_conseq_nums(row, conseq_n+1)[0]
-        col_win = tl.check_conseq_nums(col, conseq_n+1)[0]
-        diag1_win = tl.check_conseq_nums(diag1, conseq_n+1)[0]
-        diag2_win = tl.check_conseq_nums(diag2, conseq_n+1)[0]
-
-        return row_win or col_win or diag1_win or diag2_win
+        for window in self.windows[bit]:
+            if bitboard & window == window:
+                return True
+        return False
 
     def check_draw(self) -> bool:
         """Check if the game is a draw
@@ -98,17 +309,81 @@ class Game:
         Returns:
             bool: true if the game is a draw
         """
-        return np.all(self.board != 0)
+        return not self.legal
+
+    def legal_moves(self) -> list[int]:
+        """Function to get the columns that are not full
+
+        Returns:
+            list[int]: the column numbers
+        """
+        return [col_n for col_n in range(self.cols) if self.legal >> col_n & 1]
+
+    @metrics.timed('game.choose_move')
+    def choose_move(
+        self, strategy: Callable[[Game, int], int] | None, token_id: int = 2,
+        stop: threading.Event | None = None, solve: bool = True,
+    ) -> int | None:
+        """Helper function to pick the column of the AI without placing the token
+        Uses the column of the opening book if the position is in the book, then the best column of the endgame cache
+        if the position is late enough, otherwise the column picked by the strategy.
+        A position missing from the endgame cache is solved until stop is set, then the strategy picks the column
+
+        Args:
+            strategy (Callable[[Game, int], int] | None): Function that returns the column to play
+                                                          given the game and the token ID
+            token_id (int, optional): The token ID to place. Defaults to 2.
+            stop (threading.Event | None, optional): Event that stops the endgame solve from another thread.
+                                                     Defaults to None.
+            solve (bool, optional): Whether a position missing from the endgame cache is solved. Pass False
+                                    when the strategy has a time budget: it searches the position within
+                                    the budget, while a solve would add to the time of the move. Defaults to True.
+
+        Returns:
+            int | None: the column to play, None if the position is not in the book and there is no strategy
+        """
+        if self.book is not None:
+            col_n = self.book.lookup(self, token_id)
+            if col_n is not None:
+                return col_n
+
+        if self.endgame is not None:
+            entry = self.endgame.lookup(self, token_id, stop=stop, solve=solve)
+            if entry is not None:
+                return entry.col_n
 
-    def make_move(self) -> tuple[int, int]:
+        if strategy is not None:
+            return strategy(self, token_id)
+        return None
+
+    @metrics.timed('game.make_move')
+    def make_move(
+        self, strategy: Callable[[Game, int], int] | None = None, token_id: int = 2,
+        stop: threading.Event | None = None, solve: bool = True,
+    ) -> tuple[int, int]:
         """Helper function to place a token for the AI
-        Calls place_token to place a token in a random column
+        Calls place_token to place a token in the column picked by choose_move,
+        or in a random column that is not full if there is no book move and no strategy
+
+        Args:
+            strategy (Callable[[Game, int], int] | None, optional): Function that returns the column to play
+                                                                    given the game and the token ID. Defaults to None.
+            token_id (int, optional): The token ID to place. Defaults to 2.
+            stop (threading.Event | None, optional): Event that stops the endgame solve from another thread.
+                                                     Defaults to None.
+            solve (bool, optional): Whether a position missing from the endgame cache is solved (see choose_move).
+                                    Defaults to True.
 
         Returns:
-            tuple[int, int]: location of the placed token
+            tuple[int, int]: location of the placed token, (-1, -1) if the board is full
         """
-        row_n = -1
-        while row_n == -1:
-            col_n = np.random.randint(0, 6)
-            row_n, col_n = self.place_token(col_n, 2)
+        col_n = self.choose_move(strategy, token_id, stop, solve)
+        if col_n is not None:
+            return self.place_token(col_n, token_id)
+
+        # Sample from the columns that are not full, so there are no retries late in the game
+        legal = self.legal_moves()
+        if not legal:
+            return -1, -1
+        row_n, col_n = self.place_token(legal[np.random.randint(len(legal))], token_id)
         return row_n, col_n
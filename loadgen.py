@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class LoadReport:
+    """Summary of a load generator run
+    - latencies: the time in seconds between sending every move and receiving its response
+    """
+    n_clients: int
+    n_games: int
+    n_errors: int
+    elapsed: float
+    latencies: np.ndarray
+
+    @property
+    def moves_per_sec(self) -> float:
+        return len(self.latencies) / self.elapsed if self.elapsed else float('inf')
+
+    def percentile(self, q: float) -> float:
+        """Function to get a percentile of the move latency
+
+        Args:
+            q (float): The percentile, between 0 and 100
+
+        Returns:
+            float: the latency in seconds, 0 if no move was played
+        """
+        return float(np.percentile(self.latencies, q)) if len(self.latencies) else 0.0
+
+    def summary(self) -> str:
+        """Function to format the report for the terminal
+
+        Returns:
+            str: the report
+        """
+        return '\n'.join([
+            f'{self.n_clients} clients, {self.n_games} games, {len(self.latencies)} moves in {self.elapsed:.2f} s',
+            f'{self.moves_per_sec:.1f} moves/s, {self.n_errors} errors',
+            'move latency: ' + ', '.join(
+                f'p{q} {1000 * self.percentile(q):.2f} ms' for q in (50, 90, 99)
+            ) + f', max {1000 * self.percentile(100):.2f} ms',
+        ])
+
+
+async def request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, message: dict) -> dict:
+    """Function to send a request to the server and wait for the response
+
+    Args:
+        reader (asyncio.StreamReader): The stream of responses
+        writer (asyncio.StreamWriter): The stream of requests
+        message (dict): The request
+
+    Returns:
+        dict: the response
+    """
+    writer.write(json.dumps(message).encode() + b'\n')
+    await writer.drain()
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError('the server closed the connection')
+    return json.loads(line)
+
+
+async def run_client(host: str, port: int, n_games: int, rng: random.Random, latencies: list[float]) -> tuple[int, int]:
+    """Function to play games with random moves on one connection
+
+    Args:
+        host (str): The address of the server
+        port (int): The port of the server
+        n_games (int): The number of games to play
+        rng (random.Random): The random number generator of the moves
+        latencies (list[float]): The list the latency of every move is added to
+
+    Returns:
+        tuple[int, int]: the number of finished games and the number of error responses
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    games = errors = 0
+    try:
+        for _ in range(n_games):
+            state = await request(reader, writer, {'op': 'new'})
+            if not state['ok']:
+                errors += 1
+                continue
+            session = state['session']
+            while not state['over']:
+                start = time.perf_counter()
+                state = await request(reader, writer, {'op': 'move', 'session': session, 'col': rng.choice(state['legal'])})
+                latencies.append(time.perf_counter() - start)
+                if not state['ok']:
+                    errors += 1
+                    break
+            else:
+                games += 1
+            await request(reader, writer, {'op': 'close', 'session': session})
+    finally:
+        writer.close()
+    return games, errors
+
+
+async def run_load(host: str, port: int, n_clients: int = 100, n_games: int = 1, seed: int = 0) -> LoadReport:
+    """Function to play games on many concurrent connections and measure the move latency
+
+    Args:
+        host (str): The address of the server
+        port (int): The port of the server
+        n_clients (int, optional): The number of concurrent connections. Defaults to 100.
+        n_games (int, optional): The number of games played by every connection. Defaults to 1.
+        seed (int, optional): The seed of the moves. Defaults to 0.
+
+    Returns:
+        LoadReport: the summary of the run
+    """
+    latencies: list[float] = []
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        run_client(host, port, n_games, random.Random(seed * n_clients + client_n), latencies)
+        for client_n in range(n_clients)
+    ))
+    elapsed = time.perf_counter() - start
+    return LoadReport(
+        n_clients=n_clients,
+        n_games=sum(games for games, _ in results),
+        n_errors=sum(errors for _, errors in results),
+        elapsed=elapsed,
+        latencies=np.array(latencies),
+    )
+
+
+def main(argv: list[str] | None = None):
+    """Command line entry point, e.g. python3 loadgen.py --clients 1000 --games 2
+    """
+    parser = argparse.ArgumentParser(description='Play random games against a game server and measure the move latency')
+    parser.add_argument('--host', default='127.0.0.1', help='address of the server')
+    parser.add_argument('--port', type=int, default=8765, help='port of the server')
+    parser.add_argument('--clients', type=int, default=100, help='number of concurrent connections')
+    parser.add_argument('--games', type=int, default=1, help='number of games played by every connection')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the moves')
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load(args.host, args.port, args.clients, args.games, args.seed))
+    print(report.summary())
+
+
+if __name__ == '__main__':
+    main()
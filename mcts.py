@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import math
+import time
+
+import numpy as np
+
+from game import Game
+from playouts import random_playouts
+from solver import position
+from solver import Solver
+
+
+class Node:
+    """Node of the search tree
+    - current, mask: the position, current holds the tokens of the player to move
+    - value: sum of the results of the playouts for the player who moved into the node (1 win, 0.5 draw)
+    - terminal: the result of the game for the player who moved into the node if the game is over, otherwise None
+    """
+    __slots__ = ('current', 'mask', 'parent', 'move', 'children', 'untried', 'visits', 'value', 'terminal')
+
+    def __init__(self, current: int, mask: int, parent: Node | None, move: int, untried: list[int], terminal: float | None):
+        self.current = current
+        self.mask = mask
+        self.parent = parent
+        self.move = move
+        self.children: list[Node] = []
+        self.untried = untried
+        self.visits = 0
+        self.value = 0.0
+        self.terminal = terminal
+
+
+class MCTS:
+    """Monte Carlo tree search with UCT selection
+    Every expanded leaf is evaluated with a batch of random playouts played in lockstep by random_playouts
+    (boards up to cols * (rows + 1) = 64 bits, e.g. 6x7 or 7x8).
+    """
+
+    def __init__(
+        self, rows: int = 6, cols: int = 7, exploration: float = 1.4, batch_size: int = 256,
+        rng: np.random.Generator | None = None, connect: int = 4,
+    ):
+        """Initialize the search
+
+        Args:
+            rows (int, optional): The number of rows of the board. Defaults to 6.
+            cols (int, optional): The number of columns of the board. Defaults to 7.
+            exploration (float, optional): The exploration constant of UCT. Defaults to 1.4.
+            batch_size (int, optional): The number of playouts from every new leaf. Defaults to 256.
+            rng (np.random.Generator | None, optional): The random number generator. Defaults to None.
+            connect (int, optional): The number of tokens in a line needed to win. Defaults to 4.
+        """
+        self.bits = Solver(rows, cols, connect=connect)
+        self.rows = rows
+        self.cols = cols
+        self.connect = connect
+        self.exploration = exploration
+        self.batch_size = batch_size
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.playouts = 0
+
+    def legal_moves(self, mask: int) -> list[int]:
+        """Helper function to get the columns that are not full, center first
+
+        Args:
+            mask (int): The bitboard of all the tokens
+
+        Returns:
+            list[int]: the playable columns
+        """
+        possible = (mask + self.bits.bottom) & self.bits.board_mask
+        return [col_n for col_n in self.bits.order if possible & self.bits.column_masks[col_n]]
+
+    def expand(self, node: Node) -> Node:
+        """Function to add the child of one of the untried moves of a node
+
+        Args:
+            node (Node): The node to expand
+
+        Returns:
+            Node: the new child
+        """
+        col_n = node.untried.pop()
+        move = ((node.mask + self.bits.bottom) & self.bits.board_mask) & self.bits.column_masks[col_n]
+        mask = node.mask | move
+        terminal = None
+        if move & self.bits.winning_cells(node.current, node.mask):
+            terminal = 1.0
+        elif mask == self.bits.board_mask:
+            terminal = 0.5
+        untried = [] if terminal is not None else self.legal_moves(mask)[::-1]
+        child = Node(node.current ^ node.mask, mask, node, col_n, untried, terminal)
+        node.children.append(child)
+        return child
+
+    def select(self, node: Node) -> Node:
+        """Function to pick the child with the highest UCT score
+
+        Args:
+            node (Node): The fully expanded node
+
+        Returns:
+            Node: the selected child
+        """
+        log_visits = math.log(node.visits)
+        return max(
+            node.children,
+            key=lambda child: child.value / child.visits + self.exploration * math.sqrt(log_visits / child.visits),
+        )
+
+    def evaluate(self, node: Node) -> float:
+        """Function to play a batch of random games from a leaf
+
+        Args:
+            node (Node): The leaf, without a winner
+
+        Returns:
+            float: the sum of the results for the player who moved into the leaf
+        """
+        results = random_playouts(
+            np.full(self.batch_size, node.current, dtype=np.uint64),
+            np.full(self.batch_size, node.mask, dtype=np.uint64),
+            self.rows, self.cols, self.rng, self.connect,
+        )
+        self.playouts += self.batch_size
+        return float(np.count_nonzero(results == 2) + 0.5 * np.count_nonzero(results == 0))
+
+    def search(
+        self, current: int, mask: int, iterations: int | None = None, time_budget: float | None = None,
+    ) -> tuple[int, dict[int, int]]:
+        """Function to search a position until the iteration or time budget is used up
+
+        Args:
+            current (int): The bitboard of the player to move
+            mask (int): The bitboard of all the tokens
+            iterations (int | None, optional): The number of leaves to evaluate. Defaults to None.
+            time_budget (float | None, optional): The maximum search time in seconds. Defaults to None.
+
+        Returns:
+            tuple[int, dict[int, int]]: the most visited column and the number of visits of every column
+        """
+        if iterations is None and time_budget is None:
+            raise ValueError('MCTS needs an iteration or time budget')
+        root = Node(current, mask, None, -1, self.legal_moves(mask)[::-1], None)
+        if not root.untried:
+            raise ValueError('There are no legal moves left')
+
+        deadline = None if time_budget is None else time.perf_counter() + time_budget
+        iteration = 0
+        while (iterations is None or iteration < iterations) and (deadline is None or time.perf_counter() < deadline):
+            iteration += 1
+            node = root
+            while not node.untried and node.terminal is None:
+                node = self.select(node)
+            if node.terminal is None:
+                node = self.expand(node)
+
+            # Finished games count as a batch of playouts with the same result
+            visits = self.batch_size
+            value = node.terminal * visits if node.terminal is not None else self.evaluate(node)
+            # Back up the results from the leaf to the root
+            ancestor: Node | None = node
+            while ancestor is not None:
+                ancestor.visits += visits
+                ancestor.value += value
+                value = visits - value
+                ancestor = ancestor.parent
+
+        best = max(root.children, key=lambda child: child.visits)
+        return best.move, {child.move: child.visits for child in root.children}
+
+
+class MCTSStrategy:
+    """Strategy for Game.make_move that plays the most visited column of a Monte Carlo tree search
+    """
+
+    def __init__(
+        self, iterations: int | None = 200, time_budget: float | None = None, batch_size: int = 256,
+        exploration: float = 1.4, seed: int | None = None,
+    ):
+        """Initialize the strategy with its search budget
+
+        Args:
+            iterations (int | None, optional): The number of leaves to evaluate. Defaults to 200.
+            time_budget (float | None, optional): The maximum search time in seconds. Defaults to None.
+            batch_size (int, optional): The number of playouts from every new leaf. Defaults to 256.
+            exploration (float, optional): The exploration constant of UCT. Defaults to 1.4.
+            seed (int | None, optional): The seed of the random number generator. Defaults to None.
+        """
+        self.iterations = iterations
+        self.time_budget = time_budget
+        self.batch_size = batch_size
+        self.exploration = exploration
+        self.rng = np.random.default_rng(seed)
+
+    def __call__(self, game: Game, token_id: int) -> int:
+        """Pick a column for the given player
+
+        Args:
+            game (Game): The game to play in
+            token_id (int): The token ID of the player to move
+
+        Returns:
+            int: the column to play
+        """
+        search = MCTS(game.rows, game.cols, self.exploration, self.batch_size, self.rng, game.connect)
+        col_n, _ = search.search(*position(game, token_id), iterations=self.iterations, time_budget=self.time_budget)
+        return col_n
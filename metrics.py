@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import atexit
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any
+from typing import Callable
+from typing import Iterator
+from typing import TypeVar
+
+# Metrics are only recorded when CONNECT4_METRICS is set to the path of the metrics file ({pid} is replaced
+# by the process ID), before the modules are imported. They are written every CONNECT4_METRICS_INTERVAL seconds
+# (default 10) and when the process exits.
+ENV_VAR = 'CONNECT4_METRICS'
+INTERVAL_ENV_VAR = 'CONNECT4_METRICS_INTERVAL'
+ENABLED = bool(os.environ.get(ENV_VAR))
+
+# Upper bounds in seconds of the histogram buckets: 1 us, 2 us, 4 us, ..., about 17 min, then everything longer
+BUCKETS = tuple(2 ** n / 1e6 for n in range(31))
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+
+class Histogram:
+    """Histogram of durations with the buckets of BUCKETS
+    """
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds: float):
+        """Add a duration to the histogram
+
+        Args:
+            seconds (float): The duration
+        """
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        # Bucket n holds the durations in (2 ** (n-1), 2 ** n] microseconds
+        self.buckets[min(max(int(seconds * 1e6 - 1e-9), 0).bit_length(), len(BUCKETS))] += 1
+
+    def percentile(self, q: float) -> float:
+        """Function to estimate a percentile from the buckets
+
+        Args:
+            q (float): The percentile, between 0 and 100
+
+        Returns:
+            float: the upper bound of the bucket holding the percentile (the maximum for the last bucket)
+        """
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket_n, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return min(BUCKETS[bucket_n], self.max) if bucket_n < len(BUCKETS) else self.max
+        return self.max
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'min': self.min if self.count else 0.0,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'buckets': self.buckets,
+        }
+
+
+class Registry:
+    """Counters and histograms of a process, safe to update from several threads
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: dict[str, int] = {}
+        self.histograms: dict[str, Histogram] = {}
+        self.started = time.time()
+
+    def count(self, name: str, n: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, seconds: float):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(seconds)
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+    def snapshot(self) -> dict[str, Any]:
+        """Function to get all the metrics
+
+        Returns:
+            dict[str, Any]: the process, the time range, the counters and the histograms (durations in seconds)
+        """
+        with self.lock:
+            return {
+                'pid': os.getpid(),
+                'started': self.started,
+                'time': time.time(),
+                'counters': dict(self.counters),
+                'histograms': {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+            }
+
+    def dump(self, path: str):
+        """Write the metrics to a JSON file, replacing it at once so readers never see half a file
+
+        Args:
+            path (str): The path of the file, {pid} is replaced by the process ID
+        """
+        path = path.format(pid=os.getpid())
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=1)
+        os.replace(tmp_path, path)
+
+
+REGISTRY = Registry()
+
+
+def count(name: str, n: int = 1):
+    """Add n to a counter if metrics are enabled
+
+    Args:
+        name (str): The name of the counter
+        n (int, optional): The amount to add. Defaults to 1.
+    """
+    if ENABLED:
+        REGISTRY.count(name, n)
+
+
+def observe(name: str, seconds: float):
+    """Add a duration to a histogram if metrics are enabled
+
+    Args:
+        name (str): The name of the histogram
+        seconds (float): The duration
+    """
+    if ENABLED:
+        REGISTRY.observe(name, seconds)
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """Decorator recording the duration of every call of a function in a histogram
+    When metrics are disabled the function is returned unchanged, so it costs nothing
+
+    Args:
+        name (str): The name of the histogram
+
+    Returns:
+        Callable[[F], F]: the decorator
+    """
+    def decorator(func: F) -> F:
+        if not ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                REGISTRY.observe(name, time.perf_counter() - start)
+        return wrapper  # type: ignore[return-value]
+    return decorator
+
+
+def start_dumps(path: str, interval: float) -> threading.Thread:
+    """Write the metrics every interval seconds from a daemon thread and when the process exits
+
+    Args:
+        path (str): The path of the metrics file, {pid} is replaced by the process ID
+        interval (float): The number of seconds between two writes
+
+    Returns:
+        threading.Thread: the thread writing the metrics
+    """
+    def run():
+        while True:
+            time.sleep(interval)
+            REGISTRY.dump(path)
+
+    thread = threading.Thread(target=run, name='metrics', daemon=True)
+    thread.start()
+    atexit.register(REGISTRY.dump, path)
+    return thread
+
+
+@contextmanager
+def profile(path: str | None) -> Iterator[cProfile.Profile | None]:
+    """Context manager that runs the block under cProfile and writes the statistics to a file
+    (read them with python3 -m pstats path), does nothing if path is None
+
+    Args:
+        path (str | None): The path of the statistics file
+
+    Yields:
+        cProfile.Profile | None: the profiler
+    """
+    if path is None:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+if ENABLED:
+    start_dumps(os.environ[ENV_VAR], float(os.environ.get(INTERVAL_ENV_VAR, 10)))
@@ -0,0 +1,592 @@
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from functools import lru_cache
+from typing import Any
+from typing import Iterable
+from typing import NamedTuple
+from typing import Sequence
+
+import numpy as np
+
+from game import Game
+from records import GameReader
+from records import UNFINISHED
+from solver import position
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nn_weights.npz')
+DEFAULT_HIDDEN = (128, 64)
+
+
+@dataclass
+class TreeNode:
+    """Node of the tree of NetworkStrategy, one of:
+    - value: the value of a finished game for the player to move
+    - index: the index of the position in the batch sent to the network
+    - children: the nodes of the legal columns
+    """
+    value: float | None = None
+    index: int | None = None
+    children: dict[int, TreeNode] = field(default_factory=dict)
+
+
+def encode(boards: np.ndarray, token_ids: np.ndarray | int) -> np.ndarray:
+    """Function to encode boards as the inputs of the network, from the point of view of the player to move
+
+    Args:
+        boards (np.ndarray): The boards, shaped like Game.board (rows, cols) or stacked (n, rows, cols)
+        token_ids (np.ndarray | int): The token ID of the player to move of every board
+
+    Returns:
+        np.ndarray: float32 array (n, 2 * rows * cols), the cells of the player to move then those of the opponent
+    """
+    boards = np.asarray(boards)
+    if boards.ndim == 2:
+        boards = boards[None]
+    token_ids = np.broadcast_to(np.asarray(token_ids).reshape(-1, 1, 1), (len(boards), 1, 1))
+    planes = np.stack([boards == token_ids, (boards != 0) & (boards != token_ids)], axis=1)
+    return planes.reshape(len(boards), -1).astype(np.float32)
+
+
+@lru_cache(maxsize=None)
+def bit_indices(rows: int, cols: int) -> np.ndarray:
+    """Helper function to get the bit of every cell of the board (layout of Game, row 0 is the top row)
+
+    Args:
+        rows (int): The number of rows of the board
+        cols (int): The number of columns of the board
+
+    Returns:
+        np.ndarray: uint64 array (rows, cols) of bit indices
+    """
+    row_ns, col_ns = np.indices((rows, cols))
+    return (col_ns * (rows + 1) + rows - 1 - row_ns).astype(np.uint64)
+
+
+def encode_positions(currents: Sequence[int] | int, masks: Sequence[int] | int, rows: int = 6, cols: int = 7) -> np.ndarray:
+    """Function to encode solver positions (see solver.position) like encode, for boards of at most 64 bits
+
+    Args:
+        currents (Sequence[int] | int): The bitboard of the player to move of every position
+        masks (Sequence[int] | int): The bitboard of all the tokens of every position
+        rows (int, optional): The number of rows of the board. Defaults to 6.
+        cols (int, optional): The number of columns of the board. Defaults to 7.
+
+    Returns:
+        np.ndarray: float32 array (n, 2 * rows * cols)
+    """
+    current = np.asarray(currents, dtype=np.uint64).reshape(-1, 1, 1)
+    opponent = np.asarray(masks, dtype=np.uint64).reshape(-1, 1, 1) ^ current
+    bits = bit_indices(rows, cols)
+    planes = np.stack([(current >> bits) & np.uint64(1), (opponent >> bits) & np.uint64(1)], axis=1)
+    return planes.reshape(len(current), -1).astype(np.float32)
+
+
+class Network:
+    """Multilayer perceptron with a value head and a policy head, in NumPy only
+
+    The input is a board encoded by encode, followed by hidden layers with ReLU activations. The value head
+    gives the expected result of the game for the player to move, between -1 (loss) and 1 (win), the policy
+    head gives the probability of playing every column (0 for the full columns).
+    Inference works on batches of positions, one matrix product per layer for the whole batch,
+    so thousands of positions cost little more than one.
+    """
+
+    def __init__(
+        self, rows: int = 6, cols: int = 7, hidden: Sequence[int] = DEFAULT_HIDDEN, seed: int | None = None,
+        params: dict[str, np.ndarray] | None = None,
+    ):
+        """Initialize the network with random weights, or with given weights
+
+        Args:
+            rows (int, optional): The number of rows of the board. Defaults to 6.
+            cols (int, optional): The number of columns of the board. Defaults to 7.
+            hidden (Sequence[int], optional): The size of every hidden layer. Defaults to DEFAULT_HIDDEN.
+            seed (int | None, optional): The seed of the random weights. Defaults to None.
+            params (dict[str, np.ndarray] | None, optional): The weights, as saved by save. Defaults to None.
+        """
+        self.rows = rows
+        self.cols = cols
+        if params is None:
+            rng = np.random.default_rng(seed)
+            sizes = [2 * rows * cols, *hidden]
+            params = {}
+            for layer_n, (n_in, n_out) in enumerate(zip(sizes, sizes[1:])):
+                params[f'w{layer_n}'] = rng.normal(0, np.sqrt(2 / n_in), (n_in, n_out))
+                params[f'b{layer_n}'] = np.zeros(n_out)
+            params['value_w'] = rng.normal(0, np.sqrt(1 / sizes[-1]), (sizes[-1], 1))
+            params['value_b'] = np.zeros(1)
+            params['policy_w'] = rng.normal(0, np.sqrt(1 / sizes[-1]), (sizes[-1], cols))
+            params['policy_b'] = np.zeros(cols)
+        self.params = {name: np.asarray(array, dtype=np.float32) for name, array in params.items()}
+        self.n_layers = sum(name.startswith('w') for name in self.params)
+        if self.params['w0'].shape[0] != 2 * rows * cols or self.params['policy_b'].shape != (cols,):
+            raise ValueError(f'The weights do not fit a {rows}x{cols} board')
+
+    @classmethod
+    def load(cls, path: str) -> Network:
+        """Function to read a network written by save
+
+        Args:
+            path (str): The path of the .npz file
+
+        Returns:
+            Network: the network
+        """
+        with np.load(path) as data:
+            params = {name: data[name] for name in data.files if name != 'shape'}
+            rows, cols = data['shape'].tolist()
+        return cls(rows, cols, params=params)
+
+    def save(self, path: str):
+        """Write the weights and the board shape to a .npz file
+
+        Args:
+            path (str): The path of the file
+        """
+        arrays: dict[str, Any] = {'shape': np.array([self.rows, self.cols]), **self.params}
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    def forward(self, inputs: np.ndarray) -> tuple[np.ndarray, np.ndarray, list[np.ndarray]]:
+        """Function to run the network on encoded positions
+
+        Args:
+            inputs (np.ndarray): The positions encoded by encode, (n, 2 * rows * cols)
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, list[np.ndarray]]: the values (n,), the policy logits of the legal columns
+                                                             (n, cols), -inf for the full columns, and the input
+                                                             of every layer (for the gradients)
+        """
+        params = self.params
+        activations = [inputs]
+        for layer_n in range(self.n_layers):
+            activations.append(np.maximum(activations[-1] @ params[f'w{layer_n}'] + params[f'b{layer_n}'], 0))
+        hidden = activations[-1]
+        values = np.tanh(hidden @ params['value_w'] + params['value_b'])[:, 0]
+        logits = hidden @ params['policy_w'] + params['policy_b']
+        # A column is full when the top cell is taken by either player
+        n_cells = self.rows * self.cols
+        full = (inputs[:, :self.cols] + inputs[:, n_cells:n_cells + self.cols]) > 0
+        logits[full] = -np.inf
+        return values, logits, activations
+
+    def predict(self, inputs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Function to evaluate a batch of positions
+
+        Args:
+            inputs (np.ndarray): The positions encoded by encode or encode_positions, (n, 2 * rows * cols)
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: the values for the player to move (n,) and the probabilities
+                                           of the columns (n, cols)
+        """
+        values, logits, _ = self.forward(np.asarray(inputs, dtype=np.float32))
+        return values, softmax(logits)
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    """Helper function to turn logits into probabilities along the last axis, -inf gets 0
+
+    Args:
+        logits (np.ndarray): The logits, with at least one finite value per row
+
+    Returns:
+        np.ndarray: the probabilities
+    """
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+@lru_cache(maxsize=None)
+def load_network(path: str = DEFAULT_PATH) -> Network:
+    """Function to read a network once per process, every strategy and evaluator of the process shares it
+    (the network is only read after that, do not train it)
+
+    Args:
+        path (str, optional): The path of the .npz file. Defaults to DEFAULT_PATH.
+
+    Returns:
+        Network: the network
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'No network at {path}, train one with python3 nn.py')
+    return Network.load(path)
+
+
+class TrainingData(NamedTuple):
+    """Positions of games labelled with their results
+    - inputs: the positions encoded by encode
+    - values: the result of the game for the player to move (1 win, 0 draw, -1 loss)
+    - moves: the column played in the position
+    """
+    inputs: np.ndarray
+    values: np.ndarray
+    moves: np.ndarray
+
+
+def training_data(
+    games: Iterable[tuple[Sequence[int], int]], rows: int = 6, cols: int = 7, mirror: bool = True,
+) -> TrainingData:
+    """Function to label the positions before every move of games with the results of the games
+
+    Args:
+        games (Iterable[tuple[Sequence[int], int]]): The columns played (player 1 starts) and the winner
+                                                     (0 for a draw) of every game
+        rows (int, optional): The number of rows of the board. Defaults to 6.
+        cols (int, optional): The number of columns of the board. Defaults to 7.
+        mirror (bool, optional): Whether to add the left-right mirror of every position. Defaults to True.
+
+    Returns:
+        TrainingData: the labelled positions
+    """
+    boards = []
+    token_ids = []
+    values = []
+    moves = []
+    for game_moves, winner in games:
+        board = np.zeros((rows, cols), dtype=np.int8)
+        heights = [0] * cols
+        for move_n, col_n in enumerate(game_moves):
+            token_id = move_n % 2 + 1
+            boards.append(board.copy())
+            token_ids.append(token_id)
+            values.append(0 if winner == 0 else 1 if winner == token_id else -1)
+            moves.append(col_n)
+            board[rows - 1 - heights[col_n], col_n] = token_id
+            heights[col_n] += 1
+
+    if not boards:
+        return TrainingData(np.zeros((0, 2 * rows * cols), dtype=np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64))
+    board_array = np.stack(boards)
+    token_array = np.array(token_ids)
+    value_array = np.array(values, dtype=np.float32)
+    move_array = np.array(moves, dtype=np.int64)
+    if mirror:
+        board_array = np.concatenate([board_array, board_array[:, :, ::-1]])
+        token_array = np.tile(token_array, 2)
+        value_array = np.tile(value_array, 2)
+        move_array = np.concatenate([move_array, cols - 1 - move_array])
+    return TrainingData(encode(board_array, token_array), value_array, move_array)
+
+
+def loss_and_gradients(
+    network: Network, inputs: np.ndarray, values: np.ndarray, moves: np.ndarray, policy_weight: float = 1.0,
+) -> tuple[float, dict[str, np.ndarray]]:
+    """Function to get the loss of a batch and its gradient for every weight
+    The loss is the mean squared error of the values plus policy_weight times the cross-entropy of the moves
+
+    Args:
+        network (Network): The network
+        inputs (np.ndarray): The encoded positions (n, 2 * rows * cols)
+        values (np.ndarray): The results for the player to move (n,)
+        moves (np.ndarray): The columns played (n,)
+        policy_weight (float, optional): The weight of the policy loss. Defaults to 1.0.
+
+    Returns:
+        tuple[float, dict[str, np.ndarray]]: the loss and the gradients, with the names of Network.params
+    """
+    params = network.params
+    n = len(inputs)
+    predicted, logits, activations = network.forward(inputs)
+    policies = softmax(logits)
+    rows = np.arange(n)
+    loss = float(np.mean((predicted - values) ** 2) - policy_weight * np.mean(np.log(policies[rows, moves] + 1e-12)))
+
+    d_values = (2 / n * (predicted - values) * (1 - predicted ** 2))[:, None]
+    d_logits = policies
+    d_logits[rows, moves] -= 1
+    d_logits *= policy_weight / n
+    hidden = activations[-1]
+    gradients = {
+        'value_w': hidden.T @ d_values,
+        'value_b': d_values.sum(axis=0),
+        'policy_w': hidden.T @ d_logits,
+        'policy_b': d_logits.sum(axis=0),
+    }
+    d_hidden = d_values @ params['value_w'].T + d_logits @ params['policy_w'].T
+    for layer_n in range(network.n_layers - 1, -1, -1):
+        d_hidden *= activations[layer_n + 1] > 0
+        gradients[f'w{layer_n}'] = activations[layer_n].T @ d_hidden
+        gradients[f'b{layer_n}'] = d_hidden.sum(axis=0)
+        d_hidden = d_hidden @ params[f'w{layer_n}'].T
+    return loss, gradients
+
+
+def train(
+    network: Network, data: TrainingData, epochs: int = 10, batch_size: int = 256, learning_rate: float = 1e-3,
+    policy_weight: float = 1.0, seed: int | None = None,
+) -> list[float]:
+    """Function to fit the network to labelled positions with the Adam optimizer, the weights are updated in place
+
+    Args:
+        network (Network): The network
+        data (TrainingData): The labelled positions
+        epochs (int, optional): The number of passes over the positions. Defaults to 10.
+        batch_size (int, optional): The number of positions per step. Defaults to 256.
+        learning_rate (float, optional): The step size of Adam. Defaults to 1e-3.
+        policy_weight (float, optional): The weight of the policy loss. Defaults to 1.0.
+        seed (int | None, optional): The seed of the order of the positions. Defaults to None.
+
+    Returns:
+        list[float]: the mean loss of every epoch
+    """
+    rng = np.random.default_rng(seed)
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    first = {name: np.zeros_like(param) for name, param in network.params.items()}
+    second = {name: np.zeros_like(param) for name, param in network.params.items()}
+    step = 0
+    losses = []
+    for _ in range(epochs):
+        order = rng.permutation(len(data.inputs))
+        total = 0.0
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            loss, gradients = loss_and_gradients(
+                network, data.inputs[batch], data.values[batch], data.moves[batch], policy_weight,
+            )
+            total += loss * len(batch)
+            step += 1
+            for name, gradient in gradients.items():
+                # In place, so the moments stay float32 like the weights
+                first[name] *= beta1
+                first[name] += (1 - beta1) * gradient
+                second[name] *= beta2
+                second[name] += (1 - beta2) * gradient ** 2
+                update = first[name] / (1 - beta1 ** step) / (np.sqrt(second[name] / (1 - beta2 ** step)) + eps)
+                network.params[name] -= (learning_rate * update).astype(np.float32)
+        losses.append(total / max(1, len(order)))
+    return losses
+
+
+class NetworkEvaluator:
+    """Network with the interface of evaluator.Evaluator, to score the positions left undecided by Solver
+    Every leaf is evaluated on its own, which is much slower than the batches of NetworkStrategy,
+    so it suits shallow searches.
+    """
+
+    def __init__(self, network: Network):
+        """Initialize the evaluator with an empty board
+
+        Args:
+            network (Network): The network
+        """
+        self.network = network
+        self.bitboards = [0, 0]
+
+    def load(self, bitboards: list[int] | tuple[int, int]):
+        """Set the board from the bitboards of both players
+
+        Args:
+            bitboards (list[int] | tuple[int, int]): The bitboards of player 1 and 2 (layout of Game)
+        """
+        self.bitboards = list(bitboards)
+
+    def place(self, bit: int, player: int):
+        """Add a token
+
+        Args:
+            bit (int): The bit index of the cell (layout of Game)
+            player (int): 0 for player 1, 1 for player 2
+        """
+        self.bitboards[player] |= 1 << bit
+
+    def remove(self, bit: int, player: int):
+        """Take back a token added by place
+
+        Args:
+            bit (int): The bit index of the cell (layout of Game)
+            player (int): 0 for player 1, 1 for player 2
+        """
+        self.bitboards[player] &= ~(1 << bit)
+
+    @property
+    def score(self) -> float:
+        """The value of the network for player 1 on the scale of Evaluator.score,
+        which Solver.leaf_value maps back to the value of the network
+        """
+        player_1, player_2 = self.bitboards
+        mask = player_1 | player_2
+        player_1_moves = mask.bit_count() % 2 == 0
+        inputs = encode_positions(player_1 if player_1_moves else player_2, mask, self.network.rows, self.network.cols)
+        values, _, _ = self.network.forward(inputs)
+        value = float(np.clip(values[0] if player_1_moves else -values[0], -0.99, 0.99))
+        return 100 * value / (1 - abs(value))
+
+    def value(self, token_id: int) -> float:
+        """Function to get the score for a player
+
+        Args:
+            token_id (int): The token ID of the player
+
+        Returns:
+            float: the score, positive if the player is ahead
+        """
+        return self.score if token_id == 1 else -self.score
+
+
+class NetworkStrategy:
+    """Strategy for Game.make_move that looks depth moves ahead and scores all the positions reached with one
+    batched call to the network. The value of a column is the minimax of the values of the network
+    (1 for a win, -1 for a loss), plus prior times the probability the policy of the network gives it.
+    """
+
+    def __init__(
+        self, path: str = DEFAULT_PATH, depth: int = 2, prior: float = 0.1, temperature: float = 0.0,
+        seed: int | None = None,
+    ):
+        """Initialize the strategy, the network is read once per process (see load_network)
+
+        Args:
+            path (str, optional): The path of the weights. Defaults to DEFAULT_PATH.
+            depth (int, optional): The number of moves looked ahead, at least 1. Defaults to 2.
+            prior (float, optional): The weight of the policy of the network. Defaults to 0.1.
+            temperature (float, optional): 0 plays the best column, otherwise the columns are sampled
+                                           with probabilities softmax(value / temperature),
+                                           to vary the self-play games. Defaults to 0.0.
+            seed (int | None, optional): The seed of the sampling. Defaults to None.
+        """
+        if depth < 1:
+            raise ValueError('depth should be at least 1')
+        self.network = load_network(path)
+        self.depth = depth
+        self.prior = prior
+        self.temperature = temperature
+        self.rng = np.random.default_rng(seed)
+
+    def expand(self, game: Game, token_id: int, depth: int, positions: list[tuple[int, int]]) -> TreeNode:
+        """Function to list the positions depth moves ahead, they are added to positions
+
+        Args:
+            game (Game): The game, which is not over
+            token_id (int): The token ID of the player to move
+            depth (int): The number of moves left to look ahead
+            positions (list[tuple[int, int]]): The solver positions to evaluate
+
+        Returns:
+            TreeNode: the node of the game, with the node of every legal column
+        """
+        node = TreeNode()
+        for col_n in game.legal_moves():
+            with game.trial_move(col_n, token_id):
+                if game.over:
+                    node.children[col_n] = TreeNode(value=-1.0 if game.winner else 0.0)
+                elif depth == 1:
+                    node.children[col_n] = TreeNode(index=len(positions))
+                    positions.append(position(game, 3 - token_id))
+                else:
+                    node.children[col_n] = self.expand(game, 3 - token_id, depth - 1, positions)
+        return node
+
+    @staticmethod
+    def backup(node: TreeNode, values: np.ndarray) -> float:
+        """Function to get the minimax value of a subtree for the player to move
+
+        Args:
+            node (TreeNode): The root of the subtree
+            values (np.ndarray): The values of the network of the positions
+
+        Returns:
+            float: the value
+        """
+        if node.value is not None:
+            return node.value
+        if node.index is not None:
+            return float(values[node.index])
+        return max(-NetworkStrategy.backup(child, values) for child in node.children.values())
+
+    def __call__(self, game: Game, token_id: int) -> int:
+        """Pick a column for the given player
+
+        Args:
+            game (Game): The game to play in
+            token_id (int): The token ID of the player to move
+
+        Returns:
+            int: the column to play
+        """
+        if (game.rows, game.cols) != (self.network.rows, self.network.cols):
+            raise ValueError(f'The network was trained for a {self.network.rows}x{self.network.cols} board')
+        positions = [position(game, token_id)]
+        children = self.expand(game, token_id, self.depth, positions).children
+        currents, masks = zip(*positions)
+        values, policies = self.network.predict(encode_positions(currents, masks, game.rows, game.cols))
+        columns = list(children)
+        scores = np.array([-self.backup(children[col_n], values) + self.prior * policies[0, col_n] for col_n in columns])
+        if self.temperature > 0:
+            return columns[self.rng.choice(len(columns), p=softmax(scores / self.temperature))]
+        return columns[int(np.argmax(scores))]
+
+
+def read_games(paths: Iterable[str], rows: int = 6, cols: int = 7) -> Iterable[tuple[Sequence[int], int]]:
+    """Function to read the finished games of a board shape from record files
+
+    Args:
+        paths (Iterable[str]): The paths of the record files
+        rows (int, optional): The number of rows of the board. Defaults to 6.
+        cols (int, optional): The number of columns of the board. Defaults to 7.
+
+    Yields:
+        tuple[Sequence[int], int]: the columns played and the winner (0 for a draw)
+    """
+    for path in paths:
+        for record in GameReader(path):
+            if record.result != UNFINISHED and (record.rows, record.cols) == (rows, cols):
+                yield record.moves.tolist(), record.result
+
+
+def main(argv: list[str] | None = None):
+    """Command line entry point, e.g. python3 nn.py games.rec --epochs 20,
+    or python3 nn.py --games 5000 to play the games first
+    """
+    parser = argparse.ArgumentParser(description='Train the value/policy network on the positions of self-play games')
+    parser.add_argument('records', nargs='*', help='record files of the games (default: play --games games)')
+    parser.add_argument('--games', type=int, default=5000, help='number of self-play games without record files')
+    parser.add_argument('--player1', default='random',
+                        help='strategy of player 1, e.g. nn:temperature=0.1 to train on the games of a trained network')
+    parser.add_argument('--player2', default='random', help='strategy of player 2')
+    parser.add_argument('--workers', type=int, default=None, help='number of self-play processes (default: all CPUs)')
+    parser.add_argument('--output', default=DEFAULT_PATH, help='path of the weights')
+    parser.add_argument('--hidden', type=int, nargs='+', default=list(DEFAULT_HIDDEN), help='size of the hidden layers')
+    parser.add_argument('--epochs', type=int, default=10, help='number of passes over the positions')
+    parser.add_argument('--batch-size', type=int, default=256, help='number of positions per step')
+    parser.add_argument('--learning-rate', type=float, default=1e-3, help='step size of Adam')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the games and of the weights')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = args.records
+        if not paths:
+            # Imported here, selfplay imports the strategies, which include this module
+            from selfplay import run_selfplay
+            from strategies import parse_spec
+
+            paths = [os.path.join(directory, 'games.rec')]
+            report = run_selfplay(
+                parse_spec(args.player1), parse_spec(args.player2), args.games, seed=args.seed,
+                workers=args.workers, record=paths[0],
+            )
+            print(report.summary())
+        data = training_data(read_games(paths))
+
+    network = Network(hidden=args.hidden, seed=args.seed)
+    print(f'{len(data.inputs)} positions (with mirrors)')
+    start = time.perf_counter()
+    losses = train(
+        network, data, epochs=args.epochs, batch_size=args.batch_size, learning_rate=args.learning_rate, seed=args.seed,
+    )
+    for epoch_n, loss in enumerate(losses, 1):
+        print(f'epoch {epoch_n:3d} loss {loss:.4f}')
+    print(f'trained in {time.perf_counter() - start:.1f} s')
+    network.save(args.output)
+    print(f'weights written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
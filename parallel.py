@@ -0,0 +1,391 @@
+from __future__ import annotations
+
+import argparse
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import Executor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from multiprocessing.managers import SyncManager
+
+import numpy as np
+
+from evaluator import Evaluator
+from game import Game
+from solver import position
+from solver import SearchAborted
+from solver import Solver
+
+# Solvers of the worker process, created on first use and kept to reuse their transposition tables
+_worker_solvers: dict[tuple[int, int, int, bool], Solver] = {}
+# Process pools shared by all the strategies of this process, by number of workers
+_pools: dict[int, ProcessPoolExecutor] = {}
+# Manager of the stop events shared with the worker processes, created on first use
+_manager: SyncManager | None = None
+_pools_lock = threading.Lock()
+
+
+def search_move(
+    shape: tuple[int, int, int], heuristic: bool, current: int, mask: int, col_n: int, depth: int,
+    alpha: float, beta: float, time_budget: float | None, stop: threading.Event | None = None,
+) -> float | None:
+    """Function run in the worker pool to search one root move
+
+    Args:
+        shape (tuple[int, int, int]): The number of rows and columns of the board and the length of the lines
+        heuristic (bool): Whether the undecided positions are scored by an Evaluator
+        current (int): The bitboard of the player to move at the root
+        mask (int): The bitboard of all the tokens at the root
+        col_n (int): The column to play
+        depth (int): The number of moves to search, including the root move
+        alpha (float): The lower bound of the search window
+        beta (float): The upper bound of the search window
+        time_budget (float | None): The maximum search time in seconds
+        stop (threading.Event | None, optional): Event shared with the searching process (see shared_manager)
+                                                 that stops the search. Defaults to None.
+
+    Returns:
+        float | None: the score of the move for the player to move at the root if it lies in the window,
+                      otherwise a bound on the score, None if the time budget was used up or the search was stopped
+    """
+    key = (*shape, heuristic)
+    if key not in _worker_solvers:
+        rows, cols, connect = shape
+        evaluator = Evaluator(rows, cols, connect) if heuristic else None
+        _worker_solvers[key] = Solver(rows, cols, connect=connect, evaluator=evaluator)
+    solver = _worker_solvers[key]
+
+    move = ((mask + solver.bottom) & solver.board_mask) & solver.column_masks[col_n]
+    child_current, child_mask = current ^ mask, mask | move
+    moves = child_mask.bit_count()
+    if solver.evaluator is not None:
+        # Player 1 moves in the positions with an even number of tokens
+        opponent = child_current ^ child_mask
+        solver.evaluator.load((child_current, opponent) if moves % 2 == 0 else (opponent, child_current))
+    solver.nodes = 0
+    solver.max_nodes = None
+    solver.stop = stop
+    solver.deadline = None if time_budget is None else time.perf_counter() + time_budget
+    solver.can_abort = time_budget is not None
+    try:
+        return -solver.negamax(child_current, child_mask, moves, depth - 1, -beta, -alpha)
+    except SearchAborted:
+        return None
+
+
+def shared_pool(workers: int) -> ProcessPoolExecutor:
+    """Function to get the process pool with the given number of workers, it is created on first use
+
+    Args:
+        workers (int): The number of processes
+
+    Returns:
+        ProcessPoolExecutor: the pool
+    """
+    with _pools_lock:
+        if workers not in _pools:
+            _pools[workers] = ProcessPoolExecutor(workers)
+        return _pools[workers]
+
+
+def shared_manager() -> SyncManager:
+    """Function to get the manager process of the stop events shared with the workers, it is started on first use
+
+    Returns:
+        SyncManager: the manager
+    """
+    global _manager
+    with _pools_lock:
+        if _manager is None:
+            _manager = SyncManager()
+            _manager.start()
+        return _manager
+
+
+@atexit.register
+def shutdown_pools():
+    """Function to shut down the shared process pools and the manager, called when the process exits
+    """
+    global _manager
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(cancel_futures=True)
+        _pools.clear()
+        if _manager is not None:
+            _manager.shutdown()
+            _manager = None
+
+
+class ParallelSearch:
+    """Root-parallel iterative deepening, the moves of the root are searched in the tasks of a process pool
+
+    The first root move (the most central one) is searched alone with a full window, its score is then the lower
+    bound of the window of all the other root moves, which are searched in parallel. A move that beats the first
+    one gets its exact score, so the best move (the highest score, the most central column among equal scores)
+    and its score are the ones Solver.best_move finds at the same depth. The other moves do not get the bound of
+    the best move found so far as they would in the serial search, so the total work is larger and the speedup
+    is at most the number of columns.
+    """
+
+    def __init__(
+        self, rows: int = 6, cols: int = 7, connect: int = 4, heuristic: bool = False,
+        workers: int | None = None, executor: Executor | None = None,
+    ):
+        """Initialize the search
+
+        Args:
+            rows (int, optional): The number of rows of the board. Defaults to 6.
+            cols (int, optional): The number of columns of the board. Defaults to 7.
+            connect (int, optional): The number of tokens in a line needed to win. Defaults to 4.
+            heuristic (bool, optional): Whether the undecided positions are scored by an Evaluator. Defaults to False.
+            workers (int | None, optional): The number of processes of the shared pool. Defaults to the number of CPUs.
+            executor (Executor | None, optional): Executor used instead of the shared pool. Defaults to None.
+        """
+        self.solver = Solver(rows, cols, connect=connect)
+        self.shape = (rows, cols, connect)
+        self.heuristic = heuristic
+        self.executor = executor if executor is not None else shared_pool(workers or os.cpu_count() or 1)
+        self.stop: threading.Event | None = None
+        self.remote_stop: threading.Event | None = None
+
+    def collect(self, futures: list[Future]) -> list[float | None] | None:
+        """Helper function to wait for search tasks
+        If the stop event is set, the tasks that did not start are cancelled and the running ones are stopped
+        through remote_stop, the function returns once they are done so that the workers are free again
+
+        Args:
+            futures (list[Future]): The tasks
+
+        Returns:
+            list[float | None] | None: the results of the tasks, None if the search was stopped
+        """
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+            if self.stop is not None and self.stop.is_set():
+                for future in pending:
+                    future.cancel()
+                if self.remote_stop is not None:
+                    self.remote_stop.set()
+                    wait(pending)
+                    self.remote_stop.clear()
+                return None
+        return [future.result() for future in futures]
+
+    def search_root(
+        self, current: int, mask: int, depth: int, time_budget: float | None,
+    ) -> tuple[int, float] | None:
+        """Search all the moves of the position
+
+        Args:
+            current (int): The bitboard of the player to move
+            mask (int): The bitboard of all the tokens
+            depth (int): The number of moves to search
+            time_budget (float | None): The maximum search time in seconds
+
+        Returns:
+            tuple[int, float] | None: the best column and its score, None if the search was stopped
+        """
+        solver = self.solver
+        possible = (mask + solver.bottom) & solver.board_mask
+        winning = solver.winning_cells(current, mask) & possible
+        for col_n in solver.order:
+            if winning & solver.column_masks[col_n]:
+                return col_n, (solver.n_cells + 1 - mask.bit_count()) // 2
+
+        deadline = None if time_budget is None else time.perf_counter() + time_budget
+        first, *others = [col_n for col_n in solver.order if possible & solver.column_masks[col_n]]
+        args = (self.shape, self.heuristic, current, mask)
+        results = self.collect([
+            self.executor.submit(
+                search_move, *args, first, depth, -solver.n_cells, solver.n_cells, time_budget, self.remote_stop,
+            ),
+        ])
+        if results is None or results[0] is None:
+            return None
+        best = (first, results[0])
+
+        if deadline is not None:
+            time_budget = deadline - time.perf_counter()
+        alpha = best[1]
+        results = self.collect([
+            self.executor.submit(search_move, *args, col_n, depth, alpha, solver.n_cells, time_budget, self.remote_stop)
+            for col_n in others
+        ])
+        if results is None:
+            return None
+        for col_n, score in zip(others, results):
+            if score is None:
+                return None
+            if score > best[1]:
+                best = (col_n, score)
+        return best
+
+    def best_move(
+        self, current: int, mask: int, depth: int | None = None, time_budget: float | None = None,
+    ) -> tuple[int, float]:
+        """Iterative deepening search for the best move, see Solver.best_move
+        The first depth is always finished, the time budget only applies to the next ones
+
+        Args:
+            current (int): The bitboard of the player to move
+            mask (int): The bitboard of all the tokens
+            depth (int | None, optional): The maximum number of moves to search. Defaults to None.
+            time_budget (float | None, optional): The maximum search time in seconds. Defaults to None.
+
+        Returns:
+            tuple[int, float]: the best column and its score
+        """
+        solver = self.solver
+        if not (mask + solver.bottom) & solver.board_mask:
+            raise ValueError('There are no legal moves left')
+        if self.stop is not None and self.remote_stop is None:
+            self.remote_stop = shared_manager().Event()
+        deadline = None if time_budget is None else time.perf_counter() + time_budget
+
+        max_depth = solver.n_cells - mask.bit_count()
+        if depth is not None:
+            max_depth = min(depth, max_depth)
+
+        possible = (mask + solver.bottom) & solver.board_mask
+        best: tuple[int, float] = (next(col_n for col_n in solver.order if possible & solver.column_masks[col_n]), 0)
+        for search_depth in range(1, max_depth + 1):
+            remaining = None if deadline is None or search_depth == 1 else deadline - time.perf_counter()
+            if remaining is not None and remaining <= 0:
+                break
+            result = self.search_root(current, mask, search_depth, remaining)
+            if result is None:
+                break
+            best = result
+            if abs(best[1]) >= 1:
+                break
+        return best
+
+
+class ParallelNegamaxStrategy:
+    """Strategy for Game.make_move that plays the best move found by the root-parallel negamax search
+    Plays the same moves as NegamaxStrategy with the same depth
+    """
+
+    def __init__(
+        self, depth: int | None = None, time_budget: float | None = None, workers: int | None = None,
+        stop: threading.Event | None = None, heuristic: bool = False,
+    ):
+        """Initialize the strategy with its search budget
+
+        Args:
+            depth (int | None, optional): The maximum number of moves to search. Defaults to None.
+            time_budget (float | None, optional): The maximum search time in seconds. Defaults to None.
+            workers (int | None, optional): The number of processes. Defaults to the number of CPUs.
+            stop (threading.Event | None, optional): Event that stops the search from another thread,
+                                                     the best move found so far is then played. Defaults to None.
+            heuristic (bool, optional): Whether the positions that are not decided within the budget are scored
+                                        by an Evaluator instead of counting as draws. Defaults to False.
+        """
+        self.depth = depth
+        self.time_budget = time_budget
+        self.workers = workers
+        self.stop = stop
+        self.heuristic = heuristic
+        self.search: ParallelSearch | None = None
+
+    def __call__(self, game: Game, token_id: int) -> int:
+        """Pick a column for the given player
+
+        Args:
+            game (Game): The game to play in
+            token_id (int): The token ID of the player to move
+
+        Returns:
+            int: the column to play
+        """
+        if self.search is None or self.search.shape != (game.rows, game.cols, game.connect):
+            self.search = ParallelSearch(game.rows, game.cols, game.connect, self.heuristic, self.workers)
+        self.search.stop = self.stop
+        col_n, _ = self.search.best_move(*position(game, token_id), depth=self.depth, time_budget=self.time_budget)
+        return col_n
+
+
+def benchmark_positions(n_positions: int, n_moves: int, seed: int = 0) -> list[tuple[int, int]]:
+    """Function to create positions after random moves, without a winner
+
+    Args:
+        n_positions (int): The number of positions
+        n_moves (int): The number of tokens of every position
+        seed (int, optional): The seed of the random moves. Defaults to 0.
+
+    Returns:
+        list[tuple[int, int]]: the solver positions (current, mask)
+    """
+    rng = np.random.default_rng(seed)
+    positions: list[tuple[int, int]] = []
+    while len(positions) < n_positions:
+        game = Game()
+        for move_n in range(n_moves):
+            legal = game.legal_moves()
+            game.place_token(legal[rng.integers(len(legal))], move_n % 2 + 1)
+            if game.over:
+                break
+        if not game.over:
+            positions.append(position(game, n_moves % 2 + 1))
+    return positions
+
+
+def measure_speedup(
+    positions: list[tuple[int, int]], depth: int, worker_counts: list[int],
+) -> list[tuple[int, float, float, bool]]:
+    """Function to compare the time of the serial and the parallel search on a list of positions
+    Every run starts with empty transposition tables (a new solver or a new pool)
+
+    Args:
+        positions (list[tuple[int, int]]): The solver positions (current, mask)
+        depth (int): The search depth
+        worker_counts (list[int]): The numbers of processes to try
+
+    Returns:
+        list[tuple[int, float, float, bool]]: for the serial search (0 workers) then every number of workers,
+            the time in seconds, the speedup and whether the moves and scores match the serial search
+    """
+    solver = Solver()
+    start = time.perf_counter()
+    expected = [solver.best_move(current, mask, depth=depth) for current, mask in positions]
+    serial = time.perf_counter() - start
+    rows = [(0, serial, 1.0, True)]
+    for workers in worker_counts:
+        with ProcessPoolExecutor(workers) as pool:
+            search = ParallelSearch(workers=workers, executor=pool)
+            # Start the processes before the clock
+            list(pool.map(abs, range(workers)))
+            start = time.perf_counter()
+            results = [search.best_move(current, mask, depth=depth) for current, mask in positions]
+            elapsed = time.perf_counter() - start
+        rows.append((workers, elapsed, serial / elapsed, results == expected))
+    return rows
+
+
+def main(argv: list[str] | None = None):
+    """Command line entry point, e.g. python3 parallel.py --depth 12 --workers 1 2 4 8 16
+    """
+    parser = argparse.ArgumentParser(description='Measure the speedup of the root-parallel search')
+    parser.add_argument('--depth', type=int, default=10, help='search depth')
+    parser.add_argument('--positions', type=int, default=8, help='number of positions')
+    parser.add_argument('--moves', type=int, default=8, help='number of random moves of every position')
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help='numbers of processes to try (default: powers of 2 up to the number of CPUs)')
+    args = parser.parse_args(argv)
+
+    cpus = os.cpu_count() or 1
+    worker_counts = args.workers or sorted({2 ** n for n in range(cpus.bit_length()) if 2 ** n <= cpus} | {cpus})
+    positions = benchmark_positions(args.positions, args.moves)
+    print(f'{len(positions)} positions after {args.moves} moves, depth {args.depth}, {cpus} CPUs')
+    print(f'{"workers":>8} {"seconds":>9} {"speedup":>8}  same moves')
+    for workers, elapsed, speedup, same in measure_speedup(positions, args.depth, worker_counts):
+        print(f'{workers or "serial":>8} {elapsed:9.3f} {speedup:8.2f}  {"yes" if same else "NO"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+def random_policy(legal: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Function to pick a random legal column for many games at once, uniformly among the legal columns
+    The columns are sampled from the mask directly, there are no retries however few columns are left
+
+    Args:
+        legal (np.ndarray): (n_games, cols) boolean array of the columns that are not full
+        rng (np.random.Generator): The random number generator
+
+    Returns:
+        np.ndarray: (n_games,) array of columns, -1 for the games without legal columns
+    """
+    # argmax of random keys on the legal columns picks one legal column uniformly
+    col_ns = np.argmax(rng.random(legal.shape) * legal, axis=1)
+    col_ns[~legal.any(axis=1)] = -1
+    return col_ns
+
+
+def board_positions(boards: np.ndarray, token_ids: np.ndarray | int) -> tuple[np.ndarray, np.ndarray]:
+    """Function to convert boards to the bitboards of random_playouts, for boards of at most 64 bits
+
+    Args:
+        boards (np.ndarray): (n_games, rows, cols) array of boards shaped like Game.board
+        token_ids (np.ndarray | int): The token ID of the player to move of every board
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (n_games,) uint64 arrays of the bitboards of the player to move
+                                       and of all the tokens (layout of Game)
+    """
+    boards = np.asarray(boards)
+    n_games, rows, cols = boards.shape
+    if cols * (rows + 1) > 64:
+        raise ValueError('Random playouts only support boards with cols * (rows + 1) <= 64')
+    row_ns, col_ns = np.indices((rows, cols))
+    cells = (np.uint64(1) << (col_ns * (rows + 1) + rows - 1 - row_ns).astype(np.uint64)).ravel()
+    flat = boards.reshape(n_games, -1)
+    token_ids = np.asarray(token_ids).reshape(-1, 1)
+    current = np.where(flat == token_ids, cells, np.uint64(0)).sum(axis=1, dtype=np.uint64)
+    mask = np.where(flat != 0, cells, np.uint64(0)).sum(axis=1, dtype=np.uint64)
+    return current, mask
+
+
+def random_playouts(
+    current: np.ndarray, mask: np.ndarray, rows: int, cols: int, rng: np.random.Generator, connect: int = 4,
+) -> np.ndarray:
+    """Function to play many random games to the end at once
+    Games are uint64 bitboards with the layout of Game, all the games make one move per step (picked by
+    random_policy) and every step is a few numpy operations on all the unfinished games
+
+    Args:
+        current (np.ndarray): (n_games,) uint64 array of the bitboards of the player to move
+        mask (np.ndarray): (n_games,) uint64 array of the bitboards of all the tokens
+        rows (int): The number of rows of the board
+        cols (int): The number of columns of the board
+        rng (np.random.Generator): The random number generator
+        connect (int, optional): The number of tokens in a line needed to win. Defaults to 4.
+
+    Returns:
+        np.ndarray: the result of every game, 1 if the player to move at the start won, 2 if the other player won
+                    and 0 for a draw
+    """
+    col_bits = rows + 1
+    if cols * col_bits > 64:
+        raise ValueError('Random playouts only support boards with cols * (rows + 1) <= 64')
+    bottom = np.array([1 << col_n*col_bits for col_n in range(cols)], dtype=np.uint64)
+    tops = bottom << np.uint64(rows - 1)
+    column_masks = bottom * np.uint64((1 << rows) - 1)
+    # A run of n tokens and the same run shifted by m <= n make a run of n + m tokens,
+    # so a line of connect tokens takes about log2(connect) steps per direction
+    steps = []
+    length = 1
+    while length < connect:
+        steps.append(min(length, connect - length))
+        length += steps[-1]
+    shifts = [[np.uint64(step * shift) for step in steps] for shift in (1, col_bits - 1, col_bits, col_bits + 1)]
+
+    current = np.array(current, dtype=np.uint64)
+    mask = np.array(mask, dtype=np.uint64)
+    n_games = len(current)
+    results = np.zeros(n_games, dtype=np.int8)
+    players = np.ones(n_games, dtype=np.int8)
+
+    active = np.arange(n_games)
+    while active.size:
+        active_mask = mask[active]
+        col_n = random_policy((active_mask[:, None] & tops) == 0, rng)
+        # Games without legal moves are draws
+        playable = col_n >= 0
+        if not playable.all():
+            active, active_mask, col_n = active[playable], active_mask[playable], col_n[playable]
+            if not active.size:
+                break
+
+        move = (active_mask + bottom[col_n]) & column_masks[col_n]
+        active_current = current[active]
+        stones = active_current | move
+
+        won = np.zeros(len(active), dtype=bool)
+        for direction_shifts in shifts:
+            runs = stones
+            for shift in direction_shifts:
+                runs = runs & (runs >> shift)
+            won |= runs != 0
+
+        player = players[active]
+        results[active[won]] = player[won]
+        # The other player moves next
+        current[active] = active_current ^ active_mask
+        mask[active] = active_mask | move
+        players[active] = 3 - player
+        active = active[~won]
+
+    return results
@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+import os
+import struct
+from typing import Any
+from typing import Iterator
+from typing import NamedTuple
+
+import numpy as np
+
+from game import Game
+
+# File layout: header, then one record per game. A record is a record header, the columns played packed
+# two per byte (low nibble first) or one per byte for boards with more than 16 columns, then the metadata
+# as compact JSON (no bytes if there is none). A 20-move game of the 6x7 board takes 19 bytes.
+MAGIC = b'C4GR'
+VERSION = 1
+HEADER = struct.Struct('<4sB')
+RECORD = struct.Struct('<BBBBBHH')  # rows, cols, connect, result, flags, number of moves, metadata size
+BYTE_MOVES = 1  # flag of the records with one column per byte
+UNFINISHED = 255  # result of the games that were stopped before the end
+
+
+class GameRecord(NamedTuple):
+    """Game read from a record file
+    - result: the winner (0 for a draw), UNFINISHED if the game was stopped before the end
+    """
+    moves: np.ndarray
+    result: int
+    rows: int
+    cols: int
+    connect: int
+    metadata: dict[str, Any]
+
+    def replay(self) -> Game:
+        """Function to play the moves of the record on a new game, player 1 starts
+
+        Returns:
+            Game: the game after the moves
+        """
+        game = Game(self.rows, self.cols, self.connect)
+        for move_n, col_n in enumerate(self.moves.tolist()):
+            game.place_token(col_n, move_n % 2 + 1)
+        return game
+
+
+def pack_moves(moves: np.ndarray, cols: int) -> tuple[int, bytes]:
+    """Helper function to pack the columns of a game
+
+    Args:
+        moves (np.ndarray): The columns played
+        cols (int): The number of columns of the board
+
+    Returns:
+        tuple[int, bytes]: the flags of the record and the packed columns
+    """
+    moves = np.asarray(moves, dtype=np.uint8)
+    if cols > 16:
+        return BYTE_MOVES, moves.tobytes()
+    if len(moves) % 2:
+        moves = np.append(moves, np.uint8(0))
+    return 0, (moves[0::2] | moves[1::2] << 4).tobytes()
+
+
+def unpack_moves(data: bytes | memoryview, flags: int, n_moves: int) -> np.ndarray:
+    """Helper function to unpack the columns of a game packed by pack_moves
+
+    Args:
+        data (bytes | memoryview): The packed columns
+        flags (int): The flags of the record
+        n_moves (int): The number of moves
+
+    Returns:
+        np.ndarray: the columns played (uint8)
+    """
+    packed = np.frombuffer(data, dtype=np.uint8)
+    if flags & BYTE_MOVES:
+        return packed.copy()
+    moves = np.empty(2 * len(packed), dtype=np.uint8)
+    moves[0::2] = packed & 0xF
+    moves[1::2] = packed >> 4
+    return moves[:n_moves]
+
+
+def records_end(path: str) -> int:
+    """Helper function to find the end of the last complete record of a record file
+
+    Args:
+        path (str): The path of the record file
+
+    Returns:
+        int: the size of the file without its incomplete last record
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= HEADER.size:
+            return size
+        with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as data:
+            end = HEADER.size
+            for _, end in record_spans(data, size):
+                pass
+            return end
+
+
+def record_spans(data: mmap.mmap, size: int) -> Iterator[tuple[int, int]]:
+    """Helper function to iterate over the complete records of a mapped record file
+
+    Args:
+        data (mmap.mmap): The file
+        size (int): The size of the file
+
+    Yields:
+        tuple[int, int]: the offset of the record and the offset of the next one
+    """
+    offset = HEADER.size
+    while offset + RECORD.size <= size:
+        _, _, _, _, flags, n_moves, meta_size = RECORD.unpack_from(data, offset)
+        moves_size = n_moves if flags & BYTE_MOVES else (n_moves + 1) // 2
+        end = offset + RECORD.size + moves_size + meta_size
+        if end > size:
+            return
+        yield offset, end
+        offset = end
+
+
+class GameWriter:
+    """Append-only writer of a record file
+    Records are only added at the end of the file, so files can be written while they are read
+    and a write stopped halfway only leaves an incomplete last record, which readers skip.
+    The writer cuts that record off when it opens the file, so the games it adds stay readable.
+    """
+
+    def __init__(self, path: str):
+        """Open a record file to add games, the file is created if needed
+
+        Args:
+            path (str): The path of the record file
+        """
+        self.path = path
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(MAGIC, VERSION))
+        else:
+            with open(path, 'rb') as f:
+                check_header(f.read(HEADER.size), path)
+            end = records_end(path)
+            if end < self.file.tell():
+                self.file.truncate(end)
+
+    def __enter__(self) -> GameWriter:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def write(
+        self, moves: list[int] | np.ndarray, result: int, rows: int = 6, cols: int = 7, connect: int = 4,
+        metadata: dict[str, Any] | None = None,
+    ):
+        """Add a game to the file
+
+        Args:
+            moves (list[int] | np.ndarray): The columns played, player 1 starts
+            result (int): The winner (0 for a draw), UNFINISHED if the game was stopped before the end
+            rows (int, optional): The number of rows of the board. Defaults to 6.
+            cols (int, optional): The number of columns of the board. Defaults to 7.
+            connect (int, optional): The number of tokens in a line needed to win. Defaults to 4.
+            metadata (dict[str, Any] | None, optional): JSON data saved with the game (players, date, ...).
+                                                        Defaults to None.
+        """
+        if len(moves) > 0xFFFF or max(rows, cols, connect) > 0xFF:
+            raise ValueError('Records only fit games of at most 65535 moves on boards of at most 255 rows and columns')
+        flags, packed = pack_moves(np.asarray(moves), cols)
+        meta = json.dumps(metadata, separators=(',', ':')).encode() if metadata else b''
+        self.file.write(RECORD.pack(rows, cols, connect, result, flags, len(moves), len(meta)) + packed + meta)
+
+    def write_game(self, game: Game, metadata: dict[str, Any] | None = None):
+        """Add the moves of a game to the file, from its history
+
+        Args:
+            game (Game): The game, player 1 starts
+            metadata (dict[str, Any] | None, optional): JSON data saved with the game. Defaults to None.
+        """
+        result = game.winner if game.over else UNFINISHED
+        moves = [col_n for col_n, _ in game.history]
+        self.write(moves, result, game.rows, game.cols, game.connect, metadata)
+
+
+def check_header(data: bytes, path: str):
+    """Helper function to check the header of a record file
+
+    Args:
+        data (bytes): The first bytes of the file
+        path (str): The path of the file, for the error message
+    """
+    if len(data) < HEADER.size or HEADER.unpack(data[:HEADER.size]) != (MAGIC, VERSION):
+        raise ValueError(f'{path} is not a version {VERSION} game record file')
+
+
+class GameReader:
+    """Streaming reader of a record file
+    The file is mapped in memory and the records are decoded one at a time, so files of any size can
+    be scanned without loading them.
+    """
+
+    def __init__(self, path: str):
+        """Open a record file
+
+        Args:
+            path (str): The path of the record file
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            check_header(f.read(HEADER.size), path)
+
+    def __iter__(self) -> Iterator[GameRecord]:
+        """Iterate over the games of the file, in the order they were written
+        Only the games written before the iteration started are read, an incomplete last record is skipped
+        """
+        with open(self.path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= HEADER.size:
+                return
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as data:
+                for offset, end in record_spans(data, size):
+                    rows, cols, connect, result, flags, n_moves, meta_size = RECORD.unpack_from(data, offset)
+                    start = offset + RECORD.size
+                    moves_end = end - meta_size
+                    moves = unpack_moves(data[start:moves_end], flags, n_moves)
+                    metadata = json.loads(data[moves_end:end]) if meta_size else {}
+                    yield GameRecord(moves, result, rows, cols, connect, metadata)
+
+    def positions(self) -> Iterator[tuple[Game, int, GameRecord]]:
+        """Iterate over the positions of all the games, before every move
+        The same Game object is updated from one move to the next, copy it to keep a position
+
+        Returns:
+            Iterator[tuple[Game, int, GameRecord]]: the game before the move, the column played and the record
+        """
+        for record in self:
+            game = Game(record.rows, record.cols, record.connect)
+            for move_n, col_n in enumerate(record.moves.tolist()):
+                yield game, col_n, record
+                game.place_token(col_n, move_n % 2 + 1)
+
+
+def main(argv: list[str] | None = None):
+    """Command line entry point, e.g. python3 records.py games.rec
+    """
+    parser = argparse.ArgumentParser(description='Summarize a game record file')
+    parser.add_argument('path', help='path of the record file')
+    args = parser.parse_args(argv)
+
+    n_games = n_moves = 0
+    outcomes = {0: 0, 1: 0, 2: 0, UNFINISHED: 0}
+    for record in GameReader(args.path):
+        n_games += 1
+        n_moves += len(record.moves)
+        outcomes[record.result] = outcomes.get(record.result, 0) + 1
+    size = os.path.getsize(args.path)
+    print(f'{n_games} games, {n_moves} moves, {size} bytes ({size / max(n_games, 1):.1f} bytes/game)')
+    print(f'player 1 wins: {outcomes[1]}, player 2 wins: {outcomes[2]}, draws: {outcomes[0]}, '
+          f'unfinished: {outcomes[UNFINISHED]}')
+
+
+if __name__ == '__main__':
+    main()
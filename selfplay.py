@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+from typing import Callable
+from typing import NamedTuple
+
+import numpy as np
+
+from game import Game
+from records import GameWriter
+from strategies import make_strategy
+from strategies import parse_spec
+
+Spec = tuple[str, dict[str, Any]]
+
+
+class GameResult(NamedTuple):
+    """Result of one game: the winner (0 for a draw), the columns played and the think time of both players
+    """
+    winner: int
+    moves: list[int]
+    think_times: tuple[float, float]
+
+
+def play_game(strategies: tuple[Callable[[Game, int], int], Callable[[Game, int], int]]) -> GameResult:
+    """Function to play a game between two strategies, player 1 starts
+
+    Args:
+        strategies (tuple[Callable[[Game, int], int], Callable[[Game, int], int]]): The strategies of player 1 and 2
+
+    Returns:
+        GameResult: the result of the game
+    """
+    game = Game()
+    token_id = 1
+    moves = []
+    think_times = [0.0, 0.0]
+    while not game.over:
+        start = time.perf_counter()
+        row_n, col_n = game.make_move(strategies[token_id-1], token_id)
+        think_times[token_id-1] += time.perf_counter() - start
+        if row_n == -1:
+            raise ValueError(f'Player {token_id} tried to play in a full column')
+        moves.append(col_n)
+        token_id = 3 - token_id
+    return GameResult(game.winner, moves, (think_times[0], think_times[1]))
+
+
+def play_games(players: tuple[Spec, Spec], seed: int, game_ns: range) -> list[GameResult]:
+    """Function to play a range of games, the strategies are created again for every game
+    Every game gets its own seeds derived from seed and the game number,
+    so results do not depend on how the games are split between processes
+
+    Args:
+        players (tuple[Spec, Spec]): The name and configuration of the strategies of player 1 and 2
+        seed (int): The seed of the whole run
+        game_ns (range): The numbers of the games to play
+
+    Returns:
+        list[GameResult]: the results of the games
+    """
+    results = []
+    for game_n in game_ns:
+        seeds = np.random.SeedSequence([seed, game_n]).generate_state(2)
+        strategies = (
+            make_strategy(*players[0], seed=int(seeds[0])),
+            make_strategy(*players[1], seed=int(seeds[1])),
+        )
+        results.append(play_game(strategies))
+    return results
+
+
+@dataclass
+class SelfPlayReport:
+    """Summary of a self-play run
+    - outcomes: the number of games won by player 1 and 2 and the number of draws (key 0)
+    - lengths: histogram of the number of moves per game (lengths[n] games lasted n moves)
+    - think_times: total think time of player 1 and 2 in seconds
+    """
+    n_games: int
+    n_moves: int
+    elapsed: float
+    outcomes: dict[int, int]
+    lengths: np.ndarray
+    think_times: tuple[float, float]
+
+    @property
+    def games_per_sec(self) -> float:
+        return self.n_games / self.elapsed if self.elapsed else float('inf')
+
+    @property
+    def moves_per_sec(self) -> float:
+        return self.n_moves / self.elapsed if self.elapsed else float('inf')
+
+    def summary(self) -> str:
+        """Function to format the report for the terminal
+
+        Returns:
+            str: the report
+        """
+        lines = [
+            f'{self.n_games} games, {self.n_moves} moves in {self.elapsed:.2f} s',
+            f'{self.games_per_sec:.1f} games/s, {self.moves_per_sec:.1f} moves/s',
+            f'player 1 wins: {self.outcomes[1]}, player 2 wins: {self.outcomes[2]}, draws: {self.outcomes[0]}',
+            'game lengths:',
+        ]
+        biggest = max(self.lengths.max(), 1)
+        for length in np.nonzero(self.lengths)[0]:
+            bar = '#' * int(np.ceil(40 * self.lengths[length] / biggest))
+            lines.append(f'{length:4d} {self.lengths[length]:8d} {bar}')
+        return '\n'.join(lines)
+
+
+def run_selfplay(
+    player1: Spec, player2: Spec, n_games: int, seed: int = 0,
+    workers: int | None = None, chunk_size: int | None = None, record: str | None = None,
+) -> SelfPlayReport:
+    """Function to play many games between two strategies across a process pool
+
+    Args:
+        player1 (Spec): The name and configuration of the strategy of player 1
+        player2 (Spec): The name and configuration of the strategy of player 2
+        n_games (int): The number of games to play
+        seed (int, optional): The seed of the run. Defaults to 0.
+        workers (int | None, optional): The number of processes, 1 plays in this process.
+                                        Defaults to the number of CPUs.
+        chunk_size (int | None, optional): The number of games sent to a process at once.
+                                           Defaults to about 4 chunks per process.
+        record (str | None, optional): Path of a record file (see records.py) the games are added to,
+                                       with the players, the seed and the game number. Defaults to None.
+
+    Returns:
+        SelfPlayReport: the summary of the games
+    """
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(1, min(256, n_games // (4 * workers)))
+    chunks = [range(start, min(start + chunk_size, n_games)) for start in range(0, n_games, chunk_size)]
+    players = (player1, player2)
+
+    start = time.perf_counter()
+    if workers == 1:
+        results = [play_games(players, seed, chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(play_games, [players] * len(chunks), [seed] * len(chunks), chunks))
+    elapsed = time.perf_counter() - start
+
+    if record is not None:
+        with GameWriter(record) as writer:
+            for game_n, result in enumerate(result for chunk_results in results for result in chunk_results):
+                metadata = {'players': [player1, player2], 'seed': seed, 'game': game_n}
+                writer.write(result.moves, result.winner, metadata=metadata)
+
+    empty = Game()
+    outcomes = {0: 0, 1: 0, 2: 0}
+    lengths = np.zeros(empty.rows * empty.cols + 1, dtype=np.int64)
+    think_times = [0.0, 0.0]
+    for result in (result for chunk_results in results for result in chunk_results):
+        outcomes[result.winner] += 1
+        lengths[len(result.moves)] += 1
+        think_times[0] += result.think_times[0]
+        think_times[1] += result.think_times[1]
+
+    return SelfPlayReport(
+        n_games=n_games,
+        n_moves=int(np.dot(np.arange(len(lengths)), lengths)),
+        elapsed=elapsed,
+        outcomes=outcomes,
+        lengths=lengths,
+        think_times=(think_times[0], think_times[1]),
+    )
+
+
+def main(argv: list[str] | None = None):
+    """Command line entry point, e.g. python3 selfplay.py --games 1000 --player2 negamax:depth=4
+    """
+    parser = argparse.ArgumentParser(description='Play games between two strategies without a display')
+    parser.add_argument('--player1', default='random', help='strategy of player 1, e.g. negamax:depth=4')
+    parser.add_argument('--player2', default='random', help='strategy of player 2')
+    parser.add_argument('--games', type=int, default=1000, help='number of games to play')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the run')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all CPUs)')
+    parser.add_argument('--record', default=None, help='record file the games are added to')
+    args = parser.parse_args(argv)
+
+    report = run_selfplay(
+        parse_spec(args.player1), parse_spec(args.player2), args.games, seed=args.seed, workers=args.workers,
+        record=args.record,
+    )
+    print(report.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Executor
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any
+from typing import Callable
+
+from endgame import EndgameCache
+from endgame import load_default_endgame
+from game import Game
+from strategies import make_strategy
+from strategies import parse_spec
+
+# Strategies of the worker process, created on first use and kept to reuse their tables
+_worker_strategies: dict[str, Callable[[Game, int], int]] = {}
+
+
+class AIError(Exception):
+    """Raised when the move of the AI could not be computed, the request gets an error response
+    """
+
+
+@lru_cache(maxsize=None)
+def worker_endgame() -> EndgameCache | None:
+    """Function to open the endgame cache once per worker process, the workers share the file
+
+    Returns:
+        EndgameCache | None: the cache, None if it was not created
+    """
+    return load_default_endgame()
+
+
+def replay(moves: list[int]) -> Game:
+    """Function to rebuild a game from its moves, player 1 starts and players alternate
+
+    Args:
+        moves (list[int]): The columns played
+
+    Returns:
+        Game: the game after the moves
+    """
+    game = Game()
+    for move_n, col_n in enumerate(moves):
+        game.place_token(col_n, move_n % 2 + 1)
+    return game
+
+
+def ai_move(spec: str, moves: list[int]) -> int:
+    """Function run in the worker pool to pick the move of the AI
+
+    Args:
+        spec (str): The strategy of the AI, e.g. negamax:depth=4
+        moves (list[int]): The columns played so far
+
+    Returns:
+        int: the column of the AI
+    """
+    if spec not in _worker_strategies:
+        _worker_strategies[spec] = make_strategy(*parse_spec(spec))
+    game = replay(moves)
+    game.endgame = worker_endgame()
+    col_n = game.choose_move(_worker_strategies[spec], len(moves) % 2 + 1)
+    if col_n is None:
+        raise ValueError(f'The strategy {spec!r} did not pick a column')
+    return col_n
+
+
+class Session:
+    """A game hosted by the server
+    """
+    __slots__ = ('game', 'moves', 'ai_token', 'last_active', 'lock')
+
+    def __init__(self, ai_token: int):
+        self.game = Game()
+        self.moves: list[int] = []
+        self.ai_token = ai_token
+        self.last_active = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def state(self) -> dict[str, Any]:
+        """Function to describe the game for a response
+
+        Returns:
+            dict[str, Any]: the moves, the legal columns, the winner and whether the game is over
+        """
+        return {
+            'moves': self.moves,
+            'legal': self.game.legal_moves(),
+            'winner': self.game.winner,
+            'over': self.game.over,
+        }
+
+    def play(self, col_n: int):
+        """Function to play a move for the player to move
+
+        Args:
+            col_n (int): The column to play
+        """
+        if self.game.over:
+            raise ValueError('the game is over')
+        # bool is a subclass of int, but true and false are not columns
+        if (
+            isinstance(col_n, bool) or not isinstance(col_n, int)
+            or not 0 <= col_n < self.game.cols or not self.game.legal >> col_n & 1
+        ):
+            raise ValueError(f'illegal column {col_n!r}')
+        self.game.place_token(col_n, len(self.moves) % 2 + 1)
+        self.moves.append(col_n)
+
+    def undo(self):
+        """Function to take back the last move
+        """
+        self.game.undo_move()
+        self.moves.pop()
+
+
+class GameServer:
+    """Asyncio server hosting many games over TCP with a line-delimited JSON protocol
+
+    Every request is one JSON object per line, every response is one JSON object per line
+    with "ok" (and "error" if ok is false). An optional "id" in the request is sent back.
+    - {"op": "new", "ai_first": false}: create a session, the AI plays first if ai_first
+    - {"op": "move", "session": ..., "col": 3}: play a column, the AI replies with "ai_col"
+    - {"op": "state", "session": ...}: get the state of a session
+    - {"op": "close", "session": ...}: end a session
+    Responses about a session contain "session", "moves", "legal", "winner" and "over".
+
+    The moves of the AI are computed in a worker pool, off the event loop. Sessions that are idle
+    for idle_timeout seconds are evicted and at most max_sessions sessions are hosted at once.
+    """
+
+    def __init__(
+        self, strategy: str = 'negamax:depth=4', workers: int | None = None, idle_timeout: float = 300.0,
+        max_sessions: int = 10000, executor: Executor | None = None,
+    ):
+        """Initialize the server
+
+        Args:
+            strategy (str, optional): The strategy of the AI. Defaults to 'negamax:depth=4'.
+            workers (int | None, optional): The number of worker processes. Defaults to the number of CPUs.
+            idle_timeout (float, optional): Seconds after which an idle session is evicted. Defaults to 300.0.
+            max_sessions (int, optional): The maximum number of sessions. Defaults to 10000.
+            executor (Executor | None, optional): Executor used instead of a new process pool. Defaults to None.
+        """
+        parse_spec(strategy)
+        self.strategy = strategy
+        self.executor = executor if executor is not None else ProcessPoolExecutor(workers or os.cpu_count())
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.sessions: OrderedDict[str, Session] = OrderedDict()
+        self.server: asyncio.Server | None = None
+        self.evict_task: asyncio.Task | None = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765) -> asyncio.Server:
+        """Start listening and evicting idle sessions
+
+        Args:
+            host (str, optional): The address to listen on. Defaults to '127.0.0.1'.
+            port (int, optional): The port to listen on (0 picks a free port). Defaults to 8765.
+
+        Returns:
+            asyncio.Server: the listening server
+        """
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        self.evict_task = asyncio.create_task(self.evict_loop())
+        return self.server
+
+    async def close(self):
+        """Stop listening, stop evicting sessions and shut the worker pool down
+        """
+        if self.evict_task is not None:
+            self.evict_task.cancel()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def evict_loop(self):
+        """Evict idle sessions every quarter of the idle timeout
+        """
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 4, 0.01))
+            self.evict_idle()
+
+    def evict_idle(self, now: float | None = None) -> int:
+        """Function to remove the sessions idle for more than idle_timeout
+        Sessions are kept from least to most recently used, so only the idle ones are looked at
+
+        Args:
+            now (float | None, optional): The current time.monotonic(). Defaults to None.
+
+        Returns:
+            int: the number of evicted sessions
+        """
+        now = time.monotonic() if now is None else now
+        evicted = 0
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if now - session.last_active < self.idle_timeout or session.lock.locked():
+                break
+            del self.sessions[session_id]
+            evicted += 1
+        return evicted
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answer the requests of a connection until it is closed
+
+        Args:
+            reader (asyncio.StreamReader): The stream of requests
+            writer (asyncio.StreamWriter): The stream of responses
+        """
+        try:
+            while line := await reader.readline():
+                response = await self.handle_line(line)
+                writer.write(json.dumps(response, separators=(',', ':')).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_line(self, line: bytes) -> dict[str, Any]:
+        """Function to answer one request
+
+        Args:
+            line (bytes): The JSON request
+
+        Returns:
+            dict[str, Any]: the response
+        """
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('the request should be a JSON object')
+        except ValueError as error:
+            return {'ok': False, 'error': f'invalid request: {error}'}
+
+        try:
+            response = await self.handle_request(request)
+        except (KeyError, ValueError, AIError) as error:
+            response = {'ok': False, 'error': str(error.args[0]) if error.args else type(error).__name__}
+        if 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    async def handle_request(self, request: dict[str, Any]) -> dict[str, Any]:
+        """Function to run the operation of a request
+
+        Args:
+            request (dict[str, Any]): The request
+
+        Returns:
+            dict[str, Any]: the response
+        """
+        op = request.get('op')
+        if op == 'new':
+            return await self.new_session(bool(request.get('ai_first')))
+
+        if op not in ('move', 'state', 'close'):
+            raise ValueError(f'unknown op {op!r}')
+        session_id = request.get('session')
+        if not isinstance(session_id, str) or session_id not in self.sessions:
+            raise KeyError(f'unknown session {session_id!r}')
+        session = self.sessions[session_id]
+        session.last_active = time.monotonic()
+        self.sessions.move_to_end(session_id)
+
+        if op == 'close':
+            del self.sessions[session_id]
+            return {'ok': True, 'session': session_id}
+        if op == 'state':
+            return {'ok': True, 'session': session_id, **session.state()}
+
+        async with session.lock:
+            session.play(request.get('col'))  # type: ignore[arg-type]
+            try:
+                ai_col = await self.play_ai(session)
+            except AIError:
+                # Take the move back, so the player can send it again
+                session.undo()
+                raise
+        return {'ok': True, 'session': session_id, 'ai_col': ai_col, **session.state()}
+
+    async def new_session(self, ai_first: bool) -> dict[str, Any]:
+        """Function to create a session, evicting idle sessions if the server is full
+
+        Args:
+            ai_first (bool): Whether the AI plays first
+
+        Returns:
+            dict[str, Any]: the response
+        """
+        if len(self.sessions) >= self.max_sessions:
+            self.evict_idle()
+        if len(self.sessions) >= self.max_sessions:
+            raise ValueError('too many sessions')
+        session_id = uuid.uuid4().hex
+        session = Session(ai_token=1 if ai_first else 2)
+        self.sessions[session_id] = session
+        try:
+            ai_col = await self.play_ai(session) if ai_first else None
+        except AIError:
+            del self.sessions[session_id]
+            raise
+        return {'ok': True, 'session': session_id, 'ai_col': ai_col, **session.state()}
+
+    async def play_ai(self, session: Session) -> int | None:
+        """Function to play the move of the AI of a session in the worker pool
+        Raises AIError if the worker failed or returned an illegal column
+
+        Args:
+            session (Session): The session
+
+        Returns:
+            int | None: the column of the AI, None if the game is over
+        """
+        if session.game.over:
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            col_n = await loop.run_in_executor(self.executor, ai_move, self.strategy, list(session.moves))
+            session.play(col_n)
+        except Exception as error:
+            raise AIError(f'the AI failed: {error}') from error
+        session.last_active = time.monotonic()
+        return col_n
+
+
+async def serve(host: str, port: int, **kwargs):
+    """Run a server until it is cancelled
+
+    Args:
+        host (str): The address to listen on
+        port (int): The port to listen on
+        kwargs: The arguments of GameServer
+    """
+    game_server = GameServer(**kwargs)
+    server = await game_server.start(host, port)
+    print(f'Serving on {", ".join(str(sock.getsockname()) for sock in server.sockets)}')
+    try:
+        await server.serve_forever()
+    finally:
+        await game_server.close()
+
+
+def main(argv: list[str] | None = None):
+    """Command line entry point, e.g. python3 server.py --port 8765 --strategy negamax:depth=4
+    """
+    parser = argparse.ArgumentParser(description='Host games over TCP with a line-delimited JSON protocol')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on')
+    parser.add_argument('--strategy', default='negamax:depth=4', help='strategy of the AI')
+    parser.add_argument('--workers', type=int, default=None, help='number of AI processes (default: all CPUs)')
+    parser.add_argument('--idle-timeout', type=float, default=300.0, help='seconds before an idle session is evicted')
+    parser.add_argument('--max-sessions', type=int, default=10000, help='maximum number of sessions')
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(
+            args.host, args.port, strategy=args.strategy, workers=args.workers,
+            idle_timeout=args.idle_timeout, max_sessions=args.max_sessions,
+        ))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,479 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from evaluator import Evaluator
+from game import Game
+
+if TYPE_CHECKING:
+    from nn import NetworkEvaluator
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+
+class SearchAborted(Exception):
+    """Raised inside the search when the node or time budget is used up
+    """
+
+
+def position(game: Game, token_id: int) -> tuple[int, int]:
+    """Helper function to get the solver position of a game
+
+    Args:
+        game (Game): The game to convert
+        token_id (int): The token ID of the player to move
+
+    Returns:
+        tuple[int, int]: the bitboard of the player to move and the bitboard of all the tokens
+    """
+    return game.bitboards[token_id-1], game.bitboards[0] | game.bitboards[1]
+
+
+class Solver:
+    """Negamax solver with alpha-beta pruning, center-first move ordering and a transposition table
+
+    Positions are given as two bitboards with the layout of Game: current holds the tokens of the player
+    to move and mask holds all the tokens. Scores are from the point of view of the player to move:
+    a win with the player's n-th last token left scores n, a loss scores -n and 0 is a draw or
+    a position that could not be decided within the search depth.
+
+    With an evaluator, the positions that could not be decided within the search depth get its
+    heuristic score scaled between -1 and 1 instead of 0, the evaluator is updated with every move of the search.
+    """
+
+    def __init__(
+        self, rows: int = 6, cols: int = 7, max_table_size: int = 1 << 20, connect: int = 4,
+        evaluator: Evaluator | NetworkEvaluator | None = None,
+    ):
+        """Initialize the solver for a board size with an empty transposition table
+
+        Args:
+            rows (int, optional): The number of rows of the board. Defaults to 6.
+            cols (int, optional): The number of columns of the board. Defaults to 7.
+            max_table_size (int, optional): The number of positions after which the transposition table
+                                            is cleared. Defaults to 1 << 20.
+            connect (int, optional): The number of tokens in a line needed to win. Defaults to 4.
+            evaluator (Evaluator | NetworkEvaluator | None, optional): The evaluation of the undecided positions.
+                                                                 Defaults to None.
+        """
+        self.rows = rows
+        self.cols = cols
+        self.connect = connect
+        self.col_bits = rows + 1
+        self.n_cells = rows * cols
+        self.bottom = sum(1 << col_n*self.col_bits for col_n in range(cols))
+        self.board_mask = self.bottom * ((1 << rows) - 1)
+        self.column_masks = [((1 << rows) - 1) << col_n*self.col_bits for col_n in range(cols)]
+        self.order = sorted(range(cols), key=lambda col_n: abs(2*col_n - (cols-1)))
+        if connect == 4:
+            # Unrolled version of winning_cells, about twice as fast in the search
+            self.winning_cells = self.winning_cells_4  # type: ignore[method-assign]
+
+        self.table: dict[int, tuple[int, int, float, int]] = {}
+        self.max_table_size = max_table_size
+        self.nodes = 0
+        self.max_nodes: int | None = None
+        self.deadline: float | None = None
+        self.can_abort = False
+        self.aborted = False
+        self.stop: threading.Event | None = None
+        self.evaluator = evaluator
+
+    def winning_cells(self, current: int, mask: int) -> int:
+        """Function to get the empty cells that would complete a line of connect tokens for the player
+        For every direction, a cell completes a line when the player has a tokens on one side of it
+        and connect - 1 - a tokens on the other side
+
+        Args:
+            current (int): The bitboard of the player
+            mask (int): The bitboard of all the tokens
+
+        Returns:
+            int: bitboard of the winning cells (playable or not)
+        """
+        length = self.connect - 1
+        # Vertical lines can only be completed on top
+        cells = current << 1
+        for distance in range(2, length + 1):
+            cells &= current << distance
+        for shift in (self.col_bits - 1, self.col_bits, self.col_bits + 1):
+            # below[n] (above[n]) has the cells with n + 1 tokens of the player right before (after) them
+            below = [current << shift]
+            above = [current >> shift]
+            for distance in range(2, length + 1):
+                below.append(below[-1] & (current << distance*shift))
+                above.append(above[-1] & (current >> distance*shift))
+            cells |= below[-1] | above[-1]
+            for n_below in range(1, length):
+                cells |= below[n_below - 1] & above[length - n_below - 1]
+        return cells & (self.board_mask ^ mask)
+
+    def winning_cells_4(self, current: int, mask: int) -> int:
+        """Function to get the empty cells that would complete a line of 4 for the player, see winning_cells
+
+        Args:
+            current (int): The bitboard of the player
+            mask (int): The bitboard of all the tokens
+
+        Returns:
+            int: bitboard of the winning cells (playable or not)
+        """
+        cells = (current << 1) & (current << 2) & (current << 3)
+        for shift in (self.col_bits - 1, self.col_bits, self.col_bits + 1):
+            pair = (current << shift) & (current << 2*shift)
+            cells |= pair & (current << 3*shift)
+            cells |= pair & (current >> shift)
+            pair = (current >> shift) & (current >> 2*shift)
+            cells |= pair & (current << shift)
+            cells |= pair & (current >> 3*shift)
+        return cells & (self.board_mask ^ mask)
+
+    def non_losing_moves(self, current: int, mask: int, possible: int) -> int:
+        """Function to remove the moves that let the opponent win right away
+
+        Args:
+            current (int): The bitboard of the player to move
+            mask (int): The bitboard of all the tokens
+            possible (int): Bitboard of the playable cells
+
+        Returns:
+            int: bitboard of the playable cells that do not lose right away (0 if all moves lose)
+        """
+        opponent_wins = self.winning_cells(current ^ mask, mask)
+        forced = possible & opponent_wins
+        if forced:
+            # The opponent has two winning cells, one of them can't be blocked
+            if forced & (forced - 1):
+                return 0
+            possible = forced
+        # Playing right below a winning cell of the opponent lets them play there
+        return possible & ~(opponent_wins >> 1)
+
+    @staticmethod
+    def table_bounds(entry: tuple[int, int, float, int], alpha: float, beta: float) -> tuple[float, float]:
+        """Function to narrow a search window with a transposition table entry
+
+        Args:
+            entry (tuple[int, int, float, int]): The entry (depth, flag, value, best column)
+            alpha (float): The lower bound of the search window
+            beta (float): The upper bound of the search window
+
+        Returns:
+            tuple[float, float]: the new window (empty if the entry gives the score of the position)
+        """
+        _, flag, value, _ = entry
+        if flag == EXACT:
+            return value, value
+        if flag == LOWER:
+            return max(alpha, value), beta
+        return alpha, min(beta, value)
+
+    def check_budget(self):
+        """Raise SearchAborted if the stop event is set or if the node or time budget is used up
+        (the budget is only checked once the first search depth is finished)
+        """
+        if self.stop is not None and self.stop.is_set():
+            raise SearchAborted
+        if not self.can_abort:
+            return
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            raise SearchAborted
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchAborted
+
+    def probe(self, key: int, depth: int, alpha: float, beta: float) -> tuple[int, float, float, float | None]:
+        """Function to look up a position in the transposition table
+
+        Args:
+            key (int): The key of the position
+            depth (int): The number of moves left to search
+            alpha (float): The lower bound of the search window
+            beta (float): The upper bound of the search window
+
+        Returns:
+            tuple[int, float, float, float | None]: the best column stored (-1 if none), the search window narrowed
+                                                    by the entry if it was searched deep enough, and the stored value
+                                                    if it decides the search (the window is empty), otherwise None
+        """
+        entry = self.table.get(key)
+        if entry is None:
+            return -1, alpha, beta, None
+        if entry[0] >= depth:
+            alpha, beta = self.table_bounds(entry, alpha, beta)
+            if alpha >= beta:
+                return entry[3], alpha, beta, entry[2]
+        return entry[3], alpha, beta, None
+
+    def move_order(self, best_col: int) -> list[int]:
+        """Function to get the order the columns are searched in, center first
+
+        Args:
+            best_col (int): The best column of an earlier search, searched first (-1 if none)
+
+        Returns:
+            list[int]: the columns
+        """
+        if best_col == -1:
+            return self.order
+        return [best_col] + [col_n for col_n in self.order if col_n != best_col]
+
+    def decided(
+        self, current: int, mask: int, moves: int, alpha: float, beta: float,
+    ) -> tuple[int, float, float, float | None]:
+        """Function to find the positions decided by the next two tokens,
+        and to narrow the search window to the scores the position can still have
+
+        Args:
+            current (int): The bitboard of the player to move
+            mask (int): The bitboard of all the tokens
+            moves (int): The number of tokens on the board
+            alpha (float): The lower bound of the search window
+            beta (float): The upper bound of the search window
+
+        Returns:
+            tuple[int, float, float, float | None]: bitboard of the playable cells that do not lose right away,
+                the narrowed window, and the score if the player to move wins, loses or draws with their next token
+                or the window is empty (then a bound on the score), otherwise None
+        """
+        possible = (mask + self.bottom) & self.board_mask
+        if self.winning_cells(current, mask) & possible:
+            return possible, alpha, beta, (self.n_cells + 1 - moves) // 2
+        possible = self.non_losing_moves(current, mask, possible)
+        if not possible:
+            return possible, alpha, beta, -((self.n_cells - moves) // 2)
+        if moves >= self.n_cells - 2:
+            return possible, alpha, beta, 0
+
+        # Neither player can win before their next token
+        max_score = (self.n_cells - 1 - moves) // 2
+        alpha = max(alpha, -((self.n_cells - 2 - moves) // 2))
+        beta = min(beta, max_score)
+        if alpha >= beta:
+            return possible, alpha, beta, beta if beta == max_score else alpha
+        return possible, alpha, beta, None
+
+    def negamax(self, current: int, mask: int, moves: int, depth: int, alpha: float, beta: float) -> float:
+        """Negamax search with alpha-beta pruning
+
+        Args:
+            current (int): The bitboard of the player to move
+            mask (int): The bitboard of all the tokens
+            moves (int): The number of tokens on the board
+            depth (int): The number of moves left to search
+            alpha (float): The lower bound of the search window
+            beta (float): The upper bound of the search window
+
+        Returns:
+            float: the score of the position if it lies in the window, otherwise a bound on the score
+                   (an integer, unless the evaluator scored the position)
+        """
+        self.nodes += 1
+        if self.nodes & 255 == 0:
+            self.check_budget()
+
+        possible, alpha, beta, decided_score = self.decided(current, mask, moves, alpha, beta)
+        if decided_score is not None:
+            return decided_score
+        if depth <= 0:
+            return 0 if self.evaluator is None else self.leaf_value(moves)
+
+        key = current + mask
+        best_col, alpha, beta, value = self.probe(key, depth, alpha, beta)
+        if value is not None:
+            return value
+
+        alpha_orig = alpha
+        evaluator = self.evaluator
+        for col_n in self.move_order(best_col):
+            move = possible & self.column_masks[col_n]
+            if not move:
+                continue
+            if evaluator is None:
+                score = -self.negamax(current ^ mask, mask | move, moves + 1, depth - 1, -beta, -alpha)
+            else:
+                evaluator.place(move.bit_length() - 1, moves & 1)
+                score = -self.negamax(current ^ mask, mask | move, moves + 1, depth - 1, -beta, -alpha)
+                evaluator.remove(move.bit_length() - 1, moves & 1)
+            if score >= beta:
+                self.store(key, depth, LOWER, score, col_n)
+                return score
+            if score > alpha:
+                alpha = score
+                best_col = col_n
+
+        self.store(key, depth, EXACT if alpha > alpha_orig else UPPER, alpha, best_col)
+        return alpha
+
+    def leaf_value(self, moves: int) -> float:
+        """Function to get the heuristic score of an undecided position from the evaluator
+
+        Args:
+            moves (int): The number of tokens on the board (player 1 moves when it is even)
+
+        Returns:
+            float: the score for the player to move, between -1 and 1
+        """
+        score = self.evaluator.score if moves & 1 == 0 else -self.evaluator.score  # type: ignore[union-attr]
+        return score / (abs(score) + 100)
+
+    def store(self, key: int, depth: int, flag: int, value: float, col_n: int):
+        """Store a search result in the transposition table
+
+        Args:
+            key (int): The key of the position
+            depth (int): The depth the position was searched to
+            flag (int): Whether value is EXACT, a LOWER bound or an UPPER bound
+            value (float): The score of the position
+            col_n (int): The best column found (-1 if none)
+        """
+        if len(self.table) >= self.max_table_size:
+            self.table.clear()
+        self.table[key] = (depth, flag, value, col_n)
+
+    def search_root(self, current: int, mask: int, depth: int) -> tuple[int, float]:
+        """Search all the moves of the position with a full window
+
+        Args:
+            current (int): The bitboard of the player to move
+            mask (int): The bitboard of all the tokens
+            depth (int): The number of moves to search
+
+        Returns:
+            tuple[int, float]: the best column and its score
+        """
+        moves = mask.bit_count()
+        possible = (mask + self.bottom) & self.board_mask
+        winning = self.winning_cells(current, mask) & possible
+        for col_n in self.order:
+            if winning & self.column_masks[col_n]:
+                return col_n, (self.n_cells + 1 - moves) // 2
+
+        alpha: float = -self.n_cells
+        beta = self.n_cells
+        best: tuple[int, float] = (-1, alpha)
+        evaluator = self.evaluator
+        for col_n in self.order:
+            move = possible & self.column_masks[col_n]
+            if not move:
+                continue
+            if evaluator is not None:
+                evaluator.place(move.bit_length() - 1, moves & 1)
+            score = -self.negamax(current ^ mask, mask | move, moves + 1, depth - 1, -beta, -alpha)
+            if evaluator is not None:
+                evaluator.remove(move.bit_length() - 1, moves & 1)
+            if score > alpha:
+                alpha = score
+                best = (col_n, score)
+        return best
+
+    def best_move(
+        self, current: int, mask: int, depth: int | None = None,
+        nodes: int | None = None, time_budget: float | None = None,
+    ) -> tuple[int, float]:
+        """Iterative deepening search for the best move
+        Searches one move deeper at a time until the depth, node or time budget is used up,
+        the stop event is set or the outcome of the game is known, aborted tells whether the last depth was cut short
+
+        Args:
+            current (int): The bitboard of the player to move
+            mask (int): The bitboard of all the tokens
+            depth (int | None, optional): The maximum number of moves to search. Defaults to None.
+            nodes (int | None, optional): The maximum number of positions to search. Defaults to None.
+            time_budget (float | None, optional): The maximum search time in seconds. Defaults to None.
+
+        Returns:
+            tuple[int, float]: the best column and its score (an integer, unless the evaluator scored the position,
+                               then it is between -1 and 1)
+        """
+        if not (mask + self.bottom) & self.board_mask:
+            raise ValueError('There are no legal moves left')
+
+        if self.evaluator is not None:
+            opponent = current ^ mask
+            self.evaluator.load((current, opponent) if mask.bit_count() % 2 == 0 else (opponent, current))
+        self.nodes = 0
+        self.max_nodes = nodes
+        self.deadline = None if time_budget is None else time.perf_counter() + time_budget
+        self.can_abort = False
+        self.aborted = False
+
+        max_depth = self.n_cells - mask.bit_count()
+        if depth is not None:
+            max_depth = min(depth, max_depth)
+
+        possible = (mask + self.bottom) & self.board_mask
+        best: tuple[int, float] = (next(col_n for col_n in self.order if possible & self.column_masks[col_n]), 0)
+        for search_depth in range(1, max_depth + 1):
+            try:
+                best = self.search_root(current, mask, search_depth)
+            except SearchAborted:
+                self.aborted = True
+                break
+            self.can_abort = True
+            # Heuristic scores are between -1 and 1, only wins and losses decide the game
+            if abs(best[1]) >= 1:
+                break
+        return best
+
+
+class NegamaxStrategy:
+    """Strategy for Game.make_move that plays the best move found by the negamax solver
+    Without a budget the position is solved exactly, which is only fast enough late in the game.
+    """
+
+    def __init__(
+        self, depth: int | None = None, nodes: int | None = None, time_budget: float | None = None,
+        stop: threading.Event | None = None, heuristic: bool = False, network: str | None = None,
+    ):
+        """Initialize the strategy with its search budget
+
+        Args:
+            depth (int | None, optional): The maximum number of moves to search. Defaults to None.
+            nodes (int | None, optional): The maximum number of positions to search. Defaults to None.
+            time_budget (float | None, optional): The maximum search time in seconds. Defaults to None.
+            stop (threading.Event | None, optional): Event that stops the search from another thread,
+                                                     the best move found so far is then played. Defaults to None.
+            heuristic (bool, optional): Whether the positions that are not decided within the budget are scored
+                                        by an Evaluator instead of counting as draws. Defaults to False.
+            network (str | None, optional): Path of the weights of a value network (see nn.py) that scores
+                                            the undecided positions instead of the Evaluator. Defaults to None.
+        """
+        self.depth = depth
+        self.nodes = nodes
+        self.time_budget = time_budget
+        self.stop = stop
+        self.heuristic = heuristic
+        self.network = network
+        self.solver: Solver | None = None
+
+    def __call__(self, game: Game, token_id: int) -> int:
+        """Pick a column for the given player
+
+        Args:
+            game (Game): The game to play in
+            token_id (int): The token ID of the player to move
+
+        Returns:
+            int: the column to play
+        """
+        shape = (game.rows, game.cols, game.connect)
+        if self.solver is None or (self.solver.rows, self.solver.cols, self.solver.connect) != shape:
+            evaluator: Evaluator | NetworkEvaluator | None = None
+            if self.network is not None:
+                # Imported here, nn imports this module
+                from nn import load_network
+                from nn import NetworkEvaluator
+
+                evaluator = NetworkEvaluator(load_network(self.network))
+            elif self.heuristic:
+                evaluator = Evaluator(game.rows, game.cols, game.connect)
+            self.solver = Solver(game.rows, game.cols, connect=game.connect, evaluator=evaluator)
+        self.solver.stop = self.stop
+        col_n, _ = self.solver.best_move(
+            *position(game, token_id), depth=self.depth, nodes=self.nodes, time_budget=self.time_budget,
+        )
+        return col_n
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import ast
+import inspect
+from typing import Any
+from typing import Callable
+
+import numpy as np
+
+from evaluator import GreedyStrategy
+from game import Game
+from mcts import MCTSStrategy
+from nn import NetworkStrategy
+from parallel import ParallelNegamaxStrategy
+from solver import NegamaxStrategy
+
+
+class RandomStrategy:
+    """Strategy for Game.make_move that plays a random column that is not full
+    """
+
+    def __init__(self, seed: int | None = None):
+        """Initialize the strategy with its random number generator
+
+        Args:
+            seed (int | None, optional): The seed of the random number generator. Defaults to None.
+        """
+        self.rng = np.random.default_rng(seed)
+
+    def __call__(self, game: Game, token_id: int) -> int:
+        """Pick a column for the given player
+
+        Args:
+            game (Game): The game to play in
+            token_id (int): The token ID of the player to move
+
+        Returns:
+            int: the column to play
+        """
+        legal = game.legal_moves()
+        return legal[self.rng.integers(len(legal))]
+
+
+STRATEGIES: dict[str, Callable[..., Callable[[Game, int], int]]] = {
+    'random': RandomStrategy,
+    'greedy': GreedyStrategy,
+    'negamax': NegamaxStrategy,
+    'mcts': MCTSStrategy,
+    'parallel': ParallelNegamaxStrategy,
+    'nn': NetworkStrategy,
+}
+
+
+def make_strategy(name: str, config: dict[str, Any] | None = None, seed: int | None = None) -> Callable[[Game, int], int]:
+    """Function to create a strategy from its name and configuration
+
+    Args:
+        name (str): The name of the strategy in STRATEGIES
+        config (dict[str, Any] | None, optional): The keyword arguments of the strategy. Defaults to None.
+        seed (int | None, optional): Seed given to strategies that take one, unless the configuration
+                                     has its own seed. Defaults to None.
+
+    Returns:
+        Callable[[Game, int], int]: the strategy
+    """
+    if name not in STRATEGIES:
+        raise ValueError(f'Unknown strategy {name!r}, choose from {", ".join(STRATEGIES)}')
+    config = dict(config or {})
+    factory = STRATEGIES[name]
+    if seed is not None and 'seed' not in config and 'seed' in inspect.signature(factory).parameters:
+        config['seed'] = seed
+    return factory(**config)
+
+
+def parse_spec(spec: str) -> tuple[str, dict[str, Any]]:
+    """Function to parse a strategy written as name:key=value,key=value (e.g. negamax:depth=6)
+
+    Args:
+        spec (str): The strategy specification
+
+    Returns:
+        tuple[str, dict[str, Any]]: the name and the configuration of the strategy
+    """
+    name, _, options = spec.partition(':')
+    config: dict[str, Any] = {}
+    for option in filter(None, options.split(',')):
+        key, sep, value = option.partition('=')
+        if not sep:
+            raise ValueError(f'Option {option!r} of strategy {name!r} should be written as key=value')
+        try:
+            config[key.strip()] = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError):
+            config[key.strip()] = value.strip()
+    return name.strip(), config
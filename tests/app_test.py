@@ -1,14 +1,19 @@
 from __future__ import annotations
 
+import threading
+import time
 import unittest
 from unittest import mock
+from unittest.mock import Mock
 from unittest.mock import patch
 
 import numpy as np
 import pygame as pg
 
+from app import AI_DONE
 from app import App
 from game import Game
+from solver import NegamaxStrategy
 
 
 class TestApp(unittest.TestCase):
@@ -26,6 +31,10 @@ class TestApp(unittest.TestCase):
         self.assertEqual(self.app.gray, (163, 163, 163))
         self.assertEqual(self.app.turn, 1)
         self.assertIsInstance(self.app.game, Game)
+        self.assertIsInstance(self.app.ai, NegamaxStrategy)
+        self.assertIs(self.app.ai.stop, self.app.ai_stop)
+        self.assertIsNone(self.app.ai_future)
+        self.assertEqual(self.app.max_fps, 60)
 
     @patch('pygame.init')
     @patch('pygame.display.set_mode')
@@ -49,6 +58,8 @@ class TestApp(unittest.TestCase):
         self.assertEqual(self.app.xmargin, 100)
         self.assertEqual(self.app.ymargin, 50)
         self.assertEqual(self.app.center, (450, 350))
+        self.assertIsInstance(self.app.grid_surface, pg.Surface)
+        self.assertIsNone(self.app.drawn_board)
         self.assertTrue(self.app.running)
 
     @patch('pygame.quit')
@@ -70,68 +81,138 @@ class TestApp(unittest.TestCase):
     @patch('app.App.draw_circles')
     @patch('app.App.display_winner')
     @patch('app.App.display_draw')
-    @patch('game.Game.make_move')
+    @patch('app.App.update_ai')
     @patch('app.App.handle_events')
     @patch('pygame.display.update')
     def test_main_app(
-        self, mock_update, mock_handle_events, mock_make_move, mock_display_draw,
+        self, mock_update, mock_handle_events, mock_update_ai, mock_display_draw,
         mock_display_winner, mock_draw_circles, mock_draw_grid, mock_event_pump,
     ):
 
         self.app.screen = mock.Mock()
-        mock_fill = mock.PropertyMock()
-        self.app.screen.fill = mock_fill
+        self.app.clock = mock.Mock()
         self.app.running = False
         self.app.main_app()
         self.assertFalse(mock_event_pump.called)
-        self.assertFalse(mock_fill.called)
         self.assertFalse(mock_draw_grid.called)
         self.assertFalse(mock_draw_circles.called)
         self.assertFalse(mock_display_winner.called)
         self.assertFalse(mock_display_draw.called)
-        self.assertFalse(mock_make_move.called)
+        self.assertFalse(mock_update_ai.called)
         self.assertFalse(mock_handle_events.called)
         self.assertFalse(mock_update.called)
+        self.assertFalse(self.app.clock.tick.called)
 
+        # The first frame draws the grid, nothing changed so the display is not updated
         self.app.running = True
-        # The following is used to make sure running is immediately set to False
         self.app.turn = 1
         self.app.main_app()
-        self.assertEqual(mock_update.call_count, 1)
+        self.assertFalse(mock_update.called)
         self.assertEqual(mock_handle_events.call_count, 1)
-        self.assertFalse(mock_make_move.called)
+        self.assertFalse(mock_update_ai.called)
         self.assertEqual(mock_display_draw.call_count, 1)
         self.assertEqual(mock_display_winner.call_count, 1)
         self.assertEqual(mock_draw_circles.call_count, 1)
         self.assertEqual(mock_draw_grid.call_count, 1)
         self.assertEqual(mock_event_pump.call_count, 1)
+        self.app.clock.tick.assert_called_once_with(60)
 
+        # Only the dirty parts of the screen are updated, the grid is not drawn again
+        self.app.drawn_board = np.zeros((6, 7))
+        self.app.dirty_rects = [pg.Rect(0, 0, 10, 10)]
         self.app.turn = 2
-        self.app.game.winner = 1
+        self.app.max_fps = 30
         self.app.main_app()
-        self.assertEqual(mock_update.call_count, 2)
+        mock_update.assert_called_once_with([pg.Rect(0, 0, 10, 10)])
+        self.assertEqual(self.app.dirty_rects, [])
         self.assertEqual(mock_handle_events.call_count, 2)
-        self.assertEqual(mock_make_move.call_count, 1)
+        self.assertEqual(mock_update_ai.call_count, 1)
         self.assertEqual(mock_display_draw.call_count, 2)
         self.assertEqual(mock_display_winner.call_count, 2)
         self.assertEqual(mock_draw_circles.call_count, 2)
-        self.assertEqual(mock_draw_grid.call_count, 2)
+        self.assertEqual(mock_draw_grid.call_count, 1)
         self.assertEqual(mock_event_pump.call_count, 2)
-        self.assertEqual(self.app.turn, 1)
+        self.app.clock.tick.assert_called_with(30)
+
+    def test_update_ai(self):
+        # Winning move
+        self.app.ai = Mock(return_value=6)
+        for col_n in range(3):
+            self.app.game.place_token(6, 2)
+            self.app.game.place_token(col_n, 1)
 
         self.app.turn = 2
-        self.app.game.winner = 2
-        self.app.main_app()
-        self.assertEqual(mock_update.call_count, 3)
-        self.assertEqual(mock_handle_events.call_count, 3)
-        self.assertEqual(mock_make_move.call_count, 2)
-        self.assertEqual(mock_display_draw.call_count, 3)
-        self.assertEqual(mock_display_winner.call_count, 3)
-        self.assertEqual(mock_draw_circles.call_count, 3)
-        self.assertEqual(mock_draw_grid.call_count, 3)
-        self.assertEqual(mock_event_pump.call_count, 3)
+        self.app.update_ai()
+        self.assertIsNotNone(self.app.ai_future)
+        self.app.ai_future.result(timeout=5)
+        self.assertEqual(self.app.turn, 2)
+        self.app.update_ai()
+        self.assertIsNone(self.app.ai_future)
+        self.app.ai.assert_called_once_with(self.app.game, 2)
+        self.assertEqual(self.app.game.winner, 2)
         self.assertEqual(self.app.turn, 0)
 
+        # Other move
+        self.app.reset_game()
+        self.app.turn = 2
+        self.app.update_ai()
+        self.app.ai_future.result(timeout=5)
+        self.app.update_ai()
+        self.assertEqual(self.app.game.board[5, 6], 2)
+        self.assertEqual(self.app.turn, 1)
+
+        self.app.stop_pg()
+        self.assertIsNone(self.app.ai_executor)
+
+    @patch('traceback.print_exc')
+    def test_ai_error(self, mock_print_exc):
+        # A strategy that raises does not crash the frame loop, a random column is played instead
+        self.app.ai = Mock(side_effect=RuntimeError('boom'))
+        self.app.turn = 2
+        self.app.update_ai()
+        with self.assertRaises(RuntimeError):
+            self.app.ai_future.result(timeout=5)
+        self.app.update_ai()
+        self.assertIsNone(self.app.ai_future)
+        self.assertTrue(mock_print_exc.called)
+        self.assertEqual(self.app.game.move_count, 1)
+        self.assertEqual(self.app.game.board.sum(), 2)
+        self.assertEqual(self.app.turn, 1)
+        self.app.stop_pg()
+
+    def test_cancel_ai(self):
+        started = threading.Event()
+
+        def slow_ai(game, token_id):
+            started.set()
+            self.app.ai_stop.wait(timeout=5)
+            return 0
+
+        self.app.ai = slow_ai
+        self.app.turn = 2
+        self.app.update_ai()
+        started.wait(timeout=5)
+
+        start = time.perf_counter()
+        self.app.reset_game()
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertIsNone(self.app.ai_future)
+        self.assertFalse(self.app.ai_stop.is_set())
+        self.assertTrue(np.all(self.app.game.board == 0))
+        self.assertEqual(self.app.turn, 1)
+        self.app.stop_pg()
+
+    def test_ai_stop(self):
+        # The real AI stops searching as soon as it is cancelled
+        self.app.ai.time_budget = 60
+        self.app.turn = 2
+        self.app.update_ai()
+        time.sleep(0.1)
+        start = time.perf_counter()
+        self.app.cancel_ai()
+        self.assertLess(time.perf_counter() - start, 1)
+        self.app.stop_pg()
+
     @patch('app.App.reset_game')
     @patch('app.App.mouse2idx')
     @patch('game.Game.place_token')
@@ -216,17 +297,30 @@ class TestApp(unittest.TestCase):
         self.assertEqual(self.app.turn, 0)
 
     @patch('pygame.draw.line')
-    def test_draw_grid(self, mock_draw_line):
+    def test_render_grid(self, mock_draw_line):
         self.app.xmax = 900
         self.app.ymax = 700
         self.app.xmargin = 100
         self.app.ymargin = 50
         self.app.sqWidth = 100
-        self.app.screen = None
+        self.app.grid_surface = mock.Mock()
         self.app.gray = None
-        self.app.draw_grid()
+        self.app.render_grid()
+        self.app.grid_surface.fill.assert_called_once_with(self.app.bg_col)
         self.assertEqual(mock_draw_line.call_count, 15)
 
+    def test_draw_grid(self):
+        self.app.xmax = 900
+        self.app.ymax = 700
+        self.app.screen = mock.Mock()
+        self.app.grid_surface = None
+        self.app.drawn_status = ('Draw!', self.app.black)
+        self.app.draw_grid()
+        self.app.screen.blit.assert_called_once_with(None, (0, 0))
+        self.assertEqual(self.app.dirty_rects, [pg.Rect(0, 0, 900, 700)])
+        np.testing.assert_array_equal(self.app.drawn_board, np.zeros((6, 7)))
+        self.assertIsNone(self.app.drawn_status)
+
     @patch('pygame.draw.circle')
     def test_draw_circle(self, mock_draw_circle):
         self.app.xmax = 900
@@ -234,21 +328,39 @@ class TestApp(unittest.TestCase):
         self.app.xmargin = 100
         self.app.ymargin = 50
         self.app.sqWidth = 100
-        self.app.screen = None
+        self.app.screen = mock.Mock()
+        self.app.grid_surface = None
         self.app.red = 'red'
         self.app.blue = 'blue'
 
         self.app.game.board = np.zeros((6, 7))
         self.app.draw_circles()
         self.assertFalse(mock_draw_circle.called)
+        self.assertFalse(self.app.screen.blit.called)
+        self.assertEqual(self.app.dirty_rects, [])
 
         self.app.game.board = np.array([[1]])
         self.app.draw_circles()
-        mock_draw_circle.assert_called_with(None, 'red', (150, 100), 45)
+        mock_draw_circle.assert_called_with(self.app.screen, 'red', (150, 100), 45)
+        self.app.screen.blit.assert_called_with(None, pg.Rect(100, 50, 100, 100), pg.Rect(100, 50, 100, 100))
+        self.assertEqual(self.app.dirty_rects, [pg.Rect(100, 50, 100, 100)])
+
+        # Nothing changed, nothing is drawn
+        self.app.draw_circles()
+        self.assertEqual(mock_draw_circle.call_count, 1)
+        self.assertEqual(len(self.app.dirty_rects), 1)
 
         self.app.game.board = np.array([[2]])
         self.app.draw_circles()
-        self.assertEqual(mock_draw_circle.mock_calls[-1], mock.call(None, 'blue', (150, 100), 45))
+        self.assertEqual(mock_draw_circle.mock_calls[-1], mock.call(self.app.screen, 'blue', (150, 100), 45))
+
+        # Only the new token is drawn
+        self.app.game = Game()
+        self.app.draw_circles()
+        mock_draw_circle.reset_mock()
+        self.app.game.place_token(3, 1)
+        self.app.draw_circles()
+        mock_draw_circle.assert_called_once_with(self.app.screen, 'red', (450, 600), 45)
 
     def test_mouse_2_idx(self):
         self.app.xmax = 900
@@ -278,6 +390,17 @@ class TestApp(unittest.TestCase):
         self.app.game.winner = 1
         self.app.display_winner()
         render_mock.assert_called_once()
+        self.assertEqual(self.app.screen.blit.call_count, 1)
+
+        # The message is already on the screen
+        self.app.display_winner()
+        self.assertEqual(self.app.screen.blit.call_count, 1)
+
+        # The rendered message is cached
+        self.app.request_redraw()
+        self.app.display_winner()
+        render_mock.assert_called_once()
+        self.assertEqual(self.app.screen.blit.call_count, 2)
 
     @patch('game.Game.check_draw')
     def test_display_draw(self, mock_draw):
@@ -320,7 +443,82 @@ class TestApp(unittest.TestCase):
         self.app.turn = 5
         self.app.game = None
 
+        self.app.drawn_board = np.zeros((6, 7))
+
         self.app.reset_game()
 
         self.assertEqual(self.app.turn, 1)
         self.assertIsInstance(self.app.game, Game)
+        self.assertIsNone(self.app.drawn_board)
+
+    def test_is_idle(self):
+        self.assertFalse(self.app.is_idle())
+        self.app.drawn_board = self.app.game.board
+        self.app.turn = 1
+        self.assertTrue(self.app.is_idle())
+
+        # A token that is not drawn yet
+        self.app.game.place_token(3, 1)
+        self.assertFalse(self.app.is_idle())
+        self.app.drawn_board = self.app.game.board
+        self.assertTrue(self.app.is_idle())
+
+        # The AI is about to start, is thinking, or its move is ready
+        self.app.turn = 2
+        self.assertFalse(self.app.is_idle())
+        self.app.ai_future = Mock(done=Mock(return_value=False))
+        self.assertTrue(self.app.is_idle())
+        self.app.ai_future.done.return_value = True
+        self.assertFalse(self.app.is_idle())
+        self.app.ai_future = None
+
+        self.app.turn = 0
+        self.assertTrue(self.app.is_idle())
+        self.app.idle_timeout = None
+        self.assertFalse(self.app.is_idle())
+
+    @patch.dict('os.environ', {'SDL_VIDEODRIVER': 'dummy'})
+    def test_idle_loop(self):
+        self.app.start_pg()
+        try:
+            self.app.clock = Mock()
+            self.app.idle_timeout = 50
+
+            # Once a frame has drawn the screen the loop waits for events
+            start = time.perf_counter()
+            self.app.main_app()
+            self.assertGreaterEqual(time.perf_counter() - start, 0.04)
+            self.assertFalse(self.app.clock.tick.called)
+            self.assertTrue(self.app.is_idle())
+
+            # An event wakes the loop up and stays in the queue for handle_events
+            pg.event.post(pg.event.Event(pg.KEYDOWN, key=pg.K_a))
+            with patch('pygame.event.wait', wraps=pg.event.wait) as mock_wait:
+                self.app.wait_event()
+            mock_wait.assert_called_once_with(50)
+            self.assertEqual(len(pg.event.get(pg.KEYDOWN)), 1)
+
+            # The AI posts an event when its move is ready
+            release = threading.Event()
+
+            def ai(game, token_id):
+                release.wait(timeout=5)
+                return 0
+            self.app.ai = ai
+            self.app.turn = 2
+            # The frame starts the AI, then waits for it
+            self.app.main_app()
+            self.assertFalse(self.app.clock.tick.called)
+            self.assertTrue(self.app.is_idle())
+            release.set()
+            self.app.idle_timeout = 5000
+            start = time.perf_counter()
+            self.app.wait_event()
+            self.assertLess(time.perf_counter() - start, 1)
+            self.assertEqual(len(pg.event.get(AI_DONE)), 1)
+            self.assertFalse(self.app.is_idle())
+            self.app.main_app()
+            self.assertEqual(self.app.game.board[5, 0], 2)
+            self.assertEqual(self.app.turn, 1)
+        finally:
+            self.app.stop_pg()
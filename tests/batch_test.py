@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from unittest.mock import patch
+
+from batch import analyze_batch
+from batch import analyze_stream
+from batch import main
+from batch import read_batches
+
+POSITIONS = ['3342', '', '# comment', '3333224422', '9', '3434343', '0', '33']
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_read_batches(self):
+        batches = list(read_batches(POSITIONS, 2))
+        self.assertEqual(batches, [[(1, '3342'), (4, '3333224422')], [(5, '9'), (6, '3434343')], [(7, '0'), (8, '33')]])
+        self.assertEqual(list(read_batches(iter(POSITIONS), 10))[0][-1], (8, '33'))
+
+    def test_analyze_batch(self):
+        results = analyze_batch([(4, '3333224422'), (5, '9'), (6, '3434343')], depth=2)
+        self.assertEqual(results[0]['line'], 4)
+        self.assertEqual(results[0]['moves'], '3333224422')
+        self.assertEqual(results[0]['best'], 1)
+        self.assertEqual(results[0]['columns'][1]['result'], 'win in 1')
+        self.assertIn('not a column', results[1]['error'])
+        self.assertIn('over', results[2]['error'])
+
+    def test_analyze_stream(self):
+        lines = [f'{col_n}{col_n2}' for col_n in range(7) for col_n2 in range(7)] * 3
+        serial = list(analyze_stream(lines, depth=2, batch_size=5))
+        self.assertEqual([result['line'] for result in serial], list(range(1, len(lines) + 1)))
+
+        # The results come out in the order of the input, whatever the number of processes
+        parallel = list(analyze_stream(iter(lines), depth=2, workers=2, batch_size=4, max_in_flight=3))
+        self.assertEqual(parallel, serial)
+
+        # At most max_in_flight batches are read ahead of the output
+        read = []
+
+        def source():
+            for line_n, line in enumerate(lines):
+                read.append(line_n)
+                yield line
+        stream = analyze_stream(source(), depth=1, workers=2, batch_size=4, max_in_flight=3)
+        next(stream)
+        self.assertLessEqual(len(read), 4 * 4 + 1)
+        stream.close()
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'positions.txt')
+            with open(path, 'w') as f:
+                f.write('\n'.join(POSITIONS[:6]) + '\n')
+            output = os.path.join(directory, 'analysis.csv')
+            with redirect_stderr(io.StringIO()) as stderr:
+                main([path, '--output', output, '--depth', '2'])
+            self.assertIn('4 positions (2 errors)', stderr.getvalue())
+            with open(output, newline='') as f:
+                rows = list(csv.DictReader(f))
+            self.assertEqual([row['line'] for row in rows], ['1', '4', '5', '6'])
+            self.assertEqual(rows[1]['best'], '1')
+            self.assertEqual(rows[1]['score_1'], '16')
+            self.assertEqual(rows[2]['score_1'], '')
+            self.assertIn('not a column', rows[2]['error'])
+
+            with patch('sys.stdin', io.StringIO('3342\n')), patch('sys.stdout', io.StringIO()) as stdout:
+                with redirect_stderr(io.StringIO()):
+                    main(['--format', 'jsonl', '--depth', '2'])
+            result = json.loads(stdout.getvalue())
+            self.assertEqual((result['line'], result['moves'], result['n_moves']), (1, '3342', 4))
+            self.assertEqual(len(result['columns']), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
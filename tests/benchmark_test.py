@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import unittest
+
+from benchmark import BASELINE_PATH
+from benchmark import BENCHMARKS
+from benchmark import compare
+from benchmark import format_report
+from benchmark import main
+from benchmark import midgame
+from benchmark import run_benchmarks
+from benchmark import time_call
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_time_call(self):
+        calls = []
+        seconds = time_call(lambda: calls.append(1), min_time=0.01, repeat=3)
+        self.assertGreater(seconds, 0)
+        self.assertLess(seconds, 0.01)
+        self.assertGreater(len(calls), 3)
+
+    def test_midgame(self):
+        game = midgame()
+        self.assertEqual(game.move_count, 12)
+        self.assertFalse(game.over)
+
+    def test_run_benchmarks(self):
+        report = run_benchmarks(['place_token', 'check_win', 'app_frame_idle'], min_time=0.01, repeat=2)
+        self.assertEqual(list(report['results']), ['place_token', 'check_win', 'app_frame_idle'])
+        for result in report['results'].values():
+            self.assertGreater(result['seconds'], 0)
+            self.assertAlmostEqual(result['per_sec'], 1 / result['seconds'])
+        self.assertIn('python', report['meta'])
+        # The report can be saved as JSON
+        self.assertEqual(json.loads(json.dumps(report)), report)
+
+        with self.assertRaises(ValueError):
+            run_benchmarks(['nope'])
+        self.assertIn('ai_negamax_depth6', BENCHMARKS)
+
+    def test_compare(self):
+        baseline = {'results': {'a': {'seconds': 1.0}, 'b': {'seconds': 1.0}, 'c': {'seconds': 1.0}}}
+        report = {'results': {'a': {'seconds': 1.05, 'per_sec': 1}, 'b': {'seconds': 1.2, 'per_sec': 1},
+                              'd': {'seconds': 9.0, 'per_sec': 1}}}
+        self.assertEqual(compare(report, baseline, threshold=0.1), [('b', 1.0, 1.2)])
+        self.assertEqual(compare(report, baseline, threshold=0.25), [])
+        self.assertEqual(compare(report, baseline, threshold=0.01), [('a', 1.0, 1.05), ('b', 1.0, 1.2)])
+        self.assertIn('+20.0%', format_report(report, baseline))
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            baseline = os.path.join(directory, 'baseline.json')
+            args = ['check_win', '--min-time', '0.01', '--output', output, '--baseline', baseline]
+
+            self.assertEqual(main(args + ['--save-baseline']), 0)
+            self.assertTrue(os.path.exists(baseline))
+            self.assertFalse(os.path.exists(output))
+
+            # A baseline 1000 times faster makes the run a regression
+            with open(baseline) as f:
+                results = json.load(f)
+            results['results']['check_win']['seconds'] /= 1000
+            with open(baseline, 'w') as f:
+                json.dump(results, f)
+            self.assertEqual(main(args), 1)
+            self.assertTrue(os.path.exists(output))
+            self.assertEqual(main(args + ['--threshold', '10000']), 0)
+
+    def test_baseline(self):
+        # The committed baseline covers every benchmark, so a fresh checkout compares all of them
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+        self.assertEqual(set(baseline['results']), set(BENCHMARKS))
+        for result in baseline['results'].values():
+            self.assertGreater(result['seconds'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import os
+import pickle
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+import numpy as np
+
+from book import book_positions
+from book import generate_book
+from book import HEADER
+from book import OpeningBook
+from game import Game
+from solver import position
+from solver import Solver
+
+
+class TestOpeningBook(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmp_dir.name, 'book.bin')
+        cls.size = generate_book(cls.path, ply=2, depth=4, workers=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_book_positions(self):
+        self.assertEqual(len(book_positions(0)), 1)
+        self.assertEqual(len(book_positions(1)), 1 + 7)
+        self.assertEqual(len(book_positions(2)), 1 + 7 + 49)
+        self.assertEqual(self.size, 1 + 7 + 49)
+
+    def test_file(self):
+        self.assertEqual(os.path.getsize(self.path), HEADER.size + 9 * self.size)
+        book = OpeningBook(self.path)
+        self.assertEqual(len(book), self.size)
+        self.assertEqual((book.rows, book.cols, book.ply), (6, 7, 2))
+        self.assertIsInstance(book.keys, np.memmap)
+        self.assertTrue(np.all(np.diff(book.keys.astype(np.int64)) > 0))
+
+        other = pickle.loads(pickle.dumps(book))
+        self.assertEqual(other.path, self.path)
+        self.assertEqual(len(other), self.size)
+
+        with open(os.path.join(self.tmp_dir.name, 'other.bin'), 'wb') as f:
+            f.write(b'not a book' + bytes(HEADER.size))
+        with self.assertRaises(ValueError):
+            OpeningBook(f.name)
+
+    def test_lookup(self):
+        book = OpeningBook(self.path)
+        game = Game()
+        self.assertEqual(book.lookup(game, 1), Solver().best_move(*position(game, 1), depth=4)[0])
+
+        game.place_token(0, 1)
+        self.assertEqual(book.lookup(game, 2), Solver().best_move(*position(game, 2), depth=4)[0])
+        game.place_token(6, 2)
+        self.assertEqual(book.lookup(game, 1), Solver().best_move(*position(game, 1), depth=4)[0])
+
+        # Positions deeper than the book or of another board size are not in the book
+        game.place_token(3, 1)
+        self.assertIsNone(book.lookup(game, 2))
+        game.board = np.zeros((7, 8))
+        self.assertIsNone(book.lookup(game, 1))
+
+    def test_make_move(self):
+        book = OpeningBook(self.path)
+        strategy = Mock(return_value=0)
+        game = Game(book=book)
+        row_n, col_n = game.make_move(strategy, 1)
+        self.assertEqual(col_n, book.lookup(Game(), 1))
+        self.assertFalse(strategy.called)
+
+        game.make_move(strategy, 2)
+        game.make_move(strategy, 1)
+        self.assertFalse(strategy.called)
+        game.make_move(strategy, 2)
+        self.assertEqual(strategy.call_count, 1)
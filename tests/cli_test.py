@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import io
+import json
+import os
+import subprocess
+import sys
+import unittest
+from contextlib import redirect_stderr
+from contextlib import redirect_stdout
+
+from cli import analyze
+from cli import format_board
+from cli import main
+from cli import parse_moves
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(argv: list[str]) -> tuple[int, str]:
+    """Helper function to run the command line and get its exit code and output
+    """
+    output = io.StringIO()
+    with redirect_stdout(output), redirect_stderr(output):
+        code = main(argv)
+    return code, output.getvalue()
+
+
+class TestCli(unittest.TestCase):
+
+    def test_parse_moves(self):
+        game, token_id = parse_moves('3342')
+        self.assertEqual(game.history, [(3, 1), (3, 2), (4, 1), (2, 2)])
+        self.assertEqual(token_id, 1)
+        game, token_id = parse_moves('3,10,3', cols=12)
+        self.assertEqual(game.history, [(3, 1), (10, 2), (3, 1)])
+        self.assertEqual(token_id, 2)
+        self.assertEqual(parse_moves('')[0].move_count, 0)
+
+        for moves in ('37', '3a', '0000000', '01010101'):
+            with self.assertRaises(ValueError):
+                parse_moves(moves)
+
+    def test_analyze(self):
+        game, token_id = parse_moves('3333224422')
+        analysis = analyze(game, token_id, depth=4)
+        self.assertEqual(analysis['best'], 1)
+        self.assertEqual(analysis['columns'][1], {'score': 16, 'result': 'win in 1'})
+        self.assertEqual(analysis['columns'][5]['result'], 'win in 1')
+        self.assertEqual(analysis['columns'][0]['result'], 'win in 3')
+        # The game is left as it was
+        self.assertEqual(game.move_count, 10)
+
+        analysis = analyze(*parse_moves('33'), depth=2)
+        self.assertEqual(set(analysis['columns']), set(range(7)))
+        self.assertTrue(all(column['result'] == 'unknown' for column in analysis['columns'].values()))
+
+        board = format_board(parse_moves('34')[0])
+        self.assertEqual(board.splitlines()[-2:], ['. . . X O . .', '0 1 2 3 4 5 6'])
+
+    def test_main(self):
+        self.assertEqual(run(['bestmove', '3333224422', '--strategy', 'negamax:depth=2']), (0, '1\n'))
+        self.assertEqual(run(['bestmove', '', '--strategy', 'random', '--seed', '0'])[0], 0)
+        code, output = run(['analyze', '3333224422', '--depth', '2', '--json'])
+        self.assertEqual(json.loads(output)['best'], 1)
+        code, output = run(['analyze', '3333224422', '--depth', '2'])
+        self.assertIn('best column: 1', output)
+        self.assertEqual(run(['bestmove', '3a'])[0], 2)
+        self.assertEqual(run(['bestmove', '3434343'])[0], 2)
+        code, output = run(['selfplay', '--games', '4', '--workers', '1'])
+        self.assertIn('4 games', output)
+
+    def test_no_pygame(self):
+        # The engine and the headless tools import without pygame
+        modules = 'cli game tools solver mcts evaluator strategies book endgame records selfplay tournament server metrics'
+        script = f'import sys\nimport {", ".join(modules.split())}\nassert "pygame" not in sys.modules, "pygame imported"\n'
+        subprocess.run([sys.executable, '-c', script], cwd=ROOT, check=True)
+
+        result = subprocess.run(
+            [sys.executable, 'cli.py', 'bestmove', '3333224422', '--strategy', 'negamax:depth=2'],
+            cwd=ROOT, check=True, capture_output=True, text=True,
+        )
+        self.assertEqual(result.stdout, '1\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
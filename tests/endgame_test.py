@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from endgame import distance
+from endgame import EndgameCache
+from endgame import EndgameEntry
+from game import Game
+from solver import position
+from solver import Solver
+
+
+def late_game(seed: int, empty: int = 12) -> tuple[Game, int]:
+    """Helper function to play random moves until a game that is not over has empty empty cells
+    """
+    rng = np.random.default_rng(seed)
+    while True:
+        game = Game()
+        token_id = 1
+        while not game.over and game.move_count < 42 - empty:
+            legal = game.legal_moves()
+            game.place_token(legal[rng.integers(len(legal))], token_id)
+            token_id = 3 - token_id
+        if not game.over:
+            return game, token_id
+
+
+def fill_cache(path: str, seeds: range) -> list[tuple[int, int]]:
+    """Helper function run in other processes to add positions to a cache file
+    """
+    results = []
+    with EndgameCache(path) as cache:
+        for seed in seeds:
+            entry = cache.lookup(*late_game(seed))
+            assert entry is not None
+            results.append((entry.col_n, entry.score))
+    return results
+
+
+class TestEndgame(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'endgame.bin')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_distance(self):
+        # Player 1 wins with the next move, or after the next move of both players
+        self.assertEqual(distance(18, 6, 42), 1)
+        self.assertEqual(distance(17, 6, 42), 3)
+        # Player 1 loses after its next move
+        self.assertEqual(distance(-18, 6, 42), 2)
+        self.assertEqual(distance(0, 30, 42), 12)
+
+    def test_lookup(self):
+        solver = Solver()
+        with EndgameCache(self.path, entries=64) as cache:
+            self.assertIsNone(cache.lookup(Game(), 1))
+            for seed in range(5):
+                game, token_id = late_game(seed)
+                entry = cache.lookup(game, token_id)
+                expected = solver.best_move(*position(game, token_id))
+                self.assertEqual(entry[:2], expected)
+                self.assertEqual(cache.get(*position(game, token_id)), entry)
+                self.assertEqual(entry.distance, distance(entry.score, game.move_count, 42))
+            self.assertEqual((cache.hits, cache.misses), (0, 5))
+            self.assertEqual(len(cache), 5)
+
+        # The results are kept in the file
+        with EndgameCache(self.path, readonly=True) as cache:
+            self.assertEqual(len(cache), 5)
+            self.assertEqual(cache.n_buckets * 4, 64)
+            game, token_id = late_game(0)
+            self.assertIsNotNone(cache.lookup(game, token_id))
+            game, token_id = late_game(5)
+            self.assertIsNotNone(cache.lookup(game, token_id))
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            self.assertEqual(len(cache), 5)
+
+            self.assertIsNone(cache.lookup(Game(5, 7), 1))
+
+    def test_mirror(self):
+        game, token_id = late_game(3)
+        mirror = Game()
+        for col_n, token in game.history:
+            mirror.place_token(6 - col_n, token)
+        with EndgameCache(self.path) as cache:
+            entry = cache.lookup(game, token_id)
+            self.assertEqual(cache.canonical(*position(game, token_id))[0], cache.canonical(*position(mirror, token_id))[0])
+            mirror_entry = EndgameEntry(6 - entry.col_n, entry.score, entry.distance)
+            self.assertEqual(cache.get(*position(mirror, token_id)), mirror_entry)
+
+    def test_replacement(self):
+        with EndgameCache(self.path, entries=4) as cache:
+            positions = [position(*late_game(seed)) for seed in range(4)]
+            for n, (current, mask) in enumerate(positions):
+                cache.put(current, mask, n, 0)
+            self.assertEqual(len(cache), 4)
+
+            # Positions with fewer empty cells than all the cached ones are not added
+            game, token_id = late_game(4, empty=10)
+            cache.put(*position(game, token_id), 1, 0)
+            self.assertIsNone(cache.get(*position(game, token_id)))
+
+            # A position with more empty cells replaces one of the positions with the fewest
+            game, token_id = late_game(5, empty=14)
+            cache.put(*position(game, token_id), 1, 2)
+            self.assertEqual(cache.get(*position(game, token_id)).col_n, 2)
+            self.assertEqual(sum(cache.get(*pos) is not None for pos in positions), 3)
+
+            # A position already in the cache is updated in place
+            cache.put(*positions[1], 7, 3)
+            self.assertEqual(cache.get(*positions[1])[:2], (3, 7))
+            self.assertEqual(len(cache), 4)
+
+            # A slot that is being written (words that do not match) is a miss
+            key, _ = cache.canonical(*positions[1])
+            slot = next(slot for slot in cache.table[0] if slot[0] ^ slot[1] == key)
+            slot[0] ^= 1
+            self.assertIsNone(cache.get(*positions[1]))
+            del slot
+
+    def test_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a cache')
+        with self.assertRaises(ValueError):
+            EndgameCache(self.path)
+        with self.assertRaises(ValueError):
+            EndgameCache(self.path + '2', rows=8, cols=8)
+        with self.assertRaises(FileNotFoundError):
+            EndgameCache(self.path + '3', readonly=True)
+
+    def test_processes(self):
+        # Processes share the file: results written by one process are read by the others
+        with ProcessPoolExecutor(2) as pool:
+            results = list(pool.map(fill_cache, [self.path] * 4, [range(0, 6), range(3, 9), range(6, 12), range(0, 12)]))
+        with EndgameCache(self.path, readonly=True) as cache:
+            self.assertEqual(len(cache), 12)
+            for seed in range(12):
+                self.assertEqual(cache.get(*position(*late_game(seed)))[:2], results[3][seed])
+
+    def test_make_move(self):
+        game, token_id = late_game(1)
+        with EndgameCache(self.path) as cache:
+            col_n = cache.lookup(game, token_id).col_n
+            game.endgame = cache
+            # The cache is used before the strategy
+            self.assertEqual(game.make_move(lambda game, token_id: 1 / 0, token_id)[1], col_n)
+            self.assertEqual(cache.hits, 1)
+
+    def test_budget(self):
+        # A position without an immediate win, its solve searches a few thousand positions
+        game, token_id = late_game(27, empty=14)
+        stop = threading.Event()
+        stop.set()
+        with EndgameCache(self.path) as cache:
+            # A solve stopped before the end gives no result and is not cached
+            self.assertIsNone(cache.lookup(game, token_id, stop=stop))
+            self.assertIsNone(cache.lookup(game, token_id, nodes=10))
+            self.assertIsNone(cache.lookup(game, token_id, time_budget=0))
+            self.assertEqual(len(cache), 0)
+            game.endgame = cache
+            self.assertEqual(game.choose_move(lambda game, token_id: 5, token_id, stop=stop), 5)
+            # Without solve, a missing position is left to the strategy
+            self.assertEqual(game.choose_move(lambda game, token_id: 5, token_id, solve=False), 5)
+            self.assertIsNone(cache.lookup(game, token_id, solve=False))
+            self.assertEqual(len(cache), 0)
+
+            entry = cache.lookup(game, token_id, stop=threading.Event(), nodes=10 ** 9, time_budget=60)
+            self.assertEqual(entry[:2], Solver().best_move(*position(game, token_id)))
+            self.assertEqual(len(cache), 1)
+            # Cached results are used without solve
+            self.assertEqual(game.choose_move(lambda game, token_id: 5, token_id, solve=False), entry.col_n)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import unittest
+
+import numpy as np
+
+import tools as tl
+from evaluator import default_weights
+from evaluator import Evaluator
+from evaluator import GreedyStrategy
+from game import Game
+from solver import NegamaxStrategy
+from solver import position
+from solver import Solver
+
+
+def reference_score(board: np.ndarray, connect: int, weights: tuple[int, ...]) -> int:
+    """Score for player 1 computed from all the windows of the board
+    """
+    lines = board.ravel()[tl.line_indices(*board.shape, connect)]
+    ones = np.count_nonzero(lines == 1, axis=1)
+    twos = np.count_nonzero(lines == 2, axis=1)
+    return sum(weights[one] if not two else -weights[two] if not one else 0 for one, two in zip(ones, twos))
+
+
+class TestEvaluator(unittest.TestCase):
+
+    def test_default_weights(self):
+        self.assertEqual(default_weights(4), (0, 1, 5, 25, 5 ** 6))
+        self.assertEqual(len(default_weights(5)), 6)
+        with self.assertRaises(ValueError):
+            Evaluator(weights=(0, 1, 2))
+
+    def test_matches_reference(self):
+        rng = np.random.default_rng(0)
+        for rows, cols, connect in [(6, 7, 4), (9, 9, 5)]:
+            weights = default_weights(connect)
+            for _ in range(5):
+                game = Game(rows, cols, connect)
+                evaluator = game.evaluator
+                token_id = 1
+                while not game.over:
+                    game.place_token(rng.choice(game.legal_moves()), token_id)
+                    token_id = 3 - token_id
+                    self.assertEqual(evaluator.score, reference_score(game.board, connect, weights))
+                self.assertIs(game.evaluator, evaluator)
+
+    def test_remove(self):
+        rng = np.random.default_rng(1)
+        game = Game()
+        for move_n in range(20):
+            game.place_token(rng.choice(game.legal_moves()), move_n % 2 + 1)
+        evaluator = Evaluator()
+        evaluator.load(game.bitboards)
+        self.assertEqual(evaluator.score, game.evaluator.score)
+        counts = [list(player_counts) for player_counts in evaluator.counts]
+        score = evaluator.score
+
+        bits = [col_n * game.col_bits + game.heights[col_n] for col_n in game.legal_moves()]
+        for player, bit in enumerate(bits):
+            evaluator.place(bit, player % 2)
+        for player, bit in reversed(list(enumerate(bits))):
+            evaluator.remove(bit, player % 2)
+        self.assertEqual(evaluator.score, score)
+        self.assertEqual(evaluator.counts, counts)
+        self.assertEqual(evaluator.value(2), -score)
+
+    def test_greedy(self):
+        game = Game()
+        for col_n, token_id in [(2, 1), (6, 2), (2, 1), (6, 2), (2, 1), (5, 2)]:
+            game.place_token(col_n, token_id)
+        strategy = GreedyStrategy()
+        self.assertEqual(strategy(game, 1), 2)
+        # Blocks the three of the other player
+        game = Game()
+        for col_n, token_id in [(0, 1), (0, 2), (1, 1), (0, 2), (2, 1)]:
+            game.place_token(col_n, token_id)
+        self.assertEqual(strategy(game, 2), 3)
+
+    def test_solver_leaf(self):
+        game = Game()
+        for col_n, token_id in [(3, 1), (3, 2), (2, 1)]:
+            game.place_token(col_n, token_id)
+        solver = Solver(evaluator=Evaluator())
+        col_n, score = solver.best_move(*position(game, 2), depth=4)
+        self.assertTrue(-1 < score < 1)
+        self.assertIn(col_n, (1, 4))
+        # The search leaves the evaluator as it found it
+        self.assertEqual(solver.evaluator.score, game.evaluator.score)
+
+        # Known results are still exact
+        game = Game()
+        for col_n, token_id in [(2, 1), (6, 2), (2, 1), (6, 2), (2, 1), (5, 2)]:
+            game.place_token(col_n, token_id)
+        self.assertEqual(solver.best_move(*position(game, 1), depth=4), (2, (42 + 1 - 6) // 2))
+
+        strategy = NegamaxStrategy(depth=4, heuristic=True)
+        self.assertIn(strategy(Game(), 1), range(7))
+        self.assertIsInstance(strategy.solver.evaluator, Evaluator)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,7 @@ from unittest.mock import patch
 
 import numpy as np
 
+import tools as tl
 from game import Game
 
 
@@ -15,17 +16,19 @@ class TestGame(unittest.TestCase):
 
     def test_get_first_free_idx(self):
 
-        self.game.board = np.zeros((6, 7))
-        self.game.board[-1, :] = 1
-        self.game.board[-2, :3] = 2
-        self.game.board[-3, 2] = 1
+        board = np.zeros((6, 7))
+        board[-1, :] = 1
+        board[-2, :3] = 2
+        board[-3, 2] = 1
+        self.game.board = board
 
         lst_idxs = [-3, -3, -4, -2, -2, -2, -2]
 
         for col_n, last_idx in enumerate(lst_idxs):
             self.assertEqual(self.game.get_first_free_idx(col_n), last_idx + 6)
 
-        self.game.board[:, -1] = 1
+        board[:, -1] = 1
+        self.game.board = board
         self.assertEqual(self.game.get_first_free_idx(6), -1)
 
     @patch('game.Game.check_win')
@@ -71,6 +74,13 @@ class TestGame(unittest.TestCase):
         self.assertEqual(mock_get_first_free_idx.call_count, 3)
         self.assertEqual(mock_check_win.call_count, 2)
 
+        # Columns off the board and token IDs other than 1 and 2 are rejected before anything is changed
+        for col_n, token_id in [(-1, 1), (7, 1), (0, 0), (0, 3)]:
+            with self.assertRaises(ValueError):
+                self.game.place_token(col_n, token_id)
+        self.assertEqual(mock_get_first_free_idx.call_count, 3)
+        self.assertEqual(self.game.move_count, 2)
+
     def test_check_win(self):
 
         # Checking where winners are found in the following board
@@ -123,10 +133,12 @@ class TestGame(unittest.TestCase):
         self.game.board = np.zeros((6, 7))
         self.assertFalse(self.game.check_draw())
 
-        self.game.board[:, :3] = 1
+        board = np.zeros((6, 7))
+        board[:, :3] = 1
+        self.game.board = board
         self.assertFalse(self.game.check_draw())
 
-        self.game.board = np.ones_like(self.game.board)
+        self.game.board = np.ones_like(board)
         self.assertTrue(self.game.check_draw())
 
     @patch('numpy.random.randint')
@@ -142,13 +154,269 @@ class TestGame(unittest.TestCase):
         self.assertEqual(ret, (0, 1))
         self.assertEqual(mock_place_token.call_count, 1)
         self.assertEqual(mock_random.call_count, 1)
+        mock_place_token.assert_called_with(1, 2)
+
+    def test_make_move_legal(self):
+        # The random column is sampled from the columns that are not full, with a single draw
+        board = np.zeros((6, 7))
+        board[:, :6] = [[1, 2, 1, 2, 1, 2]] * 3 + [[2, 1, 2, 1, 2, 1]] * 3
+        for _ in range(10):
+            game = Game()
+            game.board = board
+            with patch('numpy.random.randint', wraps=np.random.randint) as mock_random:
+                self.assertEqual(game.make_move(token_id=1), (5, 6))
+            mock_random.assert_called_once_with(1)
+
+        # A full board has no move left
+        board[:, 6] = [1, 2, 1, 2, 1, 2]
+        game = Game()
+        game.board = board
+        self.assertEqual(game.make_move(), (-1, -1))
+
+    def test_board_reload(self):
+        # Loading a board after a finished game starts from the winner of the new board
+        for move_n, col_n in enumerate([0, 1, 0, 1, 0, 1, 0]):
+            self.game.place_token(col_n, move_n % 2 + 1)
+        self.assertEqual(self.game.winner, 1)
+        self.assertTrue(self.game.over)
 
-        # Check that if the place_token function return -1
-        # the while loops keeps searcing for a valid move
-        # until the place_token function returns a valid move
+        self.game.board = np.zeros((6, 7))
+        self.assertEqual(self.game.winner, 0)
+        self.assertFalse(self.game.over)
+
+        # A loaded board with a line of 4 tokens has a winner
+        board = np.zeros((6, 7))
+        board[5, 2:6] = 2
+        board[5, 0] = board[4, 2:5] = 1
+        self.game.board = board
+        self.assertEqual(self.game.winner, 2)
+        self.assertTrue(self.game.over)
+
+    def test_board_view(self):
+        self.game.place_token(3, 1)
+        self.game.place_token(3, 2)
+        self.game.place_token(0, 1)
+
+        expected = np.zeros((6, 7))
+        expected[5, 3] = 1
+        expected[4, 3] = 2
+        expected[5, 0] = 1
+        np.testing.assert_array_equal(self.game.board, expected)
+        self.assertEqual(self.game.heights, [1, 0, 0, 2, 0, 0, 0])
+
+        # The board is a read-only view, tokens have to be placed with place_token
+        with self.assertRaises(ValueError):
+            self.game.board[0, 0] = 1
+
+        # Loading a board gives back the same board
+        other = Game()
+        other.board = self.game.board
+        self.assertEqual(other.bitboards, self.game.bitboards)
+        self.assertEqual(other.heights, self.game.heights)
+
+    def test_place_token_wins(self):
+        # Vertical, horizontal and both diagonal lines
+        for moves, winner in [
+            ([(0, 1), (1, 2), (0, 1), (1, 2), (0, 1), (1, 2), (0, 1)], 1),
+            ([(0, 2), (0, 1), (1, 2), (1, 1), (2, 2), (2, 1), (3, 2)], 2),
+            ([(0, 1), (1, 2), (1, 1), (2, 2), (2, 1), (3, 2), (2, 1), (3, 2), (3, 1), (6, 2), (3, 1)], 1),
+            ([(6, 1), (5, 2), (5, 1), (4, 2), (4, 1), (3, 2), (4, 1), (3, 2), (3, 1), (0, 2), (3, 1)], 1),
+        ]:
+            game = Game()
+            for col_n, token_id in moves[:-1]:
+                game.place_token(col_n, token_id)
+                self.assertEqual(game.winner, 0)
+            game.place_token(*moves[-1])
+            self.assertEqual(game.winner, winner)
+
+        # Lines must not wrap around from the top of a column to the bottom of the next one
+        game = Game()
+        for col_n, token_id in [(0, 2), (0, 2), (0, 2), (0, 1), (0, 1), (0, 1), (1, 1)]:
+            game.place_token(col_n, token_id)
+        self.assertEqual(game.winner, 0)
+
+        # A full column can not take more tokens
+        game = Game()
+        for _ in range(6):
+            self.assertNotEqual(game.place_token(4, 1), (-1, -1))
+        self.assertEqual(game.place_token(4, 2), (-1, -1))
+        self.assertEqual(game.get_first_free_idx(4), -1)
 
-        mock_place_token.side_effect = [(-1, -1), (-1, -1), (2, 0)]
-        ret = self.game.make_move()
-        self.assertEqual(ret, (2, 0))
-        self.assertEqual(mock_place_token.call_count, 4)
-        self.assertEqual(mock_random.call_count, 4)
+    @patch('numpy.random.randint')
+    def test_make_move_strategy(self, mock_random):
+        mock_random.return_value = 6
+        self.assertEqual(self.game.make_move(), (5, 6))
+        mock_random.assert_called_with(7)
+
+        def strategy(game, token_id):
+            self.assertIs(game, self.game)
+            self.assertEqual(token_id, 1)
+            return 2
+
+        self.assertEqual(self.game.make_move(strategy, 1), (5, 2))
+        self.assertEqual(self.game.board[5, 2], 1)
+        self.assertEqual(mock_random.call_count, 1)
+
+    def test_incremental_state(self):
+        self.assertEqual(self.game.move_count, 0)
+        self.assertEqual(self.game.legal_moves(), list(range(7)))
+        self.assertFalse(self.game.over)
+
+        for _ in range(6):
+            self.game.place_token(2, 1)
+            self.game.place_token(2, 2)
+        self.assertEqual(self.game.move_count, 6)
+        self.assertEqual(self.game.legal, 0b1111011)
+        self.assertEqual(self.game.legal_moves(), [0, 1, 3, 4, 5, 6])
+        self.assertFalse(self.game.over)
+
+        # Full columns don't count as moves
+        self.assertEqual(self.game.move_count, 6)
+
+        for col_n in range(4, 7):
+            self.game.place_token(col_n, 1)
+        self.assertFalse(self.game.over)
+        self.game.place_token(3, 1)
+        self.assertEqual(self.game.winner, 1)
+        self.assertTrue(self.game.over)
+
+        # Filling the board ends the game (the board has no line of 4 tokens)
+        board = np.array([[1, 2, 1, 2, 1, 2, 1]] * 3 + [[2, 1, 2, 1, 2, 1, 2]] * 3)
+        board[0, 4] = 0
+        self.game = Game()
+        self.game.board = board
+        self.assertEqual(self.game.move_count, 41)
+        self.assertEqual(self.game.legal_moves(), [4])
+        self.assertFalse(self.game.check_draw())
+        self.assertFalse(self.game.over)
+        self.game.place_token(4, 2)
+        self.assertTrue(self.game.check_draw())
+        self.assertTrue(self.game.over)
+        self.assertEqual(self.game.legal_moves(), [])
+
+    def test_board_shapes(self):
+        game = Game(7, 8)
+        self.assertEqual(game.board.shape, (7, 8))
+        self.assertEqual(game.legal_moves(), list(range(8)))
+        for col_n in range(4):
+            game.place_token(col_n, 1)
+        self.assertEqual(game.winner, 1)
+
+        # Connect 5 on a 9x9 board: 4 in a row does not win
+        game = Game(9, 9, 5)
+        for row_n in range(4):
+            game.place_token(0, 2)
+            game.place_token(row_n + 1, 1)
+        self.assertEqual(game.winner, 0)
+        game.place_token(0, 2)
+        self.assertEqual(game.winner, 2)
+        self.assertEqual(game.board.shape, (9, 9))
+
+        # Loading a board keeps the connect length
+        board = np.zeros((9, 9), dtype=np.int8)
+        board[8, :4] = 1
+        game.board = board
+        self.assertFalse(game.check_win(8, 0))
+        self.assertEqual(game.connect, 5)
+
+        with self.assertRaises(ValueError):
+            Game(6, 7, 1)
+
+    def test_check_win_shapes(self):
+        # check_win agrees with the vectorized check of all the lines
+        rng = np.random.default_rng(0)
+        for rows, cols, connect in [(7, 8, 4), (9, 9, 5), (4, 5, 3)]:
+            game = Game(rows, cols, connect)
+            boards = rng.choice(3, size=(100, rows, cols), p=[0.4, 0.3, 0.3])
+            for board, winner in zip(boards, tl.check_winners(boards, connect)):
+                game.board = board
+                cells = [
+                    (row_n, col_n) for row_n in range(rows) for col_n in range(cols) if game.check_win(row_n, col_n)
+                ]
+                self.assertEqual(winner, max((board[cell] for cell in cells), default=0))
+
+    def test_keys(self):
+        moves = [(3, 1), (2, 2), (3, 1), (6, 2), (0, 1)]
+        keys = {self.game.key}
+        for col_n, token_id in moves:
+            self.game.place_token(col_n, token_id)
+            keys.add(self.game.key)
+        self.assertEqual(len(keys), len(moves) + 1)
+
+        # The key only depends on the position, not on the order of the moves
+        game = Game()
+        for col_n, token_id in [(0, 1), (6, 2), (3, 1), (2, 2), (3, 1)]:
+            game.place_token(col_n, token_id)
+        self.assertEqual(game.key, self.game.key)
+        loaded = Game()
+        loaded.board = self.game.board
+        self.assertEqual(loaded.key, self.game.key)
+
+        # The mirror position swaps the key and the mirror key
+        mirror = Game()
+        for col_n, token_id in moves:
+            mirror.place_token(6 - col_n, token_id)
+        self.assertEqual(mirror.key, self.game.mirror_key)
+        self.assertEqual(mirror.mirror_key, self.game.key)
+        self.assertEqual(mirror.canonical_key, self.game.canonical_key)
+        self.assertNotEqual(mirror.key, self.game.key)
+        self.assertLess(self.game.canonical_key, 1 << 64)
+
+        # Symmetric positions are their own mirror
+        game = Game()
+        game.place_token(3, 1)
+        self.assertEqual(game.key, game.mirror_key)
+        self.assertEqual(Game().key, 0)
+        self.assertNotEqual(Game(7, 8).zobrist, game.zobrist)
+
+    def test_undo_move(self):
+        def state(game: Game) -> tuple:
+            return (
+                list(game.bitboards), list(game.heights), game.winner, game.move_count, game.legal, game.over,
+                game.key, game.mirror_key, game.evaluator.score, list(game.history), game.board.copy().tolist(),
+            )
+
+        rng = np.random.default_rng(0)
+        for _ in range(5):
+            game = Game()
+            states = [state(game)]
+            token_id = 1
+            # Keep playing after the game is won, undo restores the first winner
+            while game.legal:
+                game.place_token(rng.choice(game.legal_moves()), token_id)
+                token_id = 3 - token_id
+                states.append(state(game))
+            while game.history:
+                col_n = game.history[-1][0]
+                row_n = game.rows - game.heights[col_n]
+                self.assertEqual(game.undo_move(), (row_n, col_n))
+                states.pop()
+                self.assertEqual(state(game), states[-1])
+
+        with self.assertRaises(ValueError):
+            game.undo_move()
+
+    def test_trial_move(self):
+        self.game.place_token(3, 1)
+        key = self.game.key
+        with self.game.trial_move(3, 2) as location:
+            self.assertEqual(location, (4, 3))
+            self.assertEqual(self.game.board[4, 3], 2)
+            with self.game.trial_move(4, 1):
+                self.assertEqual(self.game.move_count, 3)
+        self.assertEqual(self.game.move_count, 1)
+        self.assertEqual(self.game.key, key)
+        self.assertEqual(self.game.board[4, 3], 0)
+
+        # The move is taken back when the block raises
+        with self.assertRaises(KeyError):
+            with self.game.trial_move(0, 2):
+                raise KeyError
+        self.assertEqual(self.game.history, [(3, 1)])
+
+        # Nothing to take back for a full column
+        for _ in range(5):
+            self.game.place_token(3, 2)
+        with self.game.trial_move(3, 1) as location:
+            self.assertEqual(location, (-1, -1))
+        self.assertEqual(self.game.move_count, 6)
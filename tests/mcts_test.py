@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import unittest
+
+import numpy as np
+
+from game import Game
+from mcts import MCTS
+from mcts import MCTSStrategy
+from solver import position
+from strategies import make_strategy
+
+
+class TestMCTS(unittest.TestCase):
+
+    def test_search(self):
+        game = Game()
+        for col_n, token_id in [(2, 1), (6, 2), (2, 1), (6, 2), (2, 1), (5, 2)]:
+            game.place_token(col_n, token_id)
+
+        search = MCTS(batch_size=32, rng=np.random.default_rng(0))
+        col_n, visits = search.search(*position(game, 1), iterations=100)
+        self.assertEqual(col_n, 2)
+        self.assertEqual(set(visits), set(range(7)))
+        self.assertEqual(search.playouts + visits[2], 32 * 100)
+
+        # Player 2 has to block
+        col_n, _ = search.search(*position(game, 2), iterations=300)
+        self.assertEqual(col_n, 2)
+
+        with self.assertRaises(ValueError):
+            search.search(*position(game, 1))
+
+        col_n, _ = search.search(*position(Game(), 1), time_budget=0.05)
+        self.assertIn(col_n, range(7))
+
+    def test_strategy(self):
+        self.assertIsInstance(make_strategy('mcts', {'iterations': 20}, seed=1), MCTSStrategy)
+
+        game = Game()
+        for col_n, token_id in [(0, 1), (0, 2), (1, 1), (0, 2), (2, 1)]:
+            game.place_token(col_n, token_id)
+        moves = [MCTSStrategy(iterations=200, seed=seed)(game, 2) for seed in range(3)]
+        self.assertEqual(moves, [3, 3, 3])
+
+        game = Game()
+        self.assertEqual(
+            [MCTSStrategy(iterations=20, seed=4)(game, 1) for _ in range(2)],
+            [MCTSStrategy(iterations=20, seed=4)(game, 1)] * 2,
+        )
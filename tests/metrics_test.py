@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import json
+import os
+import pstats
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import metrics
+from game import Game
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_observe(self):
+        histogram = metrics.Histogram()
+        self.assertEqual(histogram.percentile(50), 0.0)
+        for seconds in (1e-6, 1.5e-6, 3e-6, 4e-6, 1e-3, 1e4):
+            histogram.observe(seconds)
+        self.assertEqual(histogram.count, 6)
+        self.assertEqual(histogram.buckets[:3], [1, 1, 2])
+        self.assertEqual(histogram.buckets[10], 1)
+        self.assertEqual(histogram.buckets[-1], 1)
+        self.assertEqual(histogram.min, 1e-6)
+        self.assertEqual(histogram.max, 1e4)
+        self.assertEqual(histogram.percentile(50), 4e-6)
+        self.assertEqual(histogram.percentile(100), 1e4)
+
+        result = histogram.to_dict()
+        self.assertAlmostEqual(result['mean'], sum((1e-6, 1.5e-6, 3e-6, 4e-6, 1e-3, 1e4)) / 6)
+        self.assertEqual(result['p50'], 4e-6)
+
+
+class TestRegistry(unittest.TestCase):
+
+    def test_snapshot(self):
+        registry = metrics.Registry()
+        registry.count('moves')
+        registry.count('moves', 2)
+        registry.observe('frame', 0.01)
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['counters'], {'moves': 3})
+        self.assertEqual(snapshot['histograms']['frame']['count'], 1)
+        self.assertEqual(snapshot['pid'], os.getpid())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'metrics-{pid}.json')
+            registry.dump(path)
+            with open(path.format(pid=os.getpid())) as f:
+                self.assertEqual(json.load(f)['counters'], {'moves': 3})
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+        registry.clear()
+        self.assertEqual(registry.snapshot()['counters'], {})
+
+    def test_disabled(self):
+        # The tests run without CONNECT4_METRICS, the hot paths are not wrapped
+        self.assertFalse(metrics.ENABLED)
+        self.assertFalse(hasattr(Game.check_win, '__wrapped__'))
+
+        def func():
+            return 1
+        self.assertIs(metrics.timed('func')(func), func)
+        with patch.object(metrics, 'REGISTRY', metrics.Registry()) as registry:
+            metrics.count('calls')
+            metrics.observe('func', 1.0)
+            self.assertEqual(registry.snapshot()['counters'], {})
+
+    def test_enabled(self):
+        with patch.object(metrics, 'ENABLED', True), patch.object(metrics, 'REGISTRY', metrics.Registry()) as registry:
+            wrapped = metrics.timed('func')(lambda x: 2 * x)
+            self.assertEqual(wrapped(2), 4)
+            metrics.count('calls')
+            self.assertEqual(registry.snapshot()['histograms']['func']['count'], 1)
+            self.assertEqual(registry.snapshot()['counters'], {'calls': 1})
+
+    def test_environment(self):
+        # Metrics enabled by the environment are written when the process exits
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'metrics.json')
+            env = dict(os.environ, CONNECT4_METRICS=path)
+            script = 'from game import Game; from strategies import RandomStrategy\n' \
+                'game = Game()\n' \
+                'while not game.over: game.make_move(RandomStrategy(0), game.move_count % 2 + 1)\n'
+            root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            subprocess.run([sys.executable, '-c', script], env=env, cwd=root, check=True)
+            with open(path) as f:
+                histograms = json.load(f)['histograms']
+        self.assertGreater(histograms['game.make_move']['count'], 6)
+        self.assertEqual(histograms['game.check_win']['count'], histograms['game.make_move']['count'])
+        self.assertEqual(histograms['game.choose_move']['count'], histograms['game.make_move']['count'])
+
+
+class TestProfile(unittest.TestCase):
+
+    def test_profile(self):
+        with metrics.profile(None) as profiler:
+            self.assertIsNone(profiler)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'app.prof')
+            with metrics.profile(path):
+                Game().place_token(3, 1)
+            stats = pstats.Stats(path)
+        self.assertTrue(any(func[2] == 'place_token' for func in stats.stats))  # type: ignore[attr-defined]
+
+
+if __name__ == '__main__':
+    unittest.main()
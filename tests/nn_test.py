@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from game import Game
+from nn import encode
+from nn import encode_positions
+from nn import load_network
+from nn import loss_and_gradients
+from nn import Network
+from nn import NetworkEvaluator
+from nn import NetworkStrategy
+from nn import train
+from nn import training_data
+from selfplay import play_games
+from solver import NegamaxStrategy
+from solver import position
+from solver import Solver
+from strategies import make_strategy
+
+
+def play(moves: list[int]) -> Game:
+    """Helper function to play columns on a new game, player 1 starts
+    """
+    game = Game()
+    for move_n, col_n in enumerate(moves):
+        game.place_token(col_n, move_n % 2 + 1)
+    return game
+
+
+class TestNetwork(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'weights.npz')
+        self.network = Network(seed=0)
+        self.network.save(self.path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_encode(self):
+        game = play([3, 3, 2])
+        inputs = encode(game.board, 2)
+        self.assertEqual(inputs.shape, (1, 84))
+        mine, theirs = inputs.reshape(2, 6, 7)
+        self.assertEqual(mine[5, 3], 0)
+        self.assertEqual(mine[4, 3], 1)
+        self.assertEqual(theirs[5, 3], 1)
+        self.assertEqual(theirs[5, 2], 1)
+        self.assertEqual(inputs.sum(), 3)
+        np.testing.assert_array_equal(encode(game.board, 1), np.concatenate([theirs, mine]).reshape(1, -1))
+
+        rng = np.random.default_rng(0)
+        boards, token_ids, currents, masks = [], [], [], []
+        for _ in range(10):
+            game = Game()
+            token_id = 1
+            for _ in range(rng.integers(30)):
+                if game.over:
+                    break
+                game.place_token(rng.choice(game.legal_moves()), token_id)
+                token_id = 3 - token_id
+            boards.append(game.board)
+            token_ids.append(token_id)
+            currents.append(position(game, token_id)[0])
+            masks.append(position(game, token_id)[1])
+        np.testing.assert_array_equal(encode(np.stack(boards), np.array(token_ids)), encode_positions(currents, masks))
+
+    def test_predict(self):
+        game = play([0, 0, 0, 0, 0, 0, 3])
+        inputs = np.concatenate([encode(game.board, 2), encode(Game().board, 1)])
+        values, policies = self.network.predict(inputs)
+        self.assertEqual(values.shape, (2,))
+        self.assertEqual(policies.shape, (2, 7))
+        self.assertTrue(np.all(np.abs(values) < 1))
+        np.testing.assert_allclose(policies.sum(axis=1), 1, rtol=1e-5)
+        self.assertEqual(policies[0, 0], 0)
+        self.assertGreater(policies[1, 0], 0)
+
+        # A batch gives the same results as the positions one by one
+        batch = encode_positions(*zip(*(position(play([col_n]), 2) for col_n in range(7))))
+        batch_values, batch_policies = self.network.predict(batch)
+        for row_n in range(7):
+            value, policy = self.network.predict(batch[row_n:row_n + 1])
+            self.assertAlmostEqual(float(value[0]), float(batch_values[row_n]), places=5)
+            np.testing.assert_allclose(policy[0], batch_policies[row_n], rtol=1e-5)
+
+    def test_save_load(self):
+        network = Network.load(self.path)
+        self.assertEqual((network.rows, network.cols, network.n_layers), (6, 7, 2))
+        for name, param in self.network.params.items():
+            np.testing.assert_array_equal(network.params[name], param)
+
+        self.assertIs(load_network(self.path), load_network(self.path))
+        with self.assertRaises(FileNotFoundError):
+            load_network(os.path.join(self.directory.name, 'missing.npz'))
+        with self.assertRaises(ValueError):
+            Network(5, 7, params=network.params)
+
+    def test_training_data(self):
+        data = training_data([([3, 3, 2, 2, 1, 1, 0], 1), ([3], 0)], mirror=False)
+        self.assertEqual(data.inputs.shape, (8, 84))
+        np.testing.assert_array_equal(data.values, [1, -1, 1, -1, 1, -1, 1, 0])
+        np.testing.assert_array_equal(data.moves, [3, 3, 2, 2, 1, 1, 0, 3])
+        np.testing.assert_array_equal(data.inputs[2], encode(play([3, 3]).board, 1)[0])
+
+        mirrored = training_data([([3, 3, 2, 2, 1, 1, 0], 2)])
+        self.assertEqual(len(mirrored.inputs), 14)
+        np.testing.assert_array_equal(mirrored.moves[7:], [3, 3, 4, 4, 5, 5, 6])
+        np.testing.assert_array_equal(mirrored.inputs[9], encode(play([3, 3]).board[:, ::-1], 1)[0])
+
+    def test_gradients(self):
+        network = Network(hidden=(8,), seed=1)
+        rng = np.random.default_rng(0)
+        # Nonzero biases, so that the empty board is not on the kink of the ReLUs
+        network.params = {name: param + rng.normal(0, 0.1, param.shape) for name, param in network.params.items()}
+        data = training_data([([3, 3, 2, 2, 1, 1, 0], 1), ([2, 3, 4], 2)])
+        _, gradients = loss_and_gradients(network, data.inputs, data.values, data.moves)
+        for name, param in network.params.items():
+            index = tuple(rng.integers(size) for size in param.shape)
+            original = param[index]
+            param[index] = original + 1e-6
+            plus, _ = loss_and_gradients(network, data.inputs, data.values, data.moves)
+            param[index] = original - 1e-6
+            minus, _ = loss_and_gradients(network, data.inputs, data.values, data.moves)
+            param[index] = original
+            self.assertAlmostEqual(gradients[name][index], (plus - minus) / 2e-6, places=5, msg=name)
+
+    def test_train(self):
+        results = play_games((('random', {}), ('random', {})), 0, range(50))
+        data = training_data((result.moves, result.winner) for result in results)
+        losses = train(self.network, data, epochs=5, batch_size=64, seed=0)
+        self.assertEqual(len(losses), 5)
+        self.assertLess(losses[-1], losses[0])
+
+    def test_evaluator(self):
+        game = play([3, 3, 2, 4, 2])
+        evaluator = NetworkEvaluator(self.network)
+        evaluator.load(game.bitboards)
+        solver = Solver(evaluator=evaluator)
+        value = float(self.network.predict(encode(game.board, 2))[0][0])
+        self.assertAlmostEqual(solver.leaf_value(game.move_count), value, places=5)
+        self.assertAlmostEqual(evaluator.value(2), -evaluator.value(1))
+
+        bitboards = list(evaluator.bitboards)
+        evaluator.place(3 * 7 + 2, 1)
+        evaluator.remove(3 * 7 + 2, 1)
+        self.assertEqual(evaluator.bitboards, bitboards)
+
+        strategy = NegamaxStrategy(depth=3, network=self.path)
+        self.assertIn(strategy(game, 2), game.legal_moves())
+        self.assertIsInstance(strategy.solver.evaluator, NetworkEvaluator)
+
+    def test_strategy(self):
+        strategy = make_strategy('nn', {'path': self.path})
+        self.assertIsInstance(strategy, NetworkStrategy)
+        self.assertIs(strategy.network, load_network(self.path))
+        # Wins, and blocks a win of the opponent, whatever the weights
+        self.assertEqual(strategy(play([3, 0, 3, 0, 3]), 2), 3)
+        self.assertEqual(strategy(play([3, 0, 3, 0, 3, 0]), 1), 3)
+        self.assertEqual(NetworkStrategy(self.path, depth=1)(play([3, 0, 3, 0, 3, 0]), 1), 3)
+
+        sampling = NetworkStrategy(self.path, temperature=1.0, seed=0)
+        game = play([0, 0, 0, 0, 0, 0])
+        self.assertTrue(all(sampling(game, 1) != 0 for _ in range(20)))
+        with self.assertRaises(ValueError):
+            NetworkStrategy(self.path, depth=0)
+        with self.assertRaises(ValueError):
+            strategy(Game(7, 7), 1)
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import threading
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from evaluator import Evaluator
+from game import Game
+from parallel import benchmark_positions
+from parallel import measure_speedup
+from parallel import ParallelSearch
+from parallel import search_move
+from parallel import shared_manager
+from solver import NegamaxStrategy
+from solver import Solver
+from strategies import make_strategy
+
+
+class TestParallel(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = ProcessPoolExecutor(2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def test_benchmark_positions(self):
+        positions = benchmark_positions(5, 8, seed=1)
+        self.assertEqual(len(positions), 5)
+        self.assertTrue(all(mask.bit_count() == 8 for _, mask in positions))
+        self.assertEqual(positions, benchmark_positions(5, 8, seed=1))
+
+    def test_same_as_serial(self):
+        # The best move and its score are the ones of the serial search at the same depth
+        positions = benchmark_positions(6, 8) + benchmark_positions(6, 20) + benchmark_positions(3, 30)
+        for heuristic in (False, True):
+            search = ParallelSearch(heuristic=heuristic, executor=self.pool)
+            for depth in (1, 3, 6):
+                for current, mask in positions:
+                    solver = Solver(evaluator=Evaluator() if heuristic else None)
+                    self.assertEqual(
+                        search.best_move(current, mask, depth=depth), solver.best_move(current, mask, depth=depth),
+                    )
+
+    def test_budget(self):
+        search = ParallelSearch(executor=self.pool)
+        current, mask = benchmark_positions(1, 2)[0]
+        start = time.perf_counter()
+        col_n, _ = search.best_move(current, mask, time_budget=0.2)
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertIn(col_n, range(7))
+
+        search.stop = threading.Event()
+        search.stop.set()
+        self.assertIn(search.best_move(current, mask)[0], range(7))
+
+        search.stop = threading.Event()
+        timer = threading.Timer(0.3, search.stop.set)
+        timer.start()
+        start = time.perf_counter()
+        self.assertIn(search.best_move(current, mask)[0], range(7))
+        self.assertLess(time.perf_counter() - start, 5)
+        timer.join()
+
+        # The shared stop event stops a task that is running in a worker (here an exact solve)
+        stop = shared_manager().Event()
+        future = self.pool.submit(search_move, (6, 7, 4), False, current, mask, 3, 42, -42, 42, None, stop)
+        time.sleep(0.3)
+        stop.set()
+        self.assertIsNone(future.result(timeout=5))
+
+        # Immediate wins are played without a search
+        self.assertEqual(search.best_move(0b111, 0b111 | 0b111 << 7), (0, 18))
+        with self.assertRaises(ValueError):
+            search.best_move(0, Solver().board_mask)
+
+    def test_strategy(self):
+        strategy = make_strategy('parallel', {'depth': 4, 'workers': 2})
+        game = Game()
+        token_id = 1
+        while not game.over:
+            expected = NegamaxStrategy(depth=4)(game, token_id)
+            self.assertEqual(strategy(game, token_id), expected)
+            game.place_token(expected, token_id)
+            token_id = 3 - token_id
+
+    def test_measure_speedup(self):
+        rows = measure_speedup(benchmark_positions(2, 8), 4, [1, 2])
+        self.assertEqual([row[0] for row in rows], [0, 1, 2])
+        self.assertEqual(rows[0][2], 1.0)
+        self.assertTrue(all(row[1] > 0 and row[3] for row in rows))
+
+
+if __name__ == '__main__':
+    unittest.main()
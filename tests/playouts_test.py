@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import unittest
+
+import numpy as np
+
+from game import Game
+from playouts import board_positions
+from playouts import random_playouts
+from playouts import random_policy
+from solver import position
+from strategies import RandomStrategy
+
+
+class TestRandomPlayouts(unittest.TestCase):
+
+    def test_last_move(self):
+        # With one empty cell left the result of the playouts is known
+        rng = np.random.default_rng(0)
+        strategy = RandomStrategy(seed=0)
+        n_checked = 0
+        while n_checked < 3:
+            game = Game()
+            token_id = 1
+            while sum(game.heights) < 41 and game.winner == 0:
+                game.make_move(strategy, token_id)
+                token_id = 3 - token_id
+            if game.winner != 0:
+                continue
+
+            current, mask = position(game, token_id)
+            results = random_playouts(np.full(8, current, dtype=np.uint64), np.full(8, mask, dtype=np.uint64), 6, 7, rng)
+            game.make_move(strategy, token_id)
+            np.testing.assert_array_equal(results, 1 if game.winner else 0)
+            n_checked += 1
+
+    def test_empty_board(self):
+        rng = np.random.default_rng(0)
+        empty = np.zeros(4096, dtype=np.uint64)
+        results = random_playouts(empty, empty, 6, 7, rng)
+        counts = np.bincount(results, minlength=3)
+        # The first player wins a bit more than half of the random games
+        self.assertTrue(0.5 < counts[1] / 4096 < 0.62)
+        self.assertLess(counts[0], 40)
+
+        results_again = random_playouts(empty, empty, 6, 7, np.random.default_rng(0))
+        np.testing.assert_array_equal(results, results_again)
+
+        with self.assertRaises(ValueError):
+            random_playouts(empty, empty, 9, 9, rng)
+
+    def test_connect(self):
+        # On a 1x6 board the player to move has 5 tokens in a row and plays the last cell
+        rng = np.random.default_rng(0)
+        current = np.full(4, 0b0101010101, dtype=np.uint64)
+        mask = current.copy()
+        np.testing.assert_array_equal(random_playouts(current, mask, 1, 6, rng, connect=6), 1)
+        np.testing.assert_array_equal(random_playouts(current, mask, 1, 6, rng, connect=5), 1)
+        np.testing.assert_array_equal(random_playouts(current, mask, 1, 6, rng, connect=7), 0)
+
+    def test_boards(self):
+        # Playouts from boards shaped like Game.board give the same results as from the positions of the games
+        rng = np.random.default_rng(1)
+        games, token_ids = [], []
+        for _ in range(16):
+            game = Game()
+            token_id = 1
+            for _ in range(rng.integers(20)):
+                game.place_token(rng.choice(game.legal_moves()), token_id)
+                token_id = 3 - token_id
+                if game.over:
+                    game = Game()
+                    token_id = 1
+            games.append(game)
+            token_ids.append(token_id)
+        current, mask = board_positions(np.stack([game.board for game in games]), np.array(token_ids))
+        self.assertEqual(current.dtype, np.uint64)
+        self.assertEqual(current.tolist(), [position(game, token_id)[0] for game, token_id in zip(games, token_ids)])
+        self.assertEqual(mask.tolist(), [position(game, token_id)[1] for game, token_id in zip(games, token_ids)])
+
+        with self.assertRaises(ValueError):
+            board_positions(np.zeros((1, 9, 9)), 1)
+
+
+class TestRandomPolicy(unittest.TestCase):
+
+    def test_legal_columns(self):
+        rng = np.random.default_rng(0)
+        legal = np.zeros((3000, 7), dtype=bool)
+        legal[:1000, 6] = True
+        legal[1000:2000, [0, 3]] = True
+        col_ns = random_policy(legal, rng)
+        np.testing.assert_array_equal(col_ns[:1000], 6)
+        self.assertEqual(set(col_ns[1000:2000].tolist()), {0, 3})
+        self.assertTrue(400 < np.count_nonzero(col_ns[1000:2000] == 0) < 600)
+        np.testing.assert_array_equal(col_ns[2000:], -1)
+
+    def test_uniform(self):
+        rng = np.random.default_rng(1)
+        counts = np.bincount(random_policy(np.ones((7000, 7), dtype=bool), rng), minlength=7)
+        self.assertTrue(np.all(np.abs(counts - 1000) < 120))
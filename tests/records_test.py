@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from game import Game
+from records import GameReader
+from records import GameWriter
+from records import pack_moves
+from records import unpack_moves
+from records import UNFINISHED
+
+
+class TestRecords(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'games.rec')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_pack_moves(self):
+        for moves, cols in [([3, 3, 2, 6, 0], 7), ([15, 0, 15, 1], 16), ([], 7), ([17, 2, 0], 20)]:
+            flags, packed = pack_moves(moves, cols)
+            self.assertEqual(len(packed), len(moves) if cols > 16 else (len(moves) + 1) // 2)
+            np.testing.assert_array_equal(unpack_moves(packed, flags, len(moves)), moves)
+
+    def test_write_read(self):
+        with GameWriter(self.path) as writer:
+            writer.write([3, 3, 2, 4, 1, 5, 0], 1, metadata={'players': ['random', 'negamax'], 'seed': 1})
+            writer.write([], UNFINISHED)
+            writer.write([0, 8, 1, 8, 2, 8, 3, 8, 4], 1, 9, 9, 5)
+        # 7 bytes per record header, 4 bytes of moves for a 7-move game
+        self.assertLess(os.path.getsize(self.path), 5 + 3 * 7 + 4 + 5 + 60)
+
+        records = list(GameReader(self.path))
+        self.assertEqual(len(records), 3)
+        np.testing.assert_array_equal(records[0].moves, [3, 3, 2, 4, 1, 5, 0])
+        self.assertEqual(records[0].result, 1)
+        self.assertEqual(records[0].metadata, {'players': ['random', 'negamax'], 'seed': 1})
+        self.assertEqual(len(records[1].moves), 0)
+        self.assertEqual(records[1].result, UNFINISHED)
+        self.assertEqual(records[1].metadata, {})
+        self.assertEqual((records[2].rows, records[2].cols, records[2].connect), (9, 9, 5))
+
+        game = records[2].replay()
+        self.assertEqual(game.winner, 1)
+        self.assertEqual(game.move_count, 9)
+
+        # Writers add games at the end of the file
+        with GameWriter(self.path) as writer:
+            game = Game()
+            for col_n, token_id in [(0, 1), (1, 2), (0, 1)]:
+                game.place_token(col_n, token_id)
+            writer.write_game(game, {'source': 'server'})
+        records = list(GameReader(self.path))
+        self.assertEqual(len(records), 4)
+        np.testing.assert_array_equal(records[3].moves, [0, 1, 0])
+        self.assertEqual(records[3].result, UNFINISHED)
+
+    def test_positions(self):
+        with GameWriter(self.path) as writer:
+            writer.write([3, 3, 2], UNFINISHED)
+            writer.write([6, 0], UNFINISHED)
+        positions = [(game.move_count, col_n, record.moves[0]) for game, col_n, record in GameReader(self.path).positions()]
+        self.assertEqual(positions, [(0, 3, 3), (1, 3, 3), (2, 2, 3), (0, 6, 6), (1, 0, 6)])
+
+    def test_incomplete_record(self):
+        with GameWriter(self.path) as writer:
+            writer.write([3, 3, 2], UNFINISHED)
+            writer.write([1, 2, 3, 4, 5, 6], 0)
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        self.assertEqual(len(list(GameReader(self.path))), 1)
+
+        # A new writer drops the incomplete record, so the games it adds are read back
+        with GameWriter(self.path) as writer:
+            writer.write([0, 1, 0], UNFINISHED, metadata={'seed': 2})
+        records = list(GameReader(self.path))
+        self.assertEqual(len(records), 2)
+        np.testing.assert_array_equal(records[0].moves, [3, 3, 2])
+        np.testing.assert_array_equal(records[1].moves, [0, 1, 0])
+        self.assertEqual(records[1].metadata, {'seed': 2})
+
+    def test_invalid_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a record file')
+        with self.assertRaises(ValueError):
+            GameReader(self.path)
+        with self.assertRaises(ValueError):
+            GameWriter(self.path)
+
+        empty = os.path.join(self.directory.name, 'empty.rec')
+        GameWriter(empty).close()
+        self.assertEqual(list(GameReader(empty)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
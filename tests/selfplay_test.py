@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from records import GameReader
+from selfplay import play_game
+from selfplay import play_games
+from selfplay import run_selfplay
+from solver import NegamaxStrategy
+from strategies import RandomStrategy
+
+
+class TestSelfPlay(unittest.TestCase):
+
+    def test_play_game(self):
+        result = play_game((RandomStrategy(seed=0), RandomStrategy(seed=1)))
+        self.assertIn(result.winner, (0, 1, 2))
+        self.assertLessEqual(len(result.moves), 42)
+        self.assertTrue(all(0 <= col_n < 7 for col_n in result.moves))
+        self.assertGreaterEqual(min(result.think_times), 0)
+
+        # The solver always wins against a player that keeps playing in the first column
+        result = play_game((lambda game, token_id: 0, NegamaxStrategy(depth=4)))
+        self.assertEqual(result.winner, 2)
+
+        with self.assertRaises(ValueError):
+            play_game((lambda game, token_id: 0, lambda game, token_id: 0))
+
+    def test_play_games(self):
+        players = (('random', {}), ('random', {}))
+        results = play_games(players, 0, range(10))
+        self.assertEqual(len(results), 10)
+        # Every game has its own seed, independent of the other games in the chunk
+        self.assertEqual([result.moves for result in play_games(players, 0, range(5, 10))], [
+            result.moves for result in results[5:]
+        ])
+        self.assertNotEqual([result.moves for result in play_games(players, 1, range(10))], [
+            result.moves for result in results
+        ])
+
+    def test_run_selfplay(self):
+        players = (('random', {}), ('negamax', {'depth': 2}))
+        report = run_selfplay(*players, n_games=40, seed=3, workers=1, chunk_size=7)
+        self.assertEqual(report.n_games, 40)
+        self.assertEqual(sum(report.outcomes.values()), 40)
+        self.assertEqual(report.lengths.sum(), 40)
+        self.assertEqual(report.n_moves, np.dot(np.arange(43), report.lengths))
+        self.assertGreater(report.games_per_sec, 0)
+        self.assertGreater(report.outcomes[2], report.outcomes[1])
+        self.assertIn('games/s', report.summary())
+
+        # The results do not depend on the number of processes
+        parallel = run_selfplay(*players, n_games=40, seed=3, workers=2)
+        self.assertEqual(parallel.outcomes, report.outcomes)
+        np.testing.assert_array_equal(parallel.lengths, report.lengths)
+
+    def test_record(self):
+        players = (('random', {}), ('random', {}))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'games.rec')
+            report = run_selfplay(*players, n_games=10, seed=2, workers=1, record=path)
+            records = list(GameReader(path))
+        self.assertEqual(len(records), 10)
+        self.assertEqual(sum(len(record.moves) for record in records), report.n_moves)
+        self.assertEqual([record.metadata['game'] for record in records], list(range(10)))
+        self.assertEqual(records[0].metadata['players'], [['random', {}], ['random', {}]])
+        for record in records:
+            self.assertEqual(record.replay().winner, record.result)
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from loadgen import run_load
+from server import ai_move
+from server import GameServer
+from server import replay
+
+
+class TestServer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = GameServer(strategy='negamax:depth=2', idle_timeout=60.0, max_sessions=3, executor=ThreadPoolExecutor(2))
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def call(self, **request) -> dict:
+        return await self.server.handle_line(json.dumps(request).encode())
+
+    def test_replay(self):
+        game = replay([3, 3, 4])
+        self.assertEqual(game.move_count, 3)
+        self.assertEqual(game.board[5, 3], 1)
+        self.assertEqual(game.board[4, 3], 2)
+        self.assertEqual(game.board[5, 4], 1)
+
+    def test_ai_move(self):
+        # Player 2 has to block the horizontal three of player 1
+        self.assertEqual(ai_move('negamax:depth=2', [0, 0, 1, 1, 2]), 3)
+
+    async def test_session(self):
+        state = await self.call(op='new', id=7)
+        self.assertTrue(state['ok'])
+        self.assertEqual(state['id'], 7)
+        self.assertEqual(state['moves'], [])
+        self.assertEqual(state['legal'], list(range(7)))
+        self.assertIsNone(state['ai_col'])
+
+        session = state['session']
+        state = await self.call(op='move', session=session, col=3)
+        self.assertTrue(state['ok'])
+        self.assertEqual(state['moves'], [3, state['ai_col']])
+        self.assertEqual((await self.call(op='state', session=session))['moves'], state['moves'])
+
+        # Play until the game is over
+        while not state['over']:
+            state = await self.call(op='move', session=session, col=state['legal'][0])
+            self.assertTrue(state['ok'])
+        self.assertEqual(state['winner'], 2)
+        self.assertFalse((await self.call(op='move', session=session, col=0))['ok'])
+
+        self.assertTrue((await self.call(op='close', session=session))['ok'])
+        self.assertFalse((await self.call(op='state', session=session))['ok'])
+
+    async def test_ai_first(self):
+        state = await self.call(op='new', ai_first=True)
+        self.assertEqual(state['moves'], [state['ai_col']])
+        state = await self.call(op='move', session=state['session'], col=0)
+        self.assertEqual(len(state['moves']), 3)
+
+    async def test_errors(self):
+        self.assertFalse((await self.server.handle_line(b'not json'))['ok'])
+        self.assertFalse((await self.server.handle_line(b'[1, 2]'))['ok'])
+        self.assertFalse((await self.call(op='jump'))['ok'])
+        self.assertFalse((await self.call(op='move', session='nope', col=0))['ok'])
+
+        session = (await self.call(op='new'))['session']
+        for col in (-1, 7, '3', None, True, False):
+            response = await self.call(op='move', session=session, col=col)
+            self.assertFalse(response['ok'])
+            self.assertIn('illegal column', response['error'])
+        self.assertEqual((await self.call(op='state', session=session))['moves'], [])
+
+    async def test_ai_error(self):
+        # A failing AI gets an error response, the move of the player is taken back
+        session = (await self.call(op='new'))['session']
+        with patch('server.ai_move', side_effect=RuntimeError('boom')):
+            response = await self.call(op='move', session=session, col=3, id=1)
+            self.assertEqual(response, {'ok': False, 'error': 'the AI failed: boom', 'id': 1})
+            self.assertEqual((await self.call(op='state', session=session))['moves'], [])
+            self.assertFalse((await self.call(op='new', ai_first=True))['ok'])
+        self.assertEqual(len(self.server.sessions), 1)
+
+        with patch('server.ai_move', return_value=9):
+            self.assertIn('illegal column 9', (await self.call(op='move', session=session, col=3))['error'])
+        state = await self.call(op='move', session=session, col=3)
+        self.assertTrue(state['ok'])
+        self.assertEqual(len(state['moves']), 2)
+
+    async def test_evict_idle(self):
+        sessions = [(await self.call(op='new'))['session'] for _ in range(3)]
+        self.assertFalse((await self.call(op='new'))['ok'])
+
+        # Using a session makes it the most recently used one
+        await self.call(op='state', session=sessions[0])
+        now = self.server.sessions[sessions[0]].last_active
+        for session in self.server.sessions.values():
+            session.last_active = now - 100
+        self.server.sessions[sessions[0]].last_active = now
+        self.assertEqual(self.server.evict_idle(now), 2)
+        self.assertEqual(list(self.server.sessions), sessions[:1])
+        self.assertEqual(self.server.evict_idle(now + 59), 0)
+        self.assertEqual(self.server.evict_idle(now + 60), 1)
+        self.assertEqual(len(self.server.sessions), 0)
+
+        # Idle sessions are evicted when the server is full
+        sessions = [(await self.call(op='new'))['session'] for _ in range(3)]
+        self.server.sessions[sessions[0]].last_active -= 100
+        self.assertTrue((await self.call(op='new'))['ok'])
+        self.assertNotIn(sessions[0], self.server.sessions)
+
+    async def test_tcp(self):
+        self.server.max_sessions = 100
+        server = await self.server.start('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'{"op": "new"}\n')
+        await writer.drain()
+        self.assertTrue(json.loads(await reader.readline())['ok'])
+        writer.close()
+
+        report = await run_load('127.0.0.1', port, n_clients=8, n_games=2)
+        self.assertEqual(report.n_games, 16)
+        self.assertEqual(report.n_errors, 0)
+        self.assertGreater(len(report.latencies), 0)
+        self.assertLessEqual(report.percentile(50), report.percentile(99))
+        self.assertIn('p99', report.summary())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import unittest
+
+import numpy as np
+
+from game import Game
+from solver import NegamaxStrategy
+from solver import position
+from solver import Solver
+
+
+def reference_score(game: Game, token_id: int) -> int:
+    """Score of the position found by walking the full game tree without any pruning
+    """
+    moves = sum(game.heights)
+    # Lower than any score
+    best = -game.rows * game.cols
+    for col_n in range(game.cols):
+        if game.get_first_free_idx(col_n) == -1:
+            continue
+        with game.trial_move(col_n, token_id):
+            if game.winner == token_id:
+                score = (game.rows * game.cols + 1 - moves) // 2
+            elif game.check_draw():
+                score = 0
+            else:
+                score = -reference_score(game, 3 - token_id)
+        best = max(best, score)
+    return best
+
+
+def random_position(rng: np.random.Generator, n_moves: int) -> tuple[Game, int]:
+    """Play random moves until n_moves tokens are placed without a winner
+    """
+    while True:
+        game = Game()
+        token_id = 1
+        for _ in range(n_moves):
+            free = [col_n for col_n in range(game.cols) if game.heights[col_n] < game.rows]
+            game.place_token(rng.choice(free), token_id)
+            if game.winner:
+                break
+            token_id = 3 - token_id
+        if not game.winner:
+            return game, token_id
+
+
+class TestSolver(unittest.TestCase):
+
+    def setUp(self):
+        self.solver = Solver()
+
+    def test_immediate_win(self):
+        game = Game()
+        for col_n, token_id in [(2, 1), (6, 2), (2, 1), (6, 2), (2, 1), (5, 2)]:
+            game.place_token(col_n, token_id)
+        col_n, score = self.solver.best_move(*position(game, 1), depth=1)
+        self.assertEqual(col_n, 2)
+        self.assertEqual(score, (42 + 1 - 6) // 2)
+
+    def test_block(self):
+        game = Game()
+        for col_n, token_id in [(0, 1), (0, 2), (1, 1), (0, 2), (2, 1)]:
+            game.place_token(col_n, token_id)
+        col_n, _ = self.solver.best_move(*position(game, 2), depth=4)
+        self.assertEqual(col_n, 3)
+
+    def test_matches_reference(self):
+        rng = np.random.default_rng(0)
+        for _ in range(10):
+            game, token_id = random_position(rng, 33)
+            expected = reference_score(game, token_id)
+            col_n, score = Solver().best_move(*position(game, token_id))
+            self.assertEqual(score, expected)
+
+            with game.trial_move(col_n, token_id):
+                if game.winner != token_id and not game.check_draw():
+                    self.assertEqual(-reference_score(game, 3 - token_id), expected)
+
+    def test_budgets(self):
+        current, mask = position(Game(), 1)
+
+        self.assertEqual(self.solver.best_move(current, mask, depth=1), (3, 0))
+
+        # The first depth is always finished, even if the budget is used up
+        col_n, _ = self.solver.best_move(current, mask, nodes=1)
+        self.assertIn(col_n, range(7))
+        self.assertLess(self.solver.nodes, 512)
+
+        col_n, _ = self.solver.best_move(current, mask, time_budget=0.05)
+        self.assertIn(col_n, range(7))
+
+        game = Game()
+        game.board = np.ones((6, 7))
+        with self.assertRaises(ValueError):
+            self.solver.best_move(*position(game, 1))
+
+    def test_winning_cells_connect(self):
+        # The general winning cells match the unrolled ones of connect 4 and the lines of the game
+        rng = np.random.default_rng(0)
+        for rows, cols, connect in [(6, 7, 4), (7, 8, 4), (9, 9, 5), (5, 6, 3)]:
+            solver = Solver(rows, cols, connect=connect)
+            game = Game(rows, cols, connect)
+            for _ in range(30):
+                # Tokens are stacked from the bottom of every column
+                board = rng.choice([1, 2], size=(rows, cols))
+                board[np.arange(rows)[:, None] < rng.integers(0, rows + 1, size=cols)] = 0
+                game.board = board
+                current, mask = position(game, 1)
+                cells = Solver.winning_cells(solver, current, mask)
+                self.assertEqual(cells, solver.winning_cells(current, mask))
+                for row_n in range(rows):
+                    for col_n in range(cols):
+                        bit = game._cell_bit(row_n, col_n)
+                        wins = board[row_n, col_n] == 0 and any(
+                            (current | 1 << bit) & window == window for window in game.windows[bit]
+                        )
+                        self.assertEqual(bool(cells >> bit & 1), wins)
+
+    def test_strategy_shapes(self):
+        game = Game(9, 9, 5)
+        for col_n in range(4):
+            game.place_token(col_n, 1)
+        # Player 1 has 4 tokens in a row, player 2 has to block the fifth
+        strategy = NegamaxStrategy(depth=2)
+        self.assertEqual(strategy(game, 2), 4)
+        self.assertEqual(strategy.solver.connect, 5)
+
+    def test_strategy(self):
+        game = Game()
+        for col_n, token_id in [(0, 1), (0, 2), (1, 1), (0, 2), (2, 1)]:
+            game.place_token(col_n, token_id)
+        strategy = NegamaxStrategy(depth=4)
+        self.assertEqual(strategy(game, 2), 3)
+        self.assertEqual(game.make_move(strategy), (5, 3))
+        self.assertEqual(game.winner, 0)
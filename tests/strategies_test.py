@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import unittest
+
+import numpy as np
+
+from game import Game
+from solver import NegamaxStrategy
+from strategies import make_strategy
+from strategies import parse_spec
+from strategies import RandomStrategy
+
+
+class TestStrategies(unittest.TestCase):
+
+    def test_random_strategy(self):
+        game = Game()
+        board = np.ones((6, 7))
+        board[:, 6] = 0
+        game.board = board
+        strategy = RandomStrategy(seed=0)
+        self.assertEqual({strategy(game, 1) for _ in range(20)}, {6})
+
+        game = Game()
+        self.assertEqual({strategy(game, 1) for _ in range(200)}, set(range(7)))
+
+        # Same seed, same moves
+        self.assertEqual(
+            [RandomStrategy(seed=3)(game, 1) for _ in range(10)],
+            [RandomStrategy(seed=3)(game, 1) for _ in range(10)],
+        )
+
+    def test_make_strategy(self):
+        strategy = make_strategy('negamax', {'depth': 3}, seed=5)
+        self.assertIsInstance(strategy, NegamaxStrategy)
+        self.assertEqual(strategy.depth, 3)
+
+        game = Game()
+        strategy = make_strategy('random', seed=5)
+        self.assertIsInstance(strategy, RandomStrategy)
+        other = RandomStrategy(seed=5)
+        self.assertEqual([strategy(game, 1) for _ in range(10)], [other(game, 1) for _ in range(10)])
+
+        with self.assertRaises(ValueError):
+            make_strategy('unknown')
+
+    def test_parse_spec(self):
+        self.assertEqual(parse_spec('random'), ('random', {}))
+        self.assertEqual(
+            parse_spec('negamax:depth=6,time_budget=0.5'),
+            ('negamax', {'depth': 6, 'time_budget': 0.5}),
+        )
+        self.assertEqual(parse_spec('mcts:name=fast'), ('mcts', {'name': 'fast'}))
+        with self.assertRaises(ValueError):
+            parse_spec('negamax:depth')
@@ -6,6 +6,7 @@ from itertools import product
 import numpy as np
 
 import tools as tl
+from game import Game
 
 
 class TestCheckConseqNums(unittest.TestCase):
@@ -37,3 +38,58 @@ class TestCheckConseqNums(unittest.TestCase):
             ret = tl.check_conseq_nums(arr, 4)
             self.assertEqual(ret[0], win)
             self.assertEqual(ret[1], center_number if win else -1)
+
+
+class TestCheckWinners(unittest.TestCase):
+
+    def test_line_indices(self):
+        indices = tl.line_indices(6, 7, 4)
+        self.assertEqual(indices.shape, (69, 4))
+        self.assertEqual(len({tuple(sorted(line)) for line in indices}), 69)
+        self.assertIs(tl.line_indices(6, 7, 4), indices)
+        self.assertEqual(tl.line_indices(1, 1, 4).shape, (0, 4))
+
+    def test_cell_windows(self):
+        windows = tl.cell_windows(6, 7, 4)
+        self.assertEqual(len(windows), 7 * 7)
+        self.assertIs(tl.cell_windows(6, 7, 4), windows)
+        # Corner cells are in 3 lines, the padding bits on top of the columns in none
+        self.assertEqual(len(windows[0]), 3)
+        self.assertEqual(windows[6], ())
+        # The cells in the middle of the board are in up to 13 lines
+        self.assertEqual(max(map(len, windows)), 13)
+        self.assertEqual(len({window for cell in windows for window in cell}), 69)
+        for bit, cell in enumerate(windows):
+            for window in cell:
+                self.assertTrue(window >> bit & 1)
+                self.assertEqual(bin(window).count('1'), 4)
+        self.assertEqual(len({window for cell in tl.cell_windows(9, 9, 5) for window in cell}), len(tl.line_indices(9, 9, 5)))
+
+    def test_zobrist_tables(self):
+        tables, mirror_tables = tl.zobrist_tables(6, 7)
+        self.assertIs(tl.zobrist_tables(6, 7)[0], tables)
+        self.assertEqual([len(table) for table in tables + mirror_tables], [49] * 4)
+        numbers = [number for table in tables for number in table if number]
+        self.assertEqual(len(set(numbers)), 84)
+        self.assertTrue(all(0 < number < 1 << 64 for number in numbers))
+        # Bit 0 is the bottom cell of the first column, its mirror is the bottom cell of the last column
+        self.assertEqual(mirror_tables[0][0], tables[0][6 * 7])
+        self.assertEqual(mirror_tables[1][6 * 7 + 5], tables[1][5])
+
+    def test_correct_output(self):
+        boards = np.zeros((4, 6, 7), dtype=np.int8)
+        boards[1, 5, 2:6] = 2
+        boards[2, 1:5, 0] = 1
+        boards[3, [5, 4, 3, 2], [3, 4, 5, 6]] = 1
+        np.testing.assert_array_equal(tl.check_winners(boards), [0, 2, 1, 1])
+        self.assertEqual(tl.check_winners(np.zeros((0, 6, 7))).shape, (0,))
+
+    def test_output_for_game(self):
+        rng = np.random.default_rng(0)
+        boards = rng.choice(3, size=(500, 6, 7), p=[0.5, 0.25, 0.25])
+        winners = tl.check_winners(boards)
+        game = Game()
+        for board, winner in zip(boards, winners):
+            game.board = board
+            cells = [(row_n, col_n) for row_n in range(6) for col_n in range(7) if game.check_win(row_n, col_n)]
+            self.assertEqual(winner, max((board[cell] for cell in cells), default=0))
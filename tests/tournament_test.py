@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import unittest
+
+import numpy as np
+
+from tournament import Entrant
+from tournament import fit_ratings
+from tournament import parse_entrant
+from tournament import run_tournament
+from tournament import schedule
+
+
+class TestTournament(unittest.TestCase):
+
+    def test_parse_entrant(self):
+        self.assertEqual(parse_entrant('d4=negamax:depth=4'), Entrant('d4', ('negamax', {'depth': 4})))
+        self.assertEqual(parse_entrant('negamax:depth=4'), Entrant('negamax:depth=4', ('negamax', {'depth': 4})))
+        self.assertEqual(parse_entrant('random'), Entrant('random', ('random', {})))
+
+    def test_schedule(self):
+        matches = schedule(4, 10)
+        self.assertEqual(len(matches), 60)
+        self.assertEqual([match.game_n for match in matches], list(range(60)))
+        # Every entrant starts as many games as it plays second against every opponent
+        for a in range(4):
+            for b in range(4):
+                if a != b:
+                    self.assertEqual(sum(match[1:] == (a, b) for match in matches), 5)
+
+        matches = schedule(4, 3, mode='gauntlet')
+        self.assertEqual(len(matches), 9)
+        self.assertTrue(all(0 in (match.first, match.second) for match in matches))
+
+        with self.assertRaises(ValueError):
+            schedule(4, 2, mode='swiss')
+        with self.assertRaises(ValueError):
+            schedule(1, 2)
+
+    def test_fit_ratings(self):
+        # Equal results give equal ratings
+        games = np.array([[0, 10], [10, 0]])
+        ratings, intervals = fit_ratings(np.array([[0, 5], [5, 0]]), games)
+        np.testing.assert_allclose(ratings, 0, atol=1e-6)
+
+        # A 75% score is a difference of about 191 Elo points, the prior pulls it a little towards 0
+        ratings, intervals = fit_ratings(np.array([[0, 750], [250, 0]]), games * 100)
+        self.assertAlmostEqual(ratings[0] - ratings[1], 400 * np.log10(3), delta=1)
+        self.assertAlmostEqual(ratings.sum(), 0)
+        _, wide_intervals = fit_ratings(np.array([[0, 7.5], [2.5, 0]]), games)
+        self.assertTrue(np.all(wide_intervals > 5 * intervals))
+
+        # Ratings stay finite when an entrant wins every game, and are ordered by strength
+        scores = np.array([[0, 10, 10], [0, 0, 7], [0, 3, 0]])
+        ratings, intervals = fit_ratings(scores, 10 * (1 - np.eye(3)))
+        self.assertTrue(np.all(np.isfinite(ratings)) and np.all(np.isfinite(intervals)))
+        self.assertEqual(list(np.argsort(-ratings)), [0, 1, 2])
+
+    def test_run_tournament(self):
+        entrants = [parse_entrant('random'), parse_entrant('d2=negamax:depth=2'), parse_entrant('greedy')]
+        report = run_tournament(entrants, 6, seed=1, workers=1, chunk_size=4)
+        self.assertEqual(report.n_games, 18)
+        np.testing.assert_array_equal(report.wins + report.draws + report.losses, 6 * (1 - np.eye(3)))
+        np.testing.assert_array_equal(report.losses, report.wins.T)
+        self.assertEqual(report.wins[1, 0], 6)
+        self.assertGreater(report.ratings[1], report.ratings[0])
+        self.assertTrue(np.all(report.moves > 0))
+        self.assertTrue(np.all(report.max_times > 0))
+        self.assertTrue(np.all(report.max_times <= report.think_times))
+        summary = report.summary()
+        self.assertIn('d2', summary)
+        self.assertIn('6/0/0', summary)
+
+        # The results do not depend on the number of processes
+        parallel = run_tournament(entrants, 6, seed=1, workers=2)
+        np.testing.assert_array_equal(parallel.wins, report.wins)
+        np.testing.assert_array_equal(parallel.moves, report.moves)
+
+        gauntlet = run_tournament(entrants, 2, mode='gauntlet', workers=1)
+        self.assertEqual(gauntlet.n_games, 4)
+        self.assertEqual(gauntlet.wins[1:, 1:].sum() + gauntlet.draws[1:, 1:].sum(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,13 @@
 from __future__ import annotations
 
+from functools import lru_cache
+
 import numpy as np
 
+import metrics
+
 
+@metrics.timed('tools.check_conseq_nums')
 def check_conseq_nums(arr: np.ndarray, min_conseq: int) -> tuple[bool, int]:
     """Helper function to check whether there are min_conseq consequtive numbers in the array
 
@@ -22,3 +27,126 @@ def check_conseq_nums(arr: np.ndarray, min_conseq: int) -> tuple[bool, int]:
         if np.all(arr[i:i+min_conseq] == num):
             return True, num
     return False, -1
+
+
+@lru_cache(maxsize=None)
+def line_indices(rows: int, cols: int, length: int) -> np.ndarray:
+    """Helper function to get the flat indices of all the lines of length cells on a board
+    (horizontal, vertical and both diagonals), e.g. the 69 lines of 4 cells of the 6x7 board
+    The result is cached for every board size
+
+    Args:
+        rows (int): The number of rows of the board
+        cols (int): The number of columns of the board
+        length (int): The number of cells in a line
+
+    Returns:
+        np.ndarray: (n_lines, length) array of indices into the flattened board (read-only)
+    """
+    cells = np.arange(rows * cols).reshape(rows, cols)
+    steps = np.arange(length)
+    lines = []
+    for d_row, d_col in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        for row_n in range(rows):
+            for col_n in range(cols):
+                end_row = row_n + d_row * (length - 1)
+                end_col = col_n + d_col * (length - 1)
+                if 0 <= end_row < rows and 0 <= end_col < cols:
+                    lines.append(cells[row_n + d_row * steps, col_n + d_col * steps])
+    indices = np.array(lines, dtype=np.intp).reshape(-1, length)
+    indices.flags.writeable = False
+    return indices
+
+
+@lru_cache(maxsize=None)
+def cell_window_ids(rows: int, cols: int, length: int) -> tuple[tuple[int, ...], ...]:
+    """Helper function to get, for every cell, the numbers of the lines of length cells through it
+    (the rows of line_indices), indexed by the bit index of the cell in the bitboard layout of Game
+    The result is cached for every board size
+
+    Args:
+        rows (int): The number of rows of the board
+        cols (int): The number of columns of the board
+        length (int): The number of cells in a line
+
+    Returns:
+        tuple[tuple[int, ...], ...]: the line numbers of every bit index (empty for the unused bits)
+    """
+    col_bits = rows + 1
+    ids: list[list[int]] = [[] for _ in range(cols * col_bits)]
+    for line_n, line in enumerate(line_indices(rows, cols, length)):
+        for idx in line:
+            ids[int(idx) % cols * col_bits + rows - 1 - int(idx) // cols].append(line_n)
+    return tuple(map(tuple, ids))
+
+
+@lru_cache(maxsize=None)
+def cell_windows(rows: int, cols: int, length: int) -> tuple[tuple[int, ...], ...]:
+    """Helper function to get, for every cell, the bitmasks of the lines of length cells through it
+    The masks use the bitboard layout of Game (each column uses rows + 1 bits, bit 0 is the bottom
+    cell of the first column), e.g. a cell of the 6x7 board is in at most 13 lines of 4 cells
+    The result is cached for every board size
+
+    Args:
+        rows (int): The number of rows of the board
+        cols (int): The number of columns of the board
+        length (int): The number of cells in a line
+
+    Returns:
+        tuple[tuple[int, ...], ...]: the masks of the lines through every bit index (empty for the unused bits)
+    """
+    ids = cell_window_ids(rows, cols, length)
+    windows = [0] * len(line_indices(rows, cols, length))
+    for bit, line_ns in enumerate(ids):
+        for line_n in line_ns:
+            windows[line_n] |= 1 << bit
+    return tuple(tuple(windows[line_n] for line_n in line_ns) for line_ns in ids)
+
+
+@lru_cache(maxsize=None)
+def zobrist_tables(rows: int, cols: int) -> tuple[tuple[tuple[int, ...], ...], tuple[tuple[int, ...], ...]]:
+    """Helper function to get the random 64-bit numbers of the Zobrist keys of a board
+    The numbers come from a fixed seed, so keys are the same in every process and can be saved.
+    The mirror table gives every cell the number of the cell in the mirrored column, so the key
+    computed with it is the key of the left-right mirror of the board.
+    The result is cached for every board size
+
+    Args:
+        rows (int): The number of rows of the board
+        cols (int): The number of columns of the board
+
+    Returns:
+        tuple[tuple[tuple[int, ...], ...], tuple[tuple[int, ...], ...]]: the tables and the mirror tables
+            of both players, indexed by the bit index of the cell in the bitboard layout of Game
+    """
+    col_bits = rows + 1
+    rng = np.random.default_rng([rows, cols])
+    numbers = rng.integers(0, 1 << 64, size=(2, cols, col_bits), dtype=np.uint64, endpoint=False)
+    numbers[:, :, rows] = 0  # the padding bits on top of the columns are never set
+    tables = tuple(tuple(int(number) for number in player.ravel()) for player in numbers)
+    mirror_tables = tuple(tuple(int(number) for number in player[::-1].ravel()) for player in numbers)
+    return tables, mirror_tables
+
+
+def check_winners(boards: np.ndarray, min_conseq: int = 4) -> np.ndarray:
+    """Function to find the winner of many boards at once
+    Looks at all the lines of min_conseq cells of all the boards in one vectorized pass
+
+    Args:
+        boards (np.ndarray): (n_boards, rows, cols) array of boards (0 is empty)
+        min_conseq (int, optional): The number of consequtive tokens needed to win. Defaults to 4.
+
+    Returns:
+        np.ndarray: the token ID with min_conseq consequtive tokens for every board, 0 if there is none
+                    (if several players have a line the highest token ID is returned)
+    """
+    boards = np.asarray(boards)
+    n_boards, rows, cols = boards.shape
+    indices = line_indices(rows, cols, min_conseq)
+    if len(indices) == 0:
+        return np.zeros(n_boards, dtype=boards.dtype)
+
+    lines = boards.reshape(n_boards, rows * cols)[:, indices]
+    first = lines[:, :, 0]
+    complete = np.all(lines == first[:, :, None], axis=2)
+    return np.where(complete, first, 0).max(axis=1)
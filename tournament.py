@@ -0,0 +1,341 @@
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
+from typing import NamedTuple
+
+import numpy as np
+
+from game import Game
+from selfplay import play_game
+from selfplay import Spec
+from strategies import make_strategy
+from strategies import parse_spec
+
+MODES = ('round-robin', 'gauntlet')
+ELO_SCALE = 400 / math.log(10)  # Elo points per unit of the logistic model
+
+
+class Entrant(NamedTuple):
+    """Player of a tournament: a display name and the name and configuration of its strategy
+    """
+    name: str
+    spec: Spec
+
+
+class Match(NamedTuple):
+    """Game of a tournament between two entrants (indices into the list of entrants), first plays player 1
+    """
+    game_n: int
+    first: int
+    second: int
+
+
+class MatchResult(NamedTuple):
+    """Result of a match: the winner (0 for a draw), the number of moves and the think times of both players
+    (total and longest move, in seconds)
+    """
+    match: Match
+    winner: int
+    n_moves: int
+    think_times: tuple[float, float]
+    max_times: tuple[float, float]
+
+
+def parse_entrant(text: str) -> Entrant:
+    """Function to parse an entrant written as name=spec (e.g. d4=negamax:depth=4) or as a bare spec,
+    which is then also the name
+
+    Args:
+        text (str): The entrant
+
+    Returns:
+        Entrant: the entrant
+    """
+    name, sep, spec = text.partition('=')
+    if not sep or ':' in name:
+        name, spec = text, text
+    return Entrant(name.strip(), parse_spec(spec))
+
+
+def schedule(n_entrants: int, games_per_pair: int, mode: str = 'round-robin') -> list[Match]:
+    """Function to list the games of a tournament
+    Every pair plays games_per_pair games and the entrants swap colors from one game to the next,
+    so both start the same number of times when games_per_pair is even
+
+    Args:
+        n_entrants (int): The number of entrants
+        games_per_pair (int): The number of games between two entrants
+        mode (str, optional): 'round-robin' (every entrant plays every other one) or 'gauntlet'
+                              (entrant 0 plays every other one). Defaults to 'round-robin'.
+
+    Returns:
+        list[Match]: the games, numbered from 0
+    """
+    if mode not in MODES:
+        raise ValueError(f'Unknown mode {mode!r}, choose from {", ".join(MODES)}')
+    if n_entrants < 2:
+        raise ValueError('A tournament needs at least 2 entrants')
+    if mode == 'gauntlet':
+        pairs = [(0, other) for other in range(1, n_entrants)]
+    else:
+        pairs = [(a, b) for a in range(n_entrants) for b in range(a + 1, n_entrants)]
+    matches: list[Match] = []
+    for a, b in pairs:
+        for pair_game_n in range(games_per_pair):
+            first, second = (a, b) if pair_game_n % 2 == 0 else (b, a)
+            matches.append(Match(len(matches), first, second))
+    return matches
+
+
+class _TimedStrategy:
+    """Strategy wrapper keeping the duration of the longest move
+    """
+
+    def __init__(self, strategy: Callable[[Game, int], int]):
+        """Initialize the wrapper, no move has been timed yet
+
+        Args:
+            strategy (Callable[[Game, int], int]): The strategy to time
+        """
+        self.strategy = strategy
+        self.max_time = 0.0
+
+    def __call__(self, game: Game, token_id: int) -> int:
+        """Pick a column with the wrapped strategy and keep the duration of the move if it is the longest
+
+        Args:
+            game (Game): The game to play in
+            token_id (int): The token ID of the player to move
+
+        Returns:
+            int: the column to play
+        """
+        start = time.perf_counter()
+        col_n = self.strategy(game, token_id)
+        self.max_time = max(self.max_time, time.perf_counter() - start)
+        return col_n
+
+
+def play_matches(entrants: list[Entrant], seed: int, matches: list[Match]) -> list[MatchResult]:
+    """Function to play a list of matches, the strategies are created again for every game
+    Every game gets its own seeds derived from seed and the game number,
+    so results do not depend on how the games are split between processes
+
+    Args:
+        entrants (list[Entrant]): The entrants of the tournament
+        seed (int): The seed of the tournament
+        matches (list[Match]): The matches to play
+
+    Returns:
+        list[MatchResult]: the results of the matches
+    """
+    results = []
+    for match in matches:
+        seeds = np.random.SeedSequence([seed, match.game_n]).generate_state(2)
+        strategies = (
+            _TimedStrategy(make_strategy(*entrants[match.first].spec, seed=int(seeds[0]))),
+            _TimedStrategy(make_strategy(*entrants[match.second].spec, seed=int(seeds[1]))),
+        )
+        result = play_game(strategies)
+        results.append(MatchResult(
+            match, result.winner, len(result.moves), result.think_times,
+            (strategies[0].max_time, strategies[1].max_time),
+        ))
+    return results
+
+
+def fit_ratings(scores: np.ndarray, games: np.ndarray, prior_draws: float = 1.0) -> tuple[np.ndarray, np.ndarray]:
+    """Function to estimate Elo ratings from the results between all pairs of entrants
+    The ratings maximize the likelihood of the logistic (Bradley-Terry) model, a draw counting as half a win.
+    Every pair that played gets prior_draws extra draws, so an entrant that won every game still has a finite
+    rating. The confidence intervals come from the curvature of the likelihood at the maximum.
+
+    Args:
+        scores (np.ndarray): (n, n) array, scores[i, j] is the number of points of i against j (1 per win, 0.5 per draw)
+        games (np.ndarray): (n, n) symmetric array of the number of games between i and j
+        prior_draws (float, optional): The number of extra draws per pair. Defaults to 1.0.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: the ratings (their mean is 0) and the half-widths of their 95% confidence
+                                       intervals, in Elo points
+    """
+    games = np.asarray(games, dtype=np.float64)
+    played = games > 0
+    scores = np.asarray(scores, dtype=np.float64) + prior_draws / 2 * played
+    games = games + prior_draws * played
+    n = len(games)
+    ratings = np.zeros(n)
+    hessian = np.zeros((n, n))
+    for _ in range(100):
+        expected = 1 / (1 + np.exp(ratings[None, :] - ratings[:, None]))
+        gradient = (scores - games * expected).sum(axis=1)
+        weights = games * expected * (1 - expected)
+        hessian = np.diag(weights.sum(axis=1)) - weights
+        # The likelihood only depends on rating differences, the pseudo-inverse keeps the mean at 0
+        step = np.linalg.pinv(hessian) @ gradient
+        ratings += step
+        if np.abs(step).max() < 1e-9:
+            break
+    covariance = np.linalg.pinv(hessian)
+    intervals = 1.96 * np.sqrt(np.clip(np.diag(covariance), 0, None))
+    return ratings * ELO_SCALE, intervals * ELO_SCALE
+
+
+@dataclass
+class TournamentReport:
+    """Summary of a tournament
+    - wins, draws, losses: (n, n) arrays, wins[i, j] is the number of games i won against j
+    - think_times, moves: total think time in seconds and number of moves of every entrant
+    - max_times: duration of the longest move of every entrant in seconds
+    - ratings, intervals: Elo ratings (mean 0) and half-widths of their 95% confidence intervals
+    """
+    entrants: list[Entrant]
+    mode: str
+    n_games: int
+    elapsed: float
+    wins: np.ndarray
+    draws: np.ndarray
+    losses: np.ndarray
+    think_times: np.ndarray
+    moves: np.ndarray
+    max_times: np.ndarray
+    ratings: np.ndarray
+    intervals: np.ndarray
+
+    @property
+    def games_per_sec(self) -> float:
+        return self.n_games / self.elapsed if self.elapsed else float('inf')
+
+    @property
+    def ms_per_move(self) -> np.ndarray:
+        return 1000 * self.think_times / np.maximum(self.moves, 1)
+
+    def summary(self) -> str:
+        """Function to format the report for the terminal
+
+        Returns:
+            str: the ratings, then the W/D/L table (row against column)
+        """
+        names = [entrant.name for entrant in self.entrants]
+        width = max(max(map(len, names)), 8)
+        lines = [
+            f'{self.mode}, {self.n_games} games in {self.elapsed:.2f} s ({self.games_per_sec:.1f} games/s)',
+            '',
+            f'{"":2} {"name":<{width}} {"elo":>6} {"95% ci":>7} {"games":>6} {"score":>6} {"ms/move":>8} {"max ms":>8}',
+        ]
+        n_played = (self.wins + self.draws + self.losses).sum(axis=1)
+        points = (self.wins + self.draws / 2).sum(axis=1)
+        for rank, i in enumerate(np.argsort(-self.ratings), 1):
+            score = points[i] / n_played[i] if n_played[i] else 0.0
+            lines.append(
+                f'{rank:2d} {names[i]:<{width}} {self.ratings[i]:6.0f} {"±" + format(self.intervals[i], ".0f"):>7} '
+                f'{n_played[i]:6d} {100 * score:5.1f}% {self.ms_per_move[i]:8.2f} {1000 * self.max_times[i]:8.1f}'
+            )
+        cell = max(width, 11)
+        lines += ['', 'W/D/L of the row against the column', f'{"":<{width}} ' + ' '.join(f'{name:>{cell}}' for name in names)]
+        for i, name in enumerate(names):
+            cells = []
+            for j in range(len(names)):
+                played = self.wins[i, j] + self.draws[i, j] + self.losses[i, j]
+                text = f'{self.wins[i, j]}/{self.draws[i, j]}/{self.losses[i, j]}' if i != j and played else '-'
+                cells.append(f'{text:>{cell}}')
+            lines.append(f'{name:<{width}} ' + ' '.join(cells))
+        return '\n'.join(lines)
+
+
+def run_tournament(
+    entrants: list[Entrant], games_per_pair: int, mode: str = 'round-robin', seed: int = 0,
+    workers: int | None = None, chunk_size: int | None = None,
+) -> TournamentReport:
+    """Function to play a tournament between strategies across a process pool
+    The results only depend on the seed, not on the number of processes, unless a strategy has a time budget
+
+    Args:
+        entrants (list[Entrant]): The entrants, the first one plays every game of a gauntlet
+        games_per_pair (int): The number of games between two entrants, colors alternate
+        mode (str, optional): 'round-robin' or 'gauntlet'. Defaults to 'round-robin'.
+        seed (int, optional): The seed of the tournament. Defaults to 0.
+        workers (int | None, optional): The number of processes, 1 plays in this process.
+                                        Defaults to the number of CPUs.
+        chunk_size (int | None, optional): The number of games sent to a process at once.
+                                           Defaults to about 4 chunks per process.
+
+    Returns:
+        TournamentReport: the results and the ratings
+    """
+    matches = schedule(len(entrants), games_per_pair, mode)
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(1, min(256, len(matches) // (4 * workers)))
+    chunks = [matches[start:start + chunk_size] for start in range(0, len(matches), chunk_size)]
+
+    start = time.perf_counter()
+    if workers == 1:
+        results = [play_matches(entrants, seed, chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(play_matches, [entrants] * len(chunks), [seed] * len(chunks), chunks))
+    elapsed = time.perf_counter() - start
+
+    n = len(entrants)
+    wins = np.zeros((n, n), dtype=np.int64)
+    draws = np.zeros((n, n), dtype=np.int64)
+    think_times = np.zeros(n)
+    moves = np.zeros(n, dtype=np.int64)
+    max_times = np.zeros(n)
+    for result in (result for chunk_results in results for result in chunk_results):
+        players = (result.match.first, result.match.second)
+        if result.winner:
+            wins[players[result.winner - 1], players[2 - result.winner]] += 1
+        else:
+            draws[players[0], players[1]] += 1
+            draws[players[1], players[0]] += 1
+        for player_n, entrant_n in enumerate(players):
+            think_times[entrant_n] += result.think_times[player_n]
+            max_times[entrant_n] = max(max_times[entrant_n], result.max_times[player_n])
+        # Player 1 plays the extra move of the games with an odd number of moves
+        moves[players[0]] += (result.n_moves + 1) // 2
+        moves[players[1]] += result.n_moves // 2
+
+    losses = wins.T.copy()
+    ratings, intervals = fit_ratings(wins + draws / 2, wins + draws + losses)
+    return TournamentReport(
+        entrants=list(entrants),
+        mode=mode,
+        n_games=len(matches),
+        elapsed=elapsed,
+        wins=wins,
+        draws=draws,
+        losses=losses,
+        think_times=think_times,
+        moves=moves,
+        max_times=max_times,
+        ratings=ratings,
+        intervals=intervals,
+    )
+
+
+def main(argv: list[str] | None = None):
+    """Command line entry point, e.g. python3 tournament.py random greedy d2=negamax:depth=2 d4=negamax:depth=4
+    """
+    parser = argparse.ArgumentParser(description='Play a tournament between strategies and estimate their Elo ratings')
+    parser.add_argument('entrants', nargs='+', help='entrants written as name=spec or spec, e.g. d4=negamax:depth=4')
+    parser.add_argument('--games', type=int, default=100, help='number of games between two entrants')
+    parser.add_argument('--mode', choices=MODES, default='round-robin',
+                        help='round-robin, or gauntlet where the first entrant plays all the others')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the tournament')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all CPUs)')
+    args = parser.parse_args(argv)
+
+    entrants = [parse_entrant(text) for text in args.entrants]
+    report = run_tournament(entrants, args.games, mode=args.mode, seed=args.seed, workers=args.workers)
+    print(report.summary())
+
+
+if __name__ == '__main__':
+    main()